@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .querystats import install
+
+        # Cada conexión nueva registra sus consultas por huella y endpoint (api.querystats)
+        connection_created.connect(install)
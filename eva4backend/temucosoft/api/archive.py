@@ -0,0 +1,188 @@
+"""Archivo en frío de ventas y órdenes antiguas.
+
+`manage.py archive_sales --older-than DÍAS` recorre las ventas (con sus líneas) y
+las órdenes terminadas anteriores al corte en lotes: cada lote se escribe como
+JSONL gzip en `media/archive/`, se registra en `ArchiveBatch` y se borra de las
+tablas calientes en la misma transacción. Antes de borrar se suman sus totales a
+`SalesRollup`, `ProductSalesRollup` y `OrderRollup`, así los reportes históricos
+no necesitan las filas.
+
+Un registro archivado se lee con `find_archived()`: ubica los lotes cuyo rango de
+ids lo contiene y descomprime cada archivo hasta encontrarlo. Es lento a propósito;
+está pensado para consultas puntuales (reclamos, auditorías).
+"""
+import gzip
+import json
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from .models import ArchiveBatch, Order, OrderItem, OrderRollup, ProductSalesRollup, Sale, SaleItem, SalesRollup
+from .renderers import ORJSONRenderer
+
+# Solo se archivan órdenes que ya no pueden cambiar de estado
+FINAL_ORDER_STATUSES = tuple(status for status, allowed in Order.ALLOWED_TRANSITIONS.items() if not allowed)
+
+SALE_FIELDS = ['id', 'branch_id', 'branch__company_id', 'user_id', 'total', 'payment_method', 'notes', 'created_at']
+ORDER_FIELDS = [
+    'id', 'customer_name', 'customer_email', 'customer_phone', 'total', 'status',
+    'shipping_address', 'notes', 'created_at', 'updated_at',
+]
+
+
+def _day(column):
+    return f"({column} AT TIME ZONE %s)::date"
+
+
+def _rollup_sales(ids, before):
+    tz = settings.TIME_ZONE
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {SalesRollup._meta.db_table} (day, branch_id, payment_method, sales, total)
+            SELECT {_day('created_at')}, branch_id, payment_method, COUNT(*), SUM(total)
+            FROM {Sale._meta.db_table}
+            WHERE id = ANY(%s) AND created_at < %s
+            GROUP BY 1, 2, 3
+            ON CONFLICT (branch_id, day, payment_method) DO UPDATE
+            SET sales = {SalesRollup._meta.db_table}.sales + EXCLUDED.sales,
+                total = {SalesRollup._meta.db_table}.total + EXCLUDED.total
+            """,
+            [tz, ids, before],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {ProductSalesRollup._meta.db_table} (day, branch_id, product_id, quantity, revenue)
+            SELECT {_day('s.created_at')}, s.branch_id, i.product_id, SUM(i.quantity), SUM(i.quantity * i.price)
+            FROM {SaleItem._meta.db_table} AS i
+            JOIN {Sale._meta.db_table} AS s ON s.id = i.sale_id AND s.created_at = i.created_at
+            WHERE i.sale_id = ANY(%s) AND i.created_at < %s AND s.created_at < %s
+            GROUP BY 1, 2, 3
+            ON CONFLICT (branch_id, day, product_id) DO UPDATE
+            SET quantity = {ProductSalesRollup._meta.db_table}.quantity + EXCLUDED.quantity,
+                revenue = {ProductSalesRollup._meta.db_table}.revenue + EXCLUDED.revenue
+            """,
+            [tz, ids, before, before],
+        )
+
+
+def _rollup_orders(ids):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {OrderRollup._meta.db_table} (day, status, orders, total)
+            SELECT {_day('created_at')}, status, COUNT(*), SUM(total)
+            FROM {Order._meta.db_table}
+            WHERE id = ANY(%s)
+            GROUP BY 1, 2
+            ON CONFLICT (day, status) DO UPDATE
+            SET orders = {OrderRollup._meta.db_table}.orders + EXCLUDED.orders,
+                total = {OrderRollup._meta.db_table}.total + EXCLUDED.total
+            """,
+            [settings.TIME_ZONE, ids],
+        )
+
+
+def _save_batch(kind, records):
+    renderer = ORJSONRenderer()
+    lines = b"".join(renderer.render(record) + b"\n" for record in records)
+    content = gzip.compress(lines, compresslevel=9)
+    batch = ArchiveBatch(
+        kind=kind,
+        first_id=records[0]["id"],
+        last_id=records[-1]["id"],
+        date_from=min(record["created_at"] for record in records),
+        date_to=max(record["created_at"] for record in records),
+        rows=len(records),
+        size=len(content),
+    )
+    batch.file.save(f"{kind}-{batch.first_id}-{batch.last_id}.jsonl.gz", ContentFile(content), save=False)
+    try:
+        batch.save()
+    except Exception:
+        batch.file.delete(save=False)
+        raise
+    return batch
+
+
+def _lock(kind):
+    # Dos ejecuciones simultáneas no archivan el mismo lote
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('archive'), hashtext(%s))", [kind])
+
+
+def archive_sales_batch(before, batch_size=1000):
+    """Archiva las `batch_size` ventas más antiguas anteriores a `before`; devuelve el lote o None."""
+    with transaction.atomic():
+        _lock('sale')
+        sales = list(Sale.objects.filter(created_at__lt=before).order_by('id').values(*SALE_FIELDS)[:batch_size])
+        if not sales:
+            return None
+        ids = [sale["id"] for sale in sales]
+        items = {}
+        for item in (
+            SaleItem.objects.filter(sale_id__in=ids, created_at__lt=before).order_by('id')
+            .values('id', 'sale_id', 'product_id', 'quantity', 'price')
+        ):
+            items.setdefault(item.pop("sale_id"), []).append(item)
+        records = []
+        for sale in sales:
+            sale["company_id"] = sale.pop("branch__company_id")
+            sale["items"] = items.get(sale["id"], [])
+            records.append(sale)
+
+        batch = _save_batch('sale', records)
+        try:
+            _rollup_sales(ids, before)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {SaleItem._meta.db_table} WHERE sale_id = ANY(%s) AND created_at < %s", [ids, before]
+                )
+                cursor.execute(f"DELETE FROM {Sale._meta.db_table} WHERE id = ANY(%s) AND created_at < %s", [ids, before])
+        except Exception:
+            batch.file.delete(save=False)
+            raise
+    return batch
+
+
+def archive_orders_batch(before, batch_size=1000):
+    """Archiva las `batch_size` órdenes terminadas más antiguas anteriores a `before`; devuelve el lote o None."""
+    with transaction.atomic():
+        _lock('order')
+        orders = list(
+            Order.objects.filter(created_at__lt=before, status__in=FINAL_ORDER_STATUSES)
+            .order_by('id').values(*ORDER_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return None
+        ids = [order["id"] for order in orders]
+        items = {}
+        for item in OrderItem.objects.filter(order_id__in=ids).order_by('id').values('id', 'order_id', 'product_id', 'quantity', 'price'):
+            items.setdefault(item.pop("order_id"), []).append(item)
+        for order in orders:
+            order["items"] = items.get(order["id"], [])
+
+        batch = _save_batch('order', orders)
+        try:
+            _rollup_orders(ids)
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {OrderItem._meta.db_table} WHERE order_id = ANY(%s)", [ids])
+                cursor.execute(f"DELETE FROM {Order._meta.db_table} WHERE id = ANY(%s)", [ids])
+        except Exception:
+            batch.file.delete(save=False)
+            raise
+    return batch
+
+
+def find_archived(kind, record_id):
+    """Busca una venta u orden archivada por id; devuelve el dict guardado o None."""
+    batches = ArchiveBatch.objects.filter(kind=kind, first_id__lte=record_id, last_id__gte=record_id)
+    for batch in batches:
+        with batch.file.open('rb') as raw, gzip.open(raw, 'rt', encoding='utf-8') as lines:
+            for line in lines:
+                # Comparación barata antes de decodificar la línea completa
+                if not line.startswith(f'{{"id":{record_id},'):
+                    continue
+                return json.loads(line)
+    return None
@@ -0,0 +1,177 @@
+"""Registro de auditoría asíncrono y por lotes.
+
+Las rutas de escritura (ventas, compras, inventario, productos, órdenes) llaman a
+`record()`, que al hacer commit la transacción solo deja el evento en una cola
+en memoria. Un hilo de fondo por proceso los escribe en `AuditEvent` con
+`bulk_create` cada `AUDIT_FLUSH_INTERVAL` ms o cada `AUDIT_BATCH_SIZE` eventos,
+así el POS no paga un INSERT por solicitud.
+
+Si la cola (`AUDIT_QUEUE_SIZE`) se llena se aplica `AUDIT_OVERFLOW`:
+
+- ``sync``: el evento se escribe en la misma solicitud; no se pierde, pero esa solicitud paga la escritura.
+- ``block``: espera hasta `AUDIT_BLOCK_TIMEOUT` ms a que haya espacio y, si no, lo descarta.
+- ``drop``: lo descarta de inmediato.
+
+Los descartes se cuentan en `stats()`.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {"pid": None, "queue": None, "thread": None}
+_stats = {"enqueued": 0, "written": 0, "sync": 0, "dropped": 0, "batches": 0}
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+        return _stats[name]
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+    q = _state["queue"]
+    data["pending"] = q.qsize() if q is not None and _state["pid"] == os.getpid() else 0
+    return data
+
+
+def _writer_queue():
+    """Cola del proceso actual; tras un fork (gunicorn, run_workers) se crea una nueva con su propio hilo."""
+    pid = os.getpid()
+    with _lock:
+        if _state["pid"] != pid:
+            _state.update(pid=pid, queue=queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE), thread=None)
+        thread = _state["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_writer, args=(_state["queue"],), name="audit-writer", daemon=True)
+            _state["thread"] = thread
+            thread.start()
+        return _state["queue"]
+
+
+def _writer(q):
+    interval = settings.AUDIT_FLUSH_INTERVAL / 1000
+    while True:
+        batch = [q.get()]
+        deadline = time.monotonic() + interval
+        while len(batch) < settings.AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write(batch)
+        for _ in batch:
+            q.task_done()
+
+
+def _write(events):
+    try:
+        AuditEvent.objects.bulk_create([AuditEvent(**event) for event in events])
+    except Exception:
+        logger.exception("No se pudieron escribir %s eventos de auditoría", len(events))
+        _count("dropped", len(events))
+        # La conexión puede haber quedado inutilizable; el próximo lote abre otra
+        connection.close()
+    else:
+        _count("written", len(events))
+        _count("batches")
+
+
+def _enqueue(event):
+    if not settings.AUDIT_ASYNC:
+        _write([event])
+        return
+    q = _writer_queue()
+    overflow = settings.AUDIT_OVERFLOW
+    try:
+        if overflow == 'block':
+            q.put(event, timeout=settings.AUDIT_BLOCK_TIMEOUT / 1000)
+        else:
+            q.put_nowait(event)
+    except queue.Full:
+        if overflow == 'sync':
+            _count("sync")
+            _write([event])
+            return
+        dropped = _count("dropped")
+        if dropped % 1000 == 1:
+            logger.warning("Cola de auditoría llena: %s eventos descartados", dropped)
+        return
+    _count("enqueued")
+
+
+def record(action, entity, entity_id=None, user=None, company_id=None, **data):
+    """Registra un evento de auditoría cuando la transacción en curso hace commit.
+
+    `company_id` por defecto es la empresa de `user`; `data` debe ser serializable a JSON
+    (se aceptan `Decimal`, fechas y UUID).
+    """
+    if user is not None and not getattr(user, "is_authenticated", False):
+        user = None
+    event = {
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "user_id": getattr(user, "pk", None),
+        "company_id": company_id if company_id is not None else getattr(user, "company_id", None),
+        "data": data,
+        "created_at": timezone.now(),
+    }
+    transaction.on_commit(lambda: _enqueue(event))
+
+
+def flush(timeout=5.0):
+    """Escribe en el hilo actual los eventos que siguen en la cola (fin de un worker, apagado).
+
+    Luego espera hasta `timeout` segundos a que el hilo de fondo termine el lote que
+    ya había sacado de la cola. Devuelve cuántos eventos escribió este hilo.
+    """
+    q = _state["queue"]
+    if q is None or _state["pid"] != os.getpid():
+        return 0
+    batch = []
+    while True:
+        try:
+            batch.append(q.get_nowait())
+        except queue.Empty:
+            break
+    for start in range(0, len(batch), settings.AUDIT_BATCH_SIZE):
+        _write(batch[start:start + settings.AUDIT_BATCH_SIZE])
+    for _ in batch:
+        q.task_done()
+    thread = _state["thread"]
+    if thread is not None and thread.is_alive():
+        # Igual que Queue.join(), pero con límite de tiempo
+        with q.all_tasks_done:
+            q.all_tasks_done.wait_for(lambda: not q.unfinished_tasks, timeout)
+    return len(batch)
+
+
+atexit.register(flush)
+
+
+def changes(instance, values):
+    """{campo: [antes, después]} de los `values` que difieren de `instance` (FK como id)."""
+    diff = {}
+    for field, new in values.items():
+        old = getattr(instance, field, None)
+        old, new = getattr(old, "pk", old), getattr(new, "pk", new)
+        if old != new:
+            diff[field] = [old, new]
+    return diff
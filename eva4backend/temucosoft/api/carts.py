@@ -0,0 +1,260 @@
+"""Carritos de compra: en Redis con persistencia diferida (write-behind), o directo en la base de datos.
+
+Si `CACHES['carts']` es Redis (`shared_cache()`), el carrito activo vive ahí como
+un JSON por usuario que ven todos los procesos. Cada cambio es una transacción
+WATCH/MULTI de Redis sobre la clave del carrito: si otro worker la modificó entre
+la lectura y la escritura, se reintenta con el valor nuevo, sin bloqueos en
+PostgreSQL. Los carritos modificados se agregan con SADD al conjunto `cart:dirty`;
+`manage.py flush_carts` los saca con SPOP y los escribe en `Cart`/`CartItem`, igual
+que un agregado cuando pasan `CART_FLUSH_INTERVAL` segundos desde la última
+persistencia.
+
+Con cualquier otro backend (el `DummyCache` por defecto, memcached, que no tiene
+WATCH ni conjuntos, o una cache local del proceso) no hay write-behind: cada
+agregado es un upsert en `CartItem` que suma la cantidad en la misma sentencia.
+
+Al hacer checkout se quitan del carrito solo los productos comprados: un agregado
+que llega durante el checkout no se pierde.
+"""
+import json
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+CACHE_ALIAS = 'carts'
+DIRTY_INDEX_KEY = "cart:dirty"
+FLUSH_BATCH = 100
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def shared_cache():
+    """True si los carritos viven en Redis con persistencia diferida."""
+    return isinstance(_cache(), RedisCache)
+
+
+def _redis():
+    # Cliente de redis-py del backend de Django: WATCH/MULTI y SADD/SPOP no están en la API de cache
+    return _cache()._cache.get_client(write=True)
+
+
+def _key(user_id):
+    return _cache().make_and_validate_key(f"cart:{user_id}")
+
+
+def _dirty_key():
+    return _cache().make_and_validate_key(DIRTY_INDEX_KEY)
+
+
+def _user_cart(user_id):
+    return Cart.objects.filter(user_id=user_id).order_by('id').first() or Cart.objects.create(user_id=user_id)
+
+
+def _load(user_id, lock=False, cart=None):
+    cart = cart or _user_cart(user_id)
+    items = cart.items.select_related('product').order_by('id')
+    if lock:
+        items = items.select_for_update(of=('self',))
+    return {
+        "cart": cart.id,
+        "items": {
+            str(item.product_id): {
+                "id": item.id,
+                "quantity": item.quantity,
+                "price": str(item.price),
+                "name": item.product.name,
+                "sku": item.product.sku,
+            }
+            for item in items
+        },
+        "dirty": False,
+        "flushed_at": time.time(),
+    }
+
+
+def _update(user_id, change, load=True):
+    """Aplica `change(state)` al carrito en Redis y guarda lo que devuelve.
+
+    `change` devuelve el estado nuevo, o None para borrar el carrito de la cache.
+    Si el carrito no está en cache se lee de la base de datos, salvo con
+    `load=False`: entonces no se hace nada y se devuelve None.
+    """
+    key = _key(user_id)
+
+    def apply(pipe):
+        raw = pipe.get(key)
+        if raw is None and not load:
+            return None
+        state = change(json.loads(raw) if raw is not None else _load(user_id))
+        pipe.multi()
+        if state is None:
+            pipe.delete(key)
+            return None
+        pipe.set(key, json.dumps(state), ex=settings.CART_CACHE_TIMEOUT)
+        if state["dirty"]:
+            pipe.sadd(_dirty_key(), user_id)
+        return state
+
+    return _redis().transaction(apply, key, value_from_callable=True)
+
+
+def load_cart(user, lock=False):
+    """Devuelve el estado del carrito del usuario.
+
+    Con `lock=True` y sin Redis, las filas de `CartItem` quedan bloqueadas hasta el
+    fin de la transacción en curso (checkout): un agregado de otro worker espera.
+    """
+    if not shared_cache():
+        return _load(user.pk, lock=lock)
+    client = _redis()
+    raw = client.get(_key(user.pk))
+    if raw is not None:
+        return json.loads(raw)
+    state = _load(user.pk)
+    # NX: si otro proceso ya lo cargó o lo modificó, su versión gana
+    if not client.set(_key(user.pk), json.dumps(state), ex=settings.CART_CACHE_TIMEOUT, nx=True):
+        return load_cart(user)
+    return state
+
+
+def add_item(user, product, quantity):
+    if not shared_cache():
+        return _add_item_db(user, product, quantity)
+
+    def change(state):
+        item = state["items"].setdefault(str(product.pk), {"id": None, "quantity": 0})
+        item["quantity"] += quantity
+        item.update(price=str(product.price), name=product.name, sku=product.sku)
+        state["dirty"] = True
+        if time.time() - state["flushed_at"] >= settings.CART_FLUSH_INTERVAL:
+            persist_cart(user.pk, state)
+        return state
+
+    return _update(user.pk, change)
+
+
+def _add_item_db(user, product, quantity):
+    cart = _user_cart(user.pk)
+    table = CartItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (cart_id, product_id, quantity, price, created_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (cart_id, product_id)
+            DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity, price = EXCLUDED.price
+            """,
+            [cart.id, product.pk, quantity, product.price, timezone.now()],
+        )
+    return _load(user.pk, cart=cart)
+
+
+def persist_cart(user_id, state):
+    """Escribe el carrito en `Cart`/`CartItem` con un upsert por lotes y lo marca como limpio.
+
+    El carrito se busca por usuario: si el checkout ya borró el que indica
+    `state["cart"]`, se crea uno nuevo.
+    """
+    product_ids = [int(pid) for pid in state["items"]]
+    with transaction.atomic():
+        cart = _user_cart(user_id)
+        state["cart"] = cart.id
+        CartItem.objects.filter(cart=cart).exclude(product_id__in=product_ids).delete()
+        items = [
+            CartItem(cart=cart, product_id=int(pid), quantity=data["quantity"], price=Decimal(data["price"]))
+            for pid, data in state["items"].items()
+        ]
+        if items:
+            CartItem.objects.bulk_create(
+                items,
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'price'],
+            )
+        for item in items:
+            state["items"][str(item.product_id)]["id"] = item.pk
+    state["dirty"] = False
+    state["flushed_at"] = time.time()
+    return state
+
+
+def flush_dirty_carts():
+    """Persiste los carritos marcados como modificados; devuelve cuántos se escribieron."""
+    if not shared_cache():
+        return 0
+
+    persisted = set()
+
+    def change(state):
+        if state["dirty"]:
+            persist_cart(user_id, state)
+            persisted.add(user_id)
+        return state
+
+    client = _redis()
+    while user_ids := client.spop(_dirty_key(), FLUSH_BATCH):
+        for user_id in map(int, user_ids):
+            # Si un checkout o vaciado posterior ya borró el carrito de la cache, no se escribe nada
+            _update(user_id, change, load=False)
+    return len(persisted)
+
+
+def clear_cart(user, checked_out=None):
+    """Vacía el carrito; con `checked_out` (el estado que se compró) quita solo esas cantidades."""
+    if checked_out is None:
+        if shared_cache():
+            _redis().delete(_key(user.pk))
+        Cart.objects.filter(user=user).delete()
+        return
+    if not shared_cache():
+        # Las filas siguen bloqueadas por load_cart(lock=True): nadie cambió su cantidad
+        CartItem.objects.filter(id__in=[item["id"] for item in checked_out["items"].values()]).delete()
+        return
+
+    def change(state):
+        for pid, item in checked_out["items"].items():
+            left = state["items"].get(pid, {"quantity": 0})["quantity"] - item["quantity"]
+            if left > 0:
+                state["items"][pid]["quantity"] = left
+            else:
+                state["items"].pop(pid, None)
+        if not state["items"]:
+            return None
+        state["dirty"] = True
+        return state
+
+    _update(user.pk, change, load=False)
+    Cart.objects.filter(user=user).delete()
+
+
+def cart_total(state):
+    return sum((Decimal(item["price"]) * item["quantity"] for item in state["items"].values()), Decimal('0'))
+
+
+def cart_representation(state):
+    """Mismo formato que `CartSerializer`."""
+    return {
+        "id": state["cart"],
+        "items": [
+            {
+                "id": item["id"],
+                "product": int(pid),
+                "product_name": item["name"],
+                "product_sku": item["sku"],
+                "quantity": item["quantity"],
+                "price": item["price"],
+                "subtotal": Decimal(item["price"]) * item["quantity"],
+            }
+            for pid, item in state["items"].items()
+        ],
+        "total": cart_total(state),
+    }
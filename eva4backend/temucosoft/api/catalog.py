@@ -0,0 +1,116 @@
+"""Snapshots comprimidos del catálogo por sucursal para el arranque en frío de un POS.
+
+Un snapshot es un JSON gzip con productos, precios y el inventario de la
+sucursal, más el `cursor` desde el cual seguir con `/api/changes/`. Su versión
+es el mayor `change_txid` de las filas que cubre (productos, inventario de la
+sucursal y eliminaciones), así que se regenera solo cuando algo cambió; el ETag
+es el hash del archivo, por lo que es un validador fuerte.
+"""
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .changes import INVENTORY_FIELDS, PRODUCT_FIELDS, snapshot_floor
+from .models import CatalogSnapshot, ChangeTombstone, Inventory, Product
+from .renderers import ORJSONRenderer
+
+
+def catalog_company_id(request):
+    """Empresa cuyo catálogo corresponde a la solicitud, o None para no filtrar.
+
+    El personal de una empresa ve solo sus productos; super_admin ve todos salvo que
+    pida `?company=`. Visitantes y clientes sin empresa ven la tienda indicada en
+    `?company=` o `ECOMMERCE_COMPANY_ID`.
+    """
+    user = request.user
+    requested = request.GET.get('company', '')
+    requested = int(requested) if requested.isdigit() else None
+    if getattr(user, "role", None) == "super_admin":
+        return requested
+    if getattr(user, "company_id", None) is not None:
+        return user.company_id
+    return requested or settings.ECOMMERCE_COMPANY_ID or None
+
+
+def catalog_version(branch):
+    """(versión actual, xmin actual) del catálogo de la sucursal; usa los índices de change_txid."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT GREATEST(
+                (SELECT MAX(change_txid) FROM {Product._meta.db_table} WHERE company_id = %s),
+                (SELECT MAX(change_txid) FROM {Inventory._meta.db_table} WHERE branch_id = %s),
+                (SELECT MAX(change_txid) FROM {ChangeTombstone._meta.db_table}
+                 WHERE (entity = 'product' AND company_id = %s) OR branch_id = %s),
+                0
+            ), pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+            """,
+            [branch.company_id, branch.id, branch.company_id, branch.id],
+        )
+        return cursor.fetchone()
+
+
+def is_current(snapshot, version, floor):
+    """Un snapshot sirve si nada se escribió después y no había transacciones en curso que lo cubrieran.
+
+    Si al generarlo quedaba alguna transacción abierta (`snapshot.floor <= version`),
+    pudo hacer commit después sin subir la versión; se regenera una vez que terminó.
+    """
+    if snapshot.version != version:
+        return False
+    return snapshot.floor > version or floor <= snapshot.floor
+
+
+def build_snapshot(branch):
+    floor = snapshot_floor()
+    version, _ = catalog_version(branch)
+    products = list(Product.objects.filter(company_id=branch.company_id).order_by('id').values(*PRODUCT_FIELDS))
+    inventory = list(
+        Inventory.objects.filter(branch_id=branch.id).order_by('id')
+        .values(*INVENTORY_FIELDS, available=F('stock') - F('reserved'))
+    )
+    payload = ORJSONRenderer().render({
+        "version": version,
+        "cursor": str(floor),
+        "company": branch.company_id,
+        "branch": branch.id,
+        "generated_at": timezone.now(),
+        "products": products,
+        "inventory": inventory,
+    })
+    content = gzip.compress(payload, compresslevel=6, mtime=0)
+
+    snapshot = CatalogSnapshot.objects.filter(branch=branch).first() or CatalogSnapshot(branch=branch)
+    old_file = snapshot.file.name if snapshot.file else None
+    snapshot.version = version
+    snapshot.floor = floor
+    snapshot.etag = hashlib.sha256(content).hexdigest()[:32]
+    snapshot.size = len(content)
+    snapshot.products = len(products)
+    snapshot.file.save(f"{branch.id}-{version}-{snapshot.etag[:8]}.json.gz", ContentFile(content), save=False)
+    snapshot.save()
+    if old_file and old_file != snapshot.file.name:
+        snapshot.file.storage.delete(old_file)
+    return snapshot
+
+
+def get_snapshot(branch):
+    """Devuelve el snapshot vigente de la sucursal, regenerándolo si el catálogo cambió."""
+    version, floor = catalog_version(branch)
+    snapshot = CatalogSnapshot.objects.filter(branch=branch).first()
+    if snapshot and is_current(snapshot, version, floor):
+        return snapshot
+    with transaction.atomic():
+        # Varios POS arrancando a la vez generan el archivo una sola vez
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('catalog_snapshot'), %s)", [branch.id])
+        snapshot = CatalogSnapshot.objects.filter(branch=branch).first()
+        version, floor = catalog_version(branch)
+        if snapshot and is_current(snapshot, version, floor):
+            return snapshot
+        return build_snapshot(branch)
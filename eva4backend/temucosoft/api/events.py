@@ -0,0 +1,244 @@
+"""Canal push de eventos de inventario y ventas (Server-Sent Events sobre ASGI).
+
+Los triggers de la migración 0019 hacen `pg_notify('temucosoft_events', ...)` al
+escribir `Inventory` o `Sale`, y PostgreSQL entrega la notificación solo si la
+transacción hace commit. Cada proceso ASGI mantiene una única conexión `LISTEN`
+(`EventHub`) y reparte cada evento en memoria a los navegadores suscritos a esa
+empresa/sucursal, así que los workers no necesitan otro bus entre ellos.
+
+El JWT no viaja en la URL (quedaría en los logs de acceso): `POST /api/stream/ticket/`,
+autenticado como cualquier otra vista, entrega un ticket firmado de un solo uso que
+vence a los `EVENT_STREAM_TICKET_TTL` segundos, y
+`GET /api/stream/?ticket=<ticket>[&branch=<id>]` responde `text/event-stream`
+con eventos `inventory` y `sale`. Si un cliente se atrasa o la conexión LISTEN se
+reinicia recibe un evento `resync`: debe ponerse al día con `/api/changes/`.
+Requiere un servidor ASGI (uvicorn); `runserver` con WSGI no sirve esta ruta.
+"""
+import asyncio
+import json
+import logging
+import secrets
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'temucosoft_events'
+STREAM_PATH = '/api/stream/'
+STREAM_ROLES = ('super_admin', 'admin_cliente', 'gerente', 'vendedor')
+TICKET_SALT = 'api.events.stream'
+
+
+class Subscription:
+    def __init__(self, company_id, branch_id):
+        self.company_id = company_id
+        self.branch_id = branch_id
+        self.queue = asyncio.Queue(maxsize=settings.EVENT_STREAM_QUEUE_SIZE)
+
+    def matches(self, event):
+        if event.get("type") == "resync":
+            return True
+        if self.company_id is not None and event.get("company") != self.company_id:
+            return False
+        return self.branch_id is None or event.get("branch") == self.branch_id
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente lento: se descartan sus pendientes y se le pide resincronizar
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "reason": "overflow"})
+
+
+class EventHub:
+    """Una conexión LISTEN por proceso, abierta mientras haya suscriptores."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.conn = None
+        self.loop = None
+        # Hay una conexión en curso o un reintento programado: nadie más debe abrir otra
+        self.connecting = False
+
+    def subscribe(self, company_id=None, branch_id=None):
+        sub = Subscription(company_id, branch_id)
+        self.subscribers.add(sub)
+        if self.conn is None and not self.connecting:
+            self.loop = asyncio.get_running_loop()
+            self.connecting = True
+            self.loop.create_task(self._listen())
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+        if not self.subscribers:
+            self._close()
+
+    @staticmethod
+    def _connect(database, params):
+        # Conexión psycopg2 propia y sin wrapper de Django: vive en el event loop, fuera de toda transacción
+        conn = database.connect(**params)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    async def _listen(self, resync=False):
+        """Abre la conexión LISTEN en un hilo aparte: connect() bloquea y no debe frenar el event loop."""
+        db = connections['default']
+        try:
+            conn = await self.loop.run_in_executor(None, self._connect, db.Database, db.get_connection_params())
+        except Exception:
+            logger.exception("No se pudo abrir la conexión LISTEN; se reintentará")
+            self.loop.call_later(settings.EVENT_STREAM_RECONNECT, self._reconnect)
+            return
+        self.connecting = False
+        if not self.subscribers:
+            conn.close()
+            return
+        self.conn = conn
+        self.loop.add_reader(conn.fileno(), self._on_readable)
+        if resync:
+            self.dispatch({"type": "resync", "reason": "reconnect"})
+
+    def _close(self):
+        if self.conn is not None:
+            self.loop.remove_reader(self.conn.fileno())
+            self.conn.close()
+            self.conn = None
+
+    def _reconnect(self):
+        if self.subscribers and self.conn is None:
+            self.loop.create_task(self._listen(resync=True))
+        else:
+            self.connecting = False
+
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except Exception:
+            logger.exception("Se perdió la conexión LISTEN")
+            self._close()
+            self.connecting = True
+            self.loop.call_later(settings.EVENT_STREAM_RECONNECT, self._reconnect)
+            return
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                logger.warning("Payload de %s inválido: %r", CHANNEL, notify.payload[:200])
+                continue
+            self.dispatch(event)
+
+    def dispatch(self, event):
+        for sub in list(self.subscribers):
+            if sub.matches(event):
+                sub.push(event)
+
+
+hub = EventHub()
+
+
+def issue_ticket(user):
+    """Ticket firmado para abrir el canal como `user`; vale una vez y por `EVENT_STREAM_TICKET_TTL` segundos."""
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(f"{user.pk}:{secrets.token_urlsafe(16)}")
+
+
+def _redeem(ticket):
+    """Usuario del ticket, o None si es inválido, venció o ya se usó."""
+    from .models import CustomUser
+
+    if not ticket:
+        return None
+    ttl = settings.EVENT_STREAM_TICKET_TTL
+    try:
+        user_id, nonce = signing.TimestampSigner(salt=TICKET_SALT).unsign(ticket, max_age=ttl).split(":", 1)
+        # add() es atómico en la cache compartida: solo el primer uso del ticket la escribe
+        if not caches['tickets'].add(f"stream-ticket:{nonce}", True, ttl + 1):
+            return None
+        return CustomUser.objects.filter(pk=user_id, is_active=True).first()
+    except (signing.BadSignature, ValueError):
+        return None
+    finally:
+        connections.close_all()
+
+
+async def _send_json(send, status, data):
+    body = json.dumps(data).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _format(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode()
+
+
+async def stream(scope, receive, send):
+    params = parse_qs(scope.get("query_string", b"").decode())
+    user = await sync_to_async(_redeem, thread_sensitive=False)(params.get("ticket", [None])[0])
+    if user is None:
+        return await _send_json(send, 401, {"detail": "Ticket inválido, vencido o ya usado; pide otro en /api/stream/ticket/"})
+    role = getattr(user, "role", None)
+    if role not in STREAM_ROLES:
+        return await _send_json(send, 403, {"detail": "No tienes permiso para este canal"})
+    branch = params.get("branch", [""])[0]
+    if branch and not branch.isdigit():
+        return await _send_json(send, 400, {"detail": "Sucursal inválida"})
+
+    company_id = None if role == "super_admin" else user.company_id
+    sub = hub.subscribe(company_id, int(branch) if branch else None)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+        while True:
+            getter = asyncio.ensure_future(sub.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected}, timeout=settings.EVENT_STREAM_HEARTBEAT, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
+                getter.cancel()
+                break
+            if getter in done:
+                chunk = _format(getter.result())
+            else:
+                getter.cancel()
+                chunk = b": ping\n\n"
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(sub)
+
+
+def with_event_stream(django_app):
+    """Envuelve la aplicación ASGI de Django y atiende `STREAM_PATH` sin pasar por las vistas síncronas."""
+    async def application(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == STREAM_PATH and scope["method"] == "GET":
+            return await stream(scope, receive, send)
+        return await django_app(scope, receive, send)
+    return application
@@ -0,0 +1,34 @@
+import django_filters
+
+from .models import AuditEvent, Inventory, Product
+
+
+class ProductFilter(django_filters.FilterSet):
+    """Filtros de catálogo; `margin` es la anotación de `profit_margin_expression`."""
+    margin_min = django_filters.NumberFilter(field_name='margin', lookup_expr='gte')
+    margin_max = django_filters.NumberFilter(field_name='margin', lookup_expr='lte')
+
+    class Meta:
+        model = Product
+        fields = ['category', 'supplier', 'is_active']
+
+
+class InventoryFilter(django_filters.FilterSet):
+    """Filtros de inventario; `valuation` es la anotación stock x costo."""
+    valuation_min = django_filters.NumberFilter(field_name='valuation', lookup_expr='gte')
+    valuation_max = django_filters.NumberFilter(field_name='valuation', lookup_expr='lte')
+    stock_max = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
+
+    class Meta:
+        model = Inventory
+        fields = ['branch', 'product']
+
+
+class AuditEventFilter(django_filters.FilterSet):
+    """Consulta de auditoría por entidad y rango de tiempo (índices company/entity/created_at)."""
+    since = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = AuditEvent
+        fields = ['company', 'entity', 'entity_id', 'action', 'user']
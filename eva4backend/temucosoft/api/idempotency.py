@@ -0,0 +1,72 @@
+"""Soporte del header `Idempotency-Key` para POST con efectos (ventas, órdenes, checkout).
+
+La primera solicitud con una clave se ejecuta y, si responde 2xx, su respuesta
+se guarda en `IdempotencyKey` por `IDEMPOTENCY_KEY_TTL` segundos. Los reintentos
+con la misma clave reciben esa respuesta sin volver a ejecutar la vista, así que
+no se descuenta stock dos veces. Los reintentos concurrentes se serializan con
+un advisory lock de PostgreSQL.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}:{request.path}:{body}".encode()).hexdigest()
+
+
+def _lock_id(user_id, key):
+    digest = hashlib.sha256(f"{user_id}:{key}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def idempotent(view_method):
+    """Decorador para `post`/`create` de vistas DRF autenticadas."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"detail": f"{HEADER} no puede superar 255 caracteres"}, status=400)
+
+        fingerprint = _fingerprint(request)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_lock_id(request.user.pk, key)])
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record and record.expires_at > timezone.now():
+                if record.fingerprint != fingerprint:
+                    return Response({"detail": f"{HEADER} ya fue usada con otra solicitud"}, status=422)
+                return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+            if record:
+                record.delete()
+
+            response = view_method(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    fingerprint=fingerprint,
+                    status_code=response.status_code,
+                    response=response.data,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return response
+    return wrapper
+
+
+def purge_expired_keys():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
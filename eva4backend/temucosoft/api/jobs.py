@@ -0,0 +1,186 @@
+"""Cola de trabajos en segundo plano respaldada por la tabla `Job`.
+
+Los workers (`manage.py run_workers`) toman trabajos con
+`SELECT ... FOR UPDATE SKIP LOCKED`, por lo que varios procesos pueden
+consumir la misma cola sin bloquearse entre sí ni ejecutar un trabajo dos veces.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import audit
+from .models import Branch, Inventory, Job, Sale
+from .renderers import ORJSONRenderer
+from .reports import filter_sales, sales_analytics, sales_report, stock_report
+from .stock import apply_count_sheet
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Registra `func(job)` como handler de los trabajos de tipo `kind`."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, user=None, max_attempts=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=user,
+        company_id=getattr(user, "company_id", None),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_job(worker_id):
+    """Toma el siguiente trabajo disponible y lo marca como `running`, o devuelve None."""
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'started_at'])
+    return job
+
+
+def run_job(job):
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Tipo de trabajo desconocido: {job.kind}")
+        job.result = handler(job)
+    except Exception:
+        logger.exception("Falló el trabajo %s (intento %s/%s)", job.id, job.attempts, job.max_attempts)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts and handler is not None:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'done'
+        job.progress = 100
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.save()
+    return job
+
+
+def requeue_stale_jobs():
+    """Devuelve a la cola los trabajos `running` de workers que murieron sin terminarlos."""
+    limit = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER)
+    return Job.objects.filter(status='running', started_at__lt=limit).update(status='queued', locked_by='')
+
+
+def work(worker_id=None, poll_interval=1.0, stop_event=None, once=False):
+    """Bucle de un worker: ejecuta trabajos hasta que se active `stop_event`.
+
+    Con `once=True` termina en cuanto la cola queda vacía. Un error de base de
+    datos (reinicio o failover de PostgreSQL) no mata al worker: se registra, se
+    espera con backoff de hasta `JOB_DB_ERROR_MAX_DELAY` segundos y se vuelve a
+    intentar con una conexión nueva.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    errors = 0
+    try:
+        while not (stop_event and stop_event.is_set()):
+            # Como al inicio de cada solicitud: descarta la conexión si quedó rota o superó CONN_MAX_AGE
+            close_old_connections()
+            try:
+                job = claim_job(worker_id)
+                if job is not None:
+                    run_job(job)
+            except DatabaseError:
+                errors += 1
+                delay = min(poll_interval * 2 ** errors, settings.JOB_DB_ERROR_MAX_DELAY)
+                logger.exception("Error de base de datos en el worker %s; se reintenta en %.0f s", worker_id, delay)
+                time.sleep(delay)
+                continue
+            errors = 0
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+    finally:
+        # Los procesos del pool terminan sin pasar por atexit
+        audit.flush()
+
+
+def save_json_artifact(job, data):
+    job.artifact.save(f"{job.kind}-{job.id}.json", ContentFile(ORJSONRenderer().render(data)), save=False)
+
+
+def _scoped(qs, job, company_path):
+    if job.payload.get("all_companies"):
+        return qs
+    return qs.filter(**{company_path: job.payload.get("company_id")})
+
+
+@job_handler('report.stock')
+def stock_report_job(job):
+    rows = stock_report(_scoped(Inventory.objects.all(), job, 'branch__company_id'))
+    save_json_artifact(job, rows)
+    return {"rows": len(rows)}
+
+
+@job_handler('report.sales')
+def sales_report_job(job):
+    params = job.payload.get("params", {})
+    sales = filter_sales(_scoped(Sale.objects.all(), job, 'branch__company_id'), **params)
+    data = sales_report(sales, limit=None)
+    save_json_artifact(job, data)
+    return {"rows": len(data["rows"]), "total": str(data["total"])}
+
+
+@job_handler('report.analytics')
+def analytics_report_job(job):
+    params = dict(job.payload.get("params", {}))
+    top = params.pop("top", 10)
+    sales = filter_sales(_scoped(Sale.objects.all(), job, 'branch__company_id'), **params)
+    save_json_artifact(job, sales_analytics(sales, top=top))
+    return {"top": top}
+
+
+@job_handler('inventory.adjust')
+def inventory_adjust_job(job):
+    params = job.payload["params"]
+    job.report_progress(10, "Aplicando planilla de conteo")
+    with transaction.atomic():
+        deltas = apply_count_sheet(params["branch"], [tuple(row) for row in params["counts"]])
+        audit.record(
+            'inventory.adjust', 'branch', params["branch"], user=job.created_by,
+            company_id=Branch.objects.filter(pk=params["branch"]).values_list('company_id', flat=True).first(),
+            deltas=[d for d in deltas if d["delta"]], job=job.id,
+        )
+    job.report_progress(90, "Guardando resultado")
+    save_json_artifact(job, deltas)
+    return {
+        "branch": params["branch"],
+        "updated": sum(1 for d in deltas if not d["created"]),
+        "created": sum(1 for d in deltas if d["created"]),
+    }
@@ -0,0 +1,238 @@
+"""Logging sin bloqueo: JSON estructurado, muestreo por solicitud y cola acotada.
+
+Los hilos de las solicitudes nunca escriben en stderr ni en `logs/django.log`:
+`AsyncHandler`, el único handler de `LOGGING`, solo deja el registro en una cola
+(`LOG_QUEUE_SIZE`) y un `QueueListener` por proceso lo formatea y escribe. Si la
+cola está llena el registro se descarta y se cuenta; `stats()` (y
+`/api/logs/stats/`) expone los contadores.
+
+`RequestLogMiddleware` asigna a cada solicitud un id (`X-Request-ID`; se respeta el
+que venga del proxy) y decide una sola vez si entra en la muestra
+(`LOG_SAMPLE_RATE`). En una solicitud fuera de la muestra se descartan los DEBUG e
+INFO, nunca WARNING o superior. Al terminar registra en `api.requests` método,
+ruta, estado y latencia; las solicitudes lentas (`LOG_SLOW_REQUEST_MS`) y los 5xx
+salen como WARNING, así siempre quedan. Cada línea JSON lleva el id de solicitud,
+la empresa (tenant) y el usuario.
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+request_logger = logging.getLogger('api.requests')
+
+_context = contextvars.ContextVar('log_context', default=None)
+_lock = threading.Lock()
+_state = {"pid": None, "queue": None, "listener": None}
+_stats = {"enqueued": 0, "dropped": 0, "sampled_out": 0}
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+# Atributos propios de LogRecord; lo demás viene de `extra=` y se agrega al JSON
+RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'company_id', 'user_id',
+}
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+    q = _state["queue"]
+    data["pending"] = q.qsize() if q is not None and _state["pid"] == os.getpid() else 0
+    data["capacity"] = settings.LOG_QUEUE_SIZE
+    data["sample_rate"] = settings.LOG_SAMPLE_RATE
+    return data
+
+
+def current_request():
+    """Solicitud que atiende este hilo o tarea (la fija RequestLogMiddleware), o None."""
+    context = _context.get()
+    return None if context is None else context["request"]
+
+
+def request_user(request):
+    """Usuario ya autenticado de la solicitud, sin forzar la consulta de sesión de un SimpleLazyObject."""
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        if user._wrapped is empty:
+            return None
+        user = user._wrapped
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return None
+    return user
+
+
+class SamplingFilter(logging.Filter):
+    """Descarta DEBUG/INFO de las solicitudes que quedaron fuera de la muestra."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        context = _context.get()
+        if context is None or context["sampled"]:
+            return True
+        _count("sampled_out")
+        return False
+
+
+class RequestContextFilter(logging.Filter):
+    """Agrega request_id, company_id y user_id de la solicitud en curso (corre en el hilo de la solicitud)."""
+
+    def filter(self, record):
+        context = _context.get()
+        if context is None:
+            return True
+        record.request_id = context["request_id"]
+        user = request_user(context["request"])
+        if user is not None:
+            record.company_id = getattr(user, 'company_id', None)
+            record.user_id = user.pk
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for key in ('request_id', 'company_id', 'user_id'):
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Al apagar la cola puede estar llena: se espera un poco en vez de fallar
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class AsyncHandler(QueueHandler):
+    """Encola el registro y vuelve; el listener del proceso escribe en stderr y, desde `file_level`, en `filename`."""
+
+    def __init__(self, filename=None, file_level='ERROR'):
+        super().__init__(None)
+        self.filename = filename
+        self.file_level = file_level
+        self._sinks = None
+
+    def sinks(self):
+        if self._sinks is None:
+            formatter = self.formatter or JSONFormatter()
+            console = logging.StreamHandler(sys.stderr)
+            console.setFormatter(formatter)
+            self._sinks = [console]
+            if self.filename:
+                log_file = logging.FileHandler(self.filename, encoding='utf-8', delay=True)
+                log_file.setLevel(self.file_level)
+                log_file.setFormatter(formatter)
+                self._sinks.append(log_file)
+        return self._sinks
+
+    def listener_queue(self):
+        """Cola del proceso actual; tras un fork (gunicorn) se crea otra con su propio listener."""
+        pid = os.getpid()
+        if _state["pid"] == pid:
+            return _state["queue"]
+        with _lock:
+            if _state["pid"] != pid:
+                q = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+                listener = _Listener(q, *self.sinks(), respect_handler_level=True)
+                listener.start()
+                _state.update(pid=pid, queue=q, listener=listener)
+            return _state["queue"]
+
+    def prepare(self, record):
+        # En el hilo de la solicitud solo se arma el mensaje; el JSON lo genera el listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or JSONFormatter()).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.listener_queue().put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+        else:
+            _count("enqueued")
+
+
+def flush():
+    """Detiene el listener del proceso después de escribir lo que quedaba en la cola."""
+    listener = _state["listener"]
+    if listener is None or _state["pid"] != os.getpid():
+        return
+    with contextlib.suppress(queue.Full):
+        listener.stop()
+
+
+atexit.register(flush)
+
+
+class RequestLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        context = {"request_id": request_id, "request": request, "sampled": random.random() < settings.LOG_SAMPLE_RATE}
+        token = _context.set(context)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            latency = (time.perf_counter() - start) * 1000
+            response['X-Request-ID'] = request_id
+            slow = latency >= settings.LOG_SLOW_REQUEST_MS
+            request_logger.log(
+                logging.WARNING if slow or response.status_code >= 500 else logging.INFO,
+                "%s %s %s %.1fms", request.method, request.path, response.status_code, latency,
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "latency_ms": round(latency, 1),
+                },
+            )
+            return response
+        finally:
+            _context.reset(token)
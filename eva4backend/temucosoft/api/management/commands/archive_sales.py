@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.archive import archive_orders_batch, archive_sales_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve a archivos comprimidos las ventas y órdenes terminadas más antiguas que --older-than días, "
+        "dejando sus totales en los rollups (ver api.archive). Las particiones que queden vacías se "
+        "eliminan con sale_partitions --detach-older-than."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='DÍAS', help="Antigüedad mínima en días")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Registros por archivo y transacción")
+        parser.add_argument('--skip-orders', action='store_true', help="Archiva solo ventas")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError("--older-than debe ser al menos 1 día")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size debe ser positivo")
+        before = timezone.now() - timedelta(days=options['older_than'])
+        steps = [('ventas', archive_sales_batch)]
+        if not options['skip_orders']:
+            steps.append(('órdenes', archive_orders_batch))
+
+        for label, archive_batch in steps:
+            total = size = 0
+            while True:
+                batch = archive_batch(before, options['batch_size'])
+                if batch is None:
+                    break
+                total += batch.rows
+                size += batch.size
+                self.stdout.write(f"  {batch.file.name}: {batch.rows} {label} ({batch.size} bytes)")
+                if batch.rows < options['batch_size']:
+                    break
+            self.stdout.write(self.style.SUCCESS(f"{total} {label} archivadas ({size} bytes comprimidos)"))
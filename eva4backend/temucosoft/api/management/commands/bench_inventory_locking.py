@@ -0,0 +1,99 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import Branch, Company, Inventory, Product
+from api.stock import InsufficientStock, StockConflict, decrement_stock, decrement_stock_locked
+
+
+def naive_sale(branch_id, product_id, quantity):
+    """Lectura-modificación-escritura sin control, como lo hacía SaleSerializer.create antes."""
+    inventory = Inventory.objects.get(branch_id=branch_id, product_id=product_id)
+    if inventory.stock < quantity:
+        raise InsufficientStock(product_id, inventory.stock)
+    inventory.stock -= quantity
+    inventory.save(update_fields=['stock'])
+
+
+STRATEGIES = {
+    "sin_control": naive_sale,
+    "optimista": decrement_stock,
+    "pesimista": decrement_stock_locked,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara rendimiento y actualizaciones perdidas de concurrencia optimista (version) "
+        "contra bloqueo pesimista (SELECT FOR UPDATE) con ventas paralelas del mismo SKU. "
+        "Crea una sucursal y un producto temporales y los elimina al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--sales', type=int, default=50, help="Ventas por hilo")
+        parser.add_argument('--think', type=float, default=0.0, help="Milisegundos de trabajo simulado por venta dentro de la transacción")
+        parser.add_argument('--strategy', choices=list(STRATEGIES), action='append', help="Repetible; por defecto todas")
+
+    def handle(self, *args, **options):
+        threads, sales = options['threads'], options['sales']
+        company = Company.objects.order_by('id').first()
+        if company is None:
+            raise CommandError("Se necesita al menos una empresa para crear el producto de prueba")
+        branch = Branch.objects.create(name="Benchmark concurrencia", phone="+56900000000")
+        product = Product.objects.create(
+            company=company, sku=f"BENCH-{uuid.uuid4().hex[:12]}", name="Producto benchmark", category="Benchmark",
+            price=Decimal('1000'), cost=Decimal('500'),
+        )
+        try:
+            for name in options['strategy'] or list(STRATEGIES):
+                self.run(name, STRATEGIES[name], branch.id, product.id, threads, sales, options['think'] / 1000)
+        finally:
+            product.delete()
+            branch.delete()
+
+    def run(self, name, sale, branch_id, product_id, threads, sales, think):
+        initial = threads * sales
+        Inventory.objects.update_or_create(branch_id=branch_id, product_id=product_id, defaults={"stock": initial, "version": 1})
+        barrier = threading.Barrier(threads)
+        lock = threading.Lock()
+        counters = {"ok": 0, "conflict": 0}
+
+        def worker():
+            ok = conflict = 0
+            barrier.wait()
+            try:
+                for _ in range(sales):
+                    try:
+                        with transaction.atomic():
+                            if think:
+                                time.sleep(think)
+                            sale(branch_id, product_id, 1)
+                        ok += 1
+                    except StockConflict:
+                        conflict += 1
+            finally:
+                connection.close()
+            with lock:
+                counters["ok"] += ok
+                counters["conflict"] += conflict
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        final = Inventory.objects.get(branch_id=branch_id, product_id=product_id).stock
+        lost = final - (initial - counters["ok"])
+        self.stdout.write(
+            f"{name:12} {counters['ok'] / elapsed:8.1f} ventas/s  ok={counters['ok']:5d}  "
+            f"conflictos={counters['conflict']:4d}  perdidas={lost:4d} ({lost / max(counters['ok'], 1):.1%})  "
+            f"{elapsed:.2f}s"
+        )
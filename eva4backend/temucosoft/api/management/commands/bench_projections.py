@@ -0,0 +1,90 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Branch, Company, Inventory, Product, inventory_valuation_expression, profit_margin_expression
+from api.projections import compile_projection
+from api.renderers import ORJSONRenderer
+from api.serializers import InventorySerializer, ProductSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara objetos/segundo de ModelSerializer contra la proyección con values_list() "
+        "(api.projections) en los listados de productos e inventario, y verifica que el JSON sea idéntico. "
+        "Los datos de prueba se crean dentro de una transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help="Productos de prueba a crear")
+        parser.add_argument('--page', type=int, default=100, help="Filas por página")
+        parser.add_argument('--repeat', type=int, default=20, help="Páginas por medición")
+
+    def handle(self, *args, **options):
+        company = Company.objects.order_by('id').first()
+        if company is None:
+            raise CommandError("Se necesita al menos una empresa para crear los productos de prueba")
+        try:
+            with transaction.atomic():
+                self.seed(company, options['rows'])
+                self.compare("productos", ProductSerializer,
+                             Product.objects.filter(company=company).annotate(margin=profit_margin_expression()), options)
+                self.compare("inventario", InventorySerializer,
+                             Inventory.objects.filter(branch__company=company).select_related('branch', 'product')
+                             .annotate(valuation=inventory_valuation_expression()), options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, company, rows):
+        prefix = uuid.uuid4().hex[:8]
+        branch = Branch.objects.create(company=company, name="Benchmark proyecciones", phone="+56900000000")
+        products = Product.objects.bulk_create([
+            Product(
+                company=company, sku=f"BENCH-{prefix}-{i:06d}", name=f"Producto benchmark {i}",
+                description="Descripción de prueba con acentos: café, ñandú.", category="Benchmark",
+                price=Decimal(1000 + i % 900), cost=Decimal(500 + i % 400), is_active=i % 10 != 0,
+            )
+            for i in range(rows)
+        ])
+        Inventory.objects.bulk_create([
+            Inventory(branch=branch, product=product, stock=i % 50, reorder_point=10, reserved=i % 3)
+            for i, product in enumerate(products)
+        ])
+
+    def compare(self, name, serializer_class, queryset, options):
+        page, repeat = options['page'], options['repeat']
+        serializer = serializer_class(context={})
+        projection = compile_projection(serializer, queryset)
+        if projection is None:
+            raise CommandError(f"{serializer_class.__name__} no admite proyección con values_list()")
+
+        def serialized(offset):
+            return serializer_class(queryset.all()[offset:offset + page], many=True, context={}).data
+
+        def projected(offset):
+            return projection.rows(projection.values(queryset)[offset:offset + page])
+
+        renderer = ORJSONRenderer()
+        full = serializer_class(queryset.all(), many=True, context={}).data
+        if renderer.render(full) != renderer.render(projection.rows(projection.values(queryset))):
+            raise CommandError(f"{name}: el JSON de la proyección difiere del serializer")
+
+        timings = {}
+        for label, build in [("ModelSerializer", serialized), ("values_list", projected)]:
+            start = time.perf_counter()
+            for i in range(repeat):
+                build(i * page)
+            elapsed = time.perf_counter() - start
+            timings[label] = elapsed
+            self.stdout.write(f"{name:10} {label:15} {page * repeat / elapsed:10.0f} objetos/s")
+        self.stdout.write(self.style.SUCCESS(
+            f"{name:10} aceleración x{timings['ModelSerializer'] / timings['values_list']:.1f} (JSON idéntico)"
+        ))
@@ -0,0 +1,80 @@
+import random
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Product
+from api.renderers import ORJSONRenderer
+from api.serializers import ProductSerializer
+
+
+def product_page(size):
+    """Página de productos tal como la entrega ProductSerializer (sin tocar la base de datos)."""
+    now = timezone.now()
+    products = [
+        Product(
+            id=i,
+            sku=f"SKU-{i:06d}",
+            name=f"Producto de prueba {i}",
+            description="Descripción larga del producto con acentos: café, ñandú, pingüino. " * 3,
+            category=random.choice(["Abarrotes", "Bebidas", "Limpieza", "Electrónica"]),
+            price=Decimal(random.randint(500, 99999)) / 100,
+            cost=Decimal(random.randint(300, 50000)) / 100,
+            supplier_id=random.randint(1, 50),
+            is_active=True,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(1, size + 1)
+    ]
+    return {"count": size * 20, "next": None, "previous": None, "results": ProductSerializer(products, many=True).data}
+
+
+def sales_page(size):
+    """Filas de reporte de ventas con `Decimal` y `datetime` crudos, como las agregaciones."""
+    now = timezone.now()
+    rows = [
+        {
+            "branch": f"Sucursal {i % 7}",
+            "total": Decimal(random.randint(1000, 9999999)) / 100,
+            "payment_method": random.choice(["efectivo", "tarjeta_debito", "transferencia"]),
+            "created_at": now - timedelta(minutes=i),
+            "items": [
+                {"product": j, "quantity": random.randint(1, 5), "price": Decimal(random.randint(100, 50000)) / 100}
+                for j in range(random.randint(1, 8))
+            ],
+        }
+        for i in range(size)
+    ]
+    return {"total": sum(r["total"] for r in rows), "rows": rows}
+
+
+class Command(BaseCommand):
+    help = "Compara el tiempo de render de JSONRenderer (DRF) contra ORJSONRenderer sobre páginas típicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help="Filas por página")
+        parser.add_argument('--repeat', type=int, default=200, help="Renders por medición")
+
+    def handle(self, *args, **options):
+        random.seed(1)
+        size, repeat = options['size'], options['repeat']
+        payloads = {
+            "productos": product_page(size),
+            "ventas": sales_page(size),
+        }
+        renderers = [("JSONRenderer", JSONRenderer()), ("ORJSONRenderer", ORJSONRenderer())]
+
+        for name, data in payloads.items():
+            timings = {}
+            for label, renderer in renderers:
+                size_bytes = len(renderer.render(data))
+                best = min(timeit.repeat(lambda: renderer.render(data), number=repeat, repeat=3))
+                timings[label] = best / repeat
+                self.stdout.write(f"{name:10} {label:15} {timings[label] * 1e6:9.1f} us/página  {size_bytes:8d} bytes")
+            speedup = timings["JSONRenderer"] / timings["ORJSONRenderer"]
+            self.stdout.write(self.style.SUCCESS(f"{name:10} aceleración x{speedup:.1f}"))
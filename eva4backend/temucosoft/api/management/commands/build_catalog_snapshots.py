@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog import get_snapshot
+from api.models import Branch
+
+
+class Command(BaseCommand):
+    help = "Regenera los snapshots de catálogo de las sucursales cuyo catálogo cambió (ver api.catalog)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, action='append', help="Solo estas sucursales (repetible)")
+
+    def handle(self, *args, **options):
+        branches = Branch.objects.order_by('id')
+        if options['branch']:
+            branches = branches.filter(id__in=options['branch'])
+        for branch in branches:
+            snapshot = get_snapshot(branch)
+            self.stdout.write(
+                f"Sucursal {branch.id}: v{snapshot.version}, {snapshot.products} productos, {snapshot.size} bytes"
+            )
+        self.stdout.write(self.style.SUCCESS("Snapshots de catálogo al día"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.carts import flush_dirty_carts, shared_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Persiste en Cart/CartItem los carritos modificados que siguen en Redis. "
+        "Sin Redis en CACHES['carts'] los carritos ya se escriben directamente y no hay nada que hacer."
+    )
+
+    def handle(self, *args, **options):
+        if not shared_cache():
+            self.stdout.write("CACHES['carts'] no es Redis: los carritos se escriben directamente en Cart/CartItem")
+            return
+        flushed = flush_dirty_carts()
+        self.stdout.write(self.style.SUCCESS(f"{flushed} carritos persistidos"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api import querystats
+
+
+class Command(BaseCommand):
+    help = (
+        "Muestra las consultas con más tiempo de base de datos por huella SQL y endpoint "
+        "(acumulado de todos los procesos en QueryStat; ver api.querystats)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--order', choices=sorted(querystats.ORDERINGS), default='total')
+        parser.add_argument('--endpoint', help="Solo este nombre de URL ('-' para consultas fuera de solicitudes)")
+        parser.add_argument('--stacks', action='store_true', help="Incluye la pila de la ejecución más lenta")
+        parser.add_argument('--reset', action='store_true', help="Borra lo acumulado en vez de mostrarlo")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            querystats.reset()
+            self.stdout.write(self.style.SUCCESS("Estadísticas de consultas borradas"))
+            return
+
+        rows = querystats.top(options['top'], options['order'], options['endpoint'])
+        if not rows:
+            self.stdout.write("Sin datos todavía: los workers vuelcan cada QUERY_STATS_FLUSH_INTERVAL segundos")
+            return
+        self.stdout.write(f"{'total ms':>12} {'llamadas':>9} {'prom ms':>9} {'máx ms':>9}  endpoint / huella")
+        for row in rows:
+            self.stdout.write(
+                f"{row['total_ms']:12.1f} {row['calls']:9d} {row['avg_ms']:9.2f} {row['max_ms']:9.1f}  "
+                f"{row['endpoint']} {row['fingerprint']}"
+            )
+            self.stdout.write(f"    {row['sql'][:300]}")
+            if options['stacks'] and row['slow_stack']:
+                self.stdout.write(self.style.WARNING(f"    lenta ({row['slow_ms']:.1f} ms):"))
+                for frame in row['slow_stack'].splitlines():
+                    self.stdout.write(f"      {frame}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Libera en bloque las reservas de stock vencidas de los carritos (ver STOCK_RESERVATION_TTL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Reservas liberadas por sentencia")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired_reservations(batch_size=options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f"{total} reservas liberadas"))
@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import time
+from multiprocessing.connection import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import requeue_stale_jobs, work
+
+# Pausa antes de reemplazar un worker caído, para no girar en vacío si falla al arrancar
+RESTART_DELAY = 1
+
+
+def _worker_main(index, poll_interval, stop_event, once):
+    # El proceso padre maneja Ctrl+C y avisa a los hijos mediante stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    connections.close_all()
+    try:
+        work(poll_interval=poll_interval, stop_event=stop_event, once=once)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Ejecuta los workers de la cola de trabajos en segundo plano (tabla Job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKERS, help="Cantidad de procesos worker")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--once', action='store_true', help="Terminar cuando la cola quede vacía")
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Reencolados {requeued} trabajos abandonados")
+
+        # Las conexiones abiertas no deben compartirse con los procesos hijos
+        connections.close_all()
+        ctx = multiprocessing.get_context('fork')
+        stop_event = ctx.Event()
+
+        def spawn(i):
+            proc = ctx.Process(target=_worker_main, args=(i, options['poll_interval'], stop_event, options['once']), name=f"job-worker-{i}")
+            proc.start()
+            return proc
+
+        def stop(signum, frame):
+            self.stdout.write("Deteniendo workers...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        workers = [spawn(i) for i in range(processes)]
+        self.stdout.write(self.style.SUCCESS(f"{processes} workers iniciados"))
+        # El pool se mantiene completo: un worker que muere con error se reemplaza hasta que se pida detener
+        while True:
+            for i, proc in enumerate(workers):
+                if proc.exitcode not in (None, 0) and not stop_event.is_set():
+                    self.stderr.write(f"{proc.name} terminó con código {proc.exitcode}; se reinicia")
+                    time.sleep(RESTART_DELAY)
+                    workers[i] = spawn(i)
+            alive = [proc for proc in workers if proc.is_alive()]
+            if not alive:
+                break
+            wait([proc.sentinel for proc in alive])
+        self.stdout.write("Workers detenidos")
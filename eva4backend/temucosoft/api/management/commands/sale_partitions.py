@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.partitions import default_rows, detach_partitions, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Mantiene las particiones mensuales de ventas: crea los meses siguientes por adelantado "
+        "y separa o elimina los antiguos (ver api.partitions). Pensado para un cron diario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, help="Meses futuros a crear (por defecto SALE_PARTITIONS_AHEAD)")
+        parser.add_argument('--detach-older-than', type=int, metavar='MESES',
+                            help="Separa las particiones de más de MESES meses al esquema archive")
+        parser.add_argument('--drop', action='store_true', help="Con --detach-older-than, elimina en vez de archivar")
+
+    def handle(self, *args, **options):
+        if options['drop'] and options['detach_older_than'] is None:
+            raise CommandError("--drop requiere --detach-older-than")
+        if options['detach_older_than'] is not None and options['detach_older_than'] < 1:
+            raise CommandError("--detach-older-than debe ser al menos 1 (el mes actual no se separa)")
+
+        for name, moved in ensure_partitions(options['ahead']):
+            suffix = f" ({moved} filas movidas desde default)" if moved else ""
+            self.stdout.write(f"Creada {name}{suffix}")
+
+        if options['detach_older_than'] is not None:
+            for name in detach_partitions(options['detach_older_than'], drop=options['drop']):
+                self.stdout.write(f"{'Eliminada' if options['drop'] else 'Archivada'} {name}")
+
+        for table, count in default_rows().items():
+            if count:
+                self.stdout.write(self.style.WARNING(
+                    f"{table}_default tiene {count} filas sin partición mensual; revise sus fechas"
+                ))
+        self.stdout.write(self.style.SUCCESS("Particiones de ventas al día"))
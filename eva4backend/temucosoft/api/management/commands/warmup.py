@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "Ejecuta el precalentamiento de arranque (el mismo de gunicorn.conf.py) y muestra cuánto tarda cada paso."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-catalog', action='store_true', help="No regenerar los snapshots de catálogo")
+
+    def handle(self, *args, **options):
+        timings = warm_up(catalog=False if options['skip_catalog'] else None)
+        for name, ms, detail in timings:
+            self.stdout.write(f"{name:<12} {ms:>9.1f} ms  {detail}")
+        self.stdout.write(self.style.SUCCESS(f"Total {sum(ms for _, ms, _ in timings):.1f} ms"))
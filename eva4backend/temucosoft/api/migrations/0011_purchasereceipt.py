@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_purchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(blank=True, help_text='N° de factura o guía del proveedor', max_length=50)),
+                ('date', models.DateField(default=django.utils.timezone.localdate)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='api.branch')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipts', to=settings.AUTH_USER_MODEL)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='api.supplier')),
+            ],
+            options={
+                'verbose_name_plural': 'Recepciones de Compra',
+                'ordering': ['-date', '-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='api.purchasereceipt'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:49
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_purchasereceipt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['branch', 'stock'], name='inventory_branch_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.comparison.Coalesce(models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '-', models.F('cost')), '*', models.Value(100)), '/', django.db.models.functions.comparison.NullIf(models.F('cost'), models.Value(0))), output_field=models.DecimalField(decimal_places=2, max_digits=12)), models.Value(0), output_field=models.DecimalField(decimal_places=2, max_digits=12)), name='product_margin_idx'),
+        ),
+    ]
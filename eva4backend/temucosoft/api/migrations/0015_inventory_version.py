@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Se incrementa en cada escritura (concurrencia optimista / If-Match)'),
+        ),
+    ]
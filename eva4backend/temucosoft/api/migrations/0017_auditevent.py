@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:06
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(help_text='Ej: sale.create, inventory.update, product.update', max_length=50)),
+                ('entity', models.CharField(help_text='Ej: sale, inventory, product, purchase', max_length=30)),
+                ('entity_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Momento del cambio, no de la escritura del lote')),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_events', to='api.company')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['company', 'entity', '-created_at'], name='audit_company_entity_idx'), models.Index(fields=['entity', 'entity_id', '-created_at'], name='audit_entity_idx')],
+            },
+        ),
+    ]
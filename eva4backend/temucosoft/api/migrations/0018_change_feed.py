@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Todas las rutas de escritura (ORM, UPDATE ... FROM (VALUES ...), upserts de api.stock) pasan por estos
+# triggers, así el feed de /api/changes/ no depende de que cada una recuerde marcar la fila.
+TRIGGERS_SQL = """
+CREATE FUNCTION api_set_change_txid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION api_change_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO api_changetombstone (entity, entity_id, branch_id, change_txid, deleted_at)
+    VALUES (TG_ARGV[0], OLD.id, (to_jsonb(OLD) ->> 'branch_id')::bigint, pg_current_xact_id()::text::bigint, NOW());
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_product_change_txid BEFORE INSERT OR UPDATE ON api_product
+    FOR EACH ROW EXECUTE FUNCTION api_set_change_txid();
+CREATE TRIGGER api_inventory_change_txid BEFORE INSERT OR UPDATE ON api_inventory
+    FOR EACH ROW EXECUTE FUNCTION api_set_change_txid();
+CREATE TRIGGER api_product_tombstone AFTER DELETE ON api_product
+    FOR EACH ROW EXECUTE FUNCTION api_change_tombstone('product');
+CREATE TRIGGER api_inventory_tombstone AFTER DELETE ON api_inventory
+    FOR EACH ROW EXECUTE FUNCTION api_change_tombstone('inventory');
+"""
+
+DROP_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS api_product_change_txid ON api_product;
+DROP TRIGGER IF EXISTS api_inventory_change_txid ON api_inventory;
+DROP TRIGGER IF EXISTS api_product_tombstone ON api_product;
+DROP TRIGGER IF EXISTS api_inventory_tombstone ON api_inventory;
+DROP FUNCTION IF EXISTS api_set_change_txid();
+DROP FUNCTION IF EXISTS api_change_tombstone();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_auditevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=20)),
+                ('entity_id', models.BigIntegerField()),
+                ('branch_id', models.BigIntegerField(blank=True, help_text='Sucursal del inventario eliminado', null=True)),
+                ('change_txid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='change_txid',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Transacción de la última escritura (trigger; ver api.changes)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='change_txid',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Transacción de la última escritura (trigger; ver api.changes)'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['change_txid', 'id'], name='inventory_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['change_txid', 'id'], name='product_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changetombstone',
+            index=models.Index(fields=['change_txid', 'id'], name='tombstone_change_idx'),
+        ),
+        migrations.RunSQL(TRIGGERS_SQL, DROP_TRIGGERS_SQL),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# NOTIFY es transaccional: el evento llega a los LISTEN de api.events solo si la transacción hace commit.
+# Los triggers de inventario son por sentencia y agrupan por sucursal, así una planilla de conteo de
+# miles de filas produce un evento por sucursal (con hasta 50 filas; `count` indica el total).
+TRIGGERS_SQL = """
+CREATE FUNCTION api_notify_inventory() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('temucosoft_events', json_build_object(
+        'type', 'inventory',
+        'company', b.company_id,
+        'branch', changed.branch_id,
+        'count', changed.total,
+        'rows', changed.rows
+    )::text)
+    FROM (
+        SELECT branch_id, COUNT(*) AS total,
+               json_agg(json_build_object(
+                   'id', id, 'product', product_id, 'stock', stock, 'reserved', reserved, 'version', version
+               ) ORDER BY id) FILTER (WHERE rn <= 50) AS rows
+        FROM (SELECT *, row_number() OVER (PARTITION BY branch_id ORDER BY id) AS rn FROM new_rows) AS numbered
+        GROUP BY branch_id
+    ) AS changed
+    LEFT JOIN api_branch AS b ON b.id = changed.branch_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION api_notify_sale() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('temucosoft_events', json_build_object(
+        'type', 'sale',
+        'company', b.company_id,
+        'branch', s.branch_id,
+        'id', s.id,
+        'total', s.total::text,
+        'payment_method', s.payment_method,
+        'created_at', s.created_at
+    )::text)
+    FROM new_rows AS s
+    LEFT JOIN api_branch AS b ON b.id = s.branch_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_inventory_notify_insert AFTER INSERT ON api_inventory
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION api_notify_inventory();
+CREATE TRIGGER api_inventory_notify_update AFTER UPDATE ON api_inventory
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION api_notify_inventory();
+CREATE TRIGGER api_sale_notify AFTER INSERT ON api_sale
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION api_notify_sale();
+"""
+
+DROP_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS api_inventory_notify_insert ON api_inventory;
+DROP TRIGGER IF EXISTS api_inventory_notify_update ON api_inventory;
+DROP TRIGGER IF EXISTS api_sale_notify ON api_sale;
+DROP FUNCTION IF EXISTS api_notify_inventory();
+DROP FUNCTION IF EXISTS api_notify_sale();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunSQL(TRIGGERS_SQL, DROP_TRIGGERS_SQL),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_event_notify_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(help_text='Mayor change_txid incluido')),
+                ('floor', models.BigIntegerField(help_text='xmin del snapshot al generarlo; cursor inicial para /api/changes/')),
+                ('etag', models.CharField(max_length=64)),
+                ('file', models.FileField(upload_to='catalog/')),
+                ('size', models.PositiveIntegerField(default=0, help_text='Bytes comprimidos')),
+                ('products', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['branch', 'change_txid'], name='inventory_branch_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='catalogsnapshot',
+            name='branch',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_snapshot', to='api.branch'),
+        ),
+    ]
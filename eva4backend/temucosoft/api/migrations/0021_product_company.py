@@ -0,0 +1,145 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# El tombstone de un producto guarda su empresa para que /api/changes/ y los snapshots lo acoten al tenant
+TOMBSTONE_SQL = """
+CREATE OR REPLACE FUNCTION api_change_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO api_changetombstone (entity, entity_id, branch_id, company_id, change_txid, deleted_at)
+    VALUES (TG_ARGV[0], OLD.id, (to_jsonb(OLD) ->> 'branch_id')::bigint, (to_jsonb(OLD) ->> 'company_id')::bigint,
+            pg_current_xact_id()::text::bigint, NOW());
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_TOMBSTONE_SQL = """
+CREATE OR REPLACE FUNCTION api_change_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO api_changetombstone (entity, entity_id, branch_id, change_txid, deleted_at)
+    VALUES (TG_ARGV[0], OLD.id, (to_jsonb(OLD) ->> 'branch_id')::bigint, pg_current_xact_id()::text::bigint, NOW());
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Cada producto queda en la empresa cuyas sucursales tienen más stock de él; las demás reciben una copia
+ASSIGN_FROM_INVENTORY_SQL = """
+UPDATE api_product AS p SET company_id = owner.company_id
+FROM (
+    SELECT DISTINCT ON (i.product_id) i.product_id, b.company_id
+    FROM api_inventory AS i
+    JOIN api_branch AS b ON b.id = i.branch_id
+    WHERE b.company_id IS NOT NULL
+    GROUP BY i.product_id, b.company_id
+    ORDER BY i.product_id, SUM(i.stock) DESC, COUNT(*) DESC, b.company_id
+) AS owner
+WHERE p.id = owner.product_id AND p.company_id IS NULL
+"""
+
+
+def assign_companies(apps, schema_editor):
+    """Asigna los productos existentes; los que no tienen inventario van a la primera empresa cliente."""
+    Company = apps.get_model('api', 'Company')
+    Product = apps.get_model('api', 'Product')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(ASSIGN_FROM_INVENTORY_SQL)
+    orphans = Product.objects.filter(company__isnull=True)
+    if not orphans.exists():
+        return
+    company = (
+        Company.objects.filter(is_provider=False).order_by('id').first()
+        or Company.objects.order_by('id').first()
+        or Company.objects.create(name="Empresa principal", rut="", phone="")
+    )
+    orphans.update(company=company)
+
+
+def split_shared_products(apps, schema_editor):
+    """Copia el producto para cada otra empresa que lo tiene en inventario o compras.
+
+    La copia conserva el SKU (único por empresa desde esta migración) y pasan a
+    ella el inventario, las compras y recepciones, las ventas y los carritos de
+    esa empresa; las reservas siguen a su inventario. Así ninguna empresa queda
+    con filas que apuntan a un producto ajeno.
+    """
+    Product = apps.get_model('api', 'Product')
+    Inventory = apps.get_model('api', 'Inventory')
+    Purchase = apps.get_model('api', 'Purchase')
+    SaleItem = apps.get_model('api', 'SaleItem')
+    CartItem = apps.get_model('api', 'CartItem')
+    pairs = set()
+    for model in (Inventory, Purchase):
+        pairs.update(
+            model.objects.filter(branch__company__isnull=False)
+            .exclude(branch__company=models.F('product__company'))
+            .values_list('product_id', 'branch__company_id')
+        )
+    for product_id, company_id in sorted(pairs):
+        clone = Product.objects.get(pk=product_id)
+        clone.pk = None
+        clone.company_id = company_id
+        clone.save(force_insert=True)
+        Inventory.objects.filter(product_id=product_id, branch__company_id=company_id).update(product=clone)
+        Purchase.objects.filter(product_id=product_id, branch__company_id=company_id).update(product=clone)
+        SaleItem.objects.filter(product_id=product_id, sale__branch__company_id=company_id).update(product=clone)
+        CartItem.objects.filter(product_id=product_id, cart__user__company_id=company_id).update(product=clone)
+    # Las FK diferidas de las copias se validan ahora: el ALTER TABLE siguiente no admite eventos pendientes
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_catalogsnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_change_idx',
+        ),
+        migrations.AddField(
+            model_name='changetombstone',
+            name='company_id',
+            field=models.BigIntegerField(blank=True, help_text='Empresa del producto eliminado', null=True),
+        ),
+        migrations.RunSQL(TOMBSTONE_SQL, PREVIOUS_TOMBSTONE_SQL),
+        migrations.AddField(
+            model_name='product',
+            name='company',
+            field=models.ForeignKey(null=True, help_text='Empresa dueña del producto', on_delete=django.db.models.deletion.CASCADE, related_name='products', to='api.company'),
+        ),
+        # Antes de copiar productos: las copias repiten el SKU en otra empresa
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(help_text='Código de producto, único dentro de la empresa', max_length=50),
+        ),
+        migrations.RunPython(assign_companies, migrations.RunPython.noop),
+        migrations.RunPython(split_shared_products, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='company',
+            field=models.ForeignKey(help_text='Empresa dueña del producto', on_delete=django.db.models.deletion.CASCADE, related_name='products', to='api.company'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'name'], name='product_company_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'category'], name='product_company_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'change_txid', 'id'], name='product_company_change_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('company', 'sku'), name='product_company_sku_uniq'),
+        ),
+    ]
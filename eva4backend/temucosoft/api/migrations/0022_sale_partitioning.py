@@ -0,0 +1,162 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Meses creados por adelantado al migrar; después los mantiene `manage.py sale_partitions`
+MONTHS_AHEAD = 3
+
+
+def add_months(year, month, n):
+    index = year * 12 + month - 1 + n
+    return index // 12, index % 12 + 1
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=ZoneInfo(settings.TIME_ZONE))
+
+
+def partition_table(cursor, table, months):
+    """Reemplaza `table` por una tabla particionada por mes de created_at con los mismos datos.
+
+    Conserva nombres de índices, FK salientes y triggers (p. ej. el NOTIFY de api_sale),
+    y cambia la identidad de `id` por una secuencia: PostgreSQL 16 no admite columnas
+    IDENTITY en tablas particionadas.
+    """
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s",
+        [table, f"{table}_pkey"],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal", [table])
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    max_id = cursor.fetchone()[0]
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"SELECT last_value FROM {sequence}")
+        max_id = max(max_id, cursor.fetchone()[0])
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+    cursor.execute(
+        f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE (created_at)"
+    )
+    for year, month in months:
+        end_year, end_month = add_months(year, month, 1)
+        cursor.execute(
+            f"CREATE TABLE {table}_p{year:04d}{month:02d} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            [month_start(year, month), month_start(end_year, end_month)],
+        )
+    cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned")
+    cursor.execute(f"DROP TABLE {table}_unpartitioned")
+
+    cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    cursor.execute(f"SELECT setval('{table}_id_seq', %s)", [max(max_id, 1)])
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    for definition in triggers:
+        cursor.execute(definition)
+
+
+def unpartition_table(cursor, table):
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s",
+        [table, f"{table}_pkey"],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal", [table])
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    max_id = cursor.fetchone()[0]
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+    cursor.execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING CONSTRAINTS)")
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+    cursor.execute(f"DROP TABLE {table}_partitioned CASCADE")
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {max_id + 1})")
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    for definition in triggers:
+        cursor.execute(definition)
+
+
+def partition_sales(apps, schema_editor):
+    Sale = apps.get_model('api', 'Sale')
+    SaleItem = apps.get_model('api', 'SaleItem')
+    tz = ZoneInfo(settings.TIME_ZONE)
+    now = datetime.now(tz)
+    first = Sale.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    first = first.astimezone(tz) if first else now
+    months = [(first.year, first.month)]
+    while months[-1] < add_months(now.year, now.month, MONTHS_AHEAD):
+        months.append(add_months(*months[-1], 1))
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, Sale._meta.db_table, months)
+        partition_table(cursor, SaleItem._meta.db_table, months)
+
+
+def unpartition_sales(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        unpartition_table(cursor, apps.get_model('api', 'Sale')._meta.db_table)
+        unpartition_table(cursor, apps.get_model('api', 'SaleItem')._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_product_company'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='saleitem',
+            name='sale',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.sale'),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='created_at',
+            field=models.DateTimeField(editable=False, help_text='Fecha de la venta (clave de partición)', null=True),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE api_sale SET created_at = NOW() WHERE created_at IS NULL;
+            UPDATE api_saleitem AS i SET created_at = s.created_at FROM api_sale AS s WHERE s.id = i.sale_id;
+            """,
+            migrations.RunSQL.noop,
+        ),
+        # created_at es la clave de partición: no puede ser nula
+        migrations.AlterField(
+            model_name='sale',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, help_text='Clave de partición de api_sale (ver api.partitions)'),
+        ),
+        migrations.AlterField(
+            model_name='saleitem',
+            name='created_at',
+            field=models.DateTimeField(editable=False, help_text='Fecha de la venta (clave de partición)'),
+        ),
+        migrations.RunPython(partition_sales, unpartition_sales),
+    ]
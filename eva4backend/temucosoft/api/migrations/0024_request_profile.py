@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_sales_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('cprofile', 'cProfile'), ('sample', 'Muestreo de pila')], max_length=10)),
+                ('trigger', models.CharField(choices=[('manual', 'Pedido con ?_profile='), ('slow', 'Solicitud lenta muestreada')], max_length=10)),
+                ('request_id', models.CharField(blank=True, max_length=64)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('query_string', models.TextField(blank=True)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('sql_count', models.PositiveIntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('queries', models.JSONField(blank=True, default=list, help_text='SQL ejecutado: sentencia, milisegundos y línea del proyecto que la originó')),
+                ('file', models.FileField(help_text='pstats (cprofile) o pilas colapsadas para flamegraph (sample)', upload_to='profiles/')),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.company')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
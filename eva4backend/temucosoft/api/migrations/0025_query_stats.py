@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=16)),
+                ('endpoint', models.CharField(help_text="Nombre de la URL de Django, o '-' fuera de una solicitud", max_length=200)),
+                ('sql', models.TextField(help_text='SQL normalizado: literales y parámetros como ?')),
+                ('calls', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('slow_ms', models.FloatField(default=0, help_text='Duración de la ejecución lenta cuya pila se guardó')),
+                ('slow_stack', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+                'indexes': [models.Index(fields=['-total_ms'], name='query_stat_total_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fingerprint', 'endpoint'), name='query_stat_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_ticket_cache_table(apps, schema_editor):
+    # Solo si CACHES['tickets'] usa la base de datos; con Redis no hace falta tabla
+    cache = caches['tickets']
+    if isinstance(cache, DatabaseCache):
+        call_command('createcachetable', cache._table, database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_query_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_ticket_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_ticket_cache'),
+    ]
+
+    operations = [
+        # La fila de cada sucursal se reescribe en cada regeneración: la fecha es de actualización, no de creación
+        migrations.RenameField(
+            model_name='catalogsnapshot',
+            old_name='created_at',
+            new_name='updated_at',
+        ),
+        migrations.AlterField(
+            model_name='catalogsnapshot',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Última regeneración'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, RegexValidator, EmailValidator
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.utils import timezone
 
 
@@ -46,6 +49,35 @@ def validate_rut(value):
         raise ValidationError(f"Dígito verificador inválido. Debería ser: {calculated_dv}")
 
 
+def profit_margin_expression():
+    """Margen (%) de `Product` calculado en SQL; equivale a `Product.profit_margin`."""
+    return Coalesce(
+        ExpressionWrapper(
+            (F('price') - F('cost')) * Value(100) / NullIf(F('cost'), Value(0)),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def stock_status(stock, reorder_point):
+    """Estado de stock para reportes; lo usa `Inventory.stock_status` y el reporte sobre `values_list()`."""
+    if stock == 0:
+        return "Agotado"
+    if stock <= reorder_point:
+        return "Stock Bajo"
+    return "OK"
+
+
+def inventory_valuation_expression(prefix=''):
+    """Valorización de inventario (stock x costo del producto) calculada en SQL."""
+    return ExpressionWrapper(
+        F(f'{prefix}stock') * F(f'{prefix}product__cost'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
 class Subscription(models.Model):
     PLAN_CHOICES = [
         ('basico', 'Básico'),
@@ -123,6 +155,14 @@ class Order(models.Model):
         ('delivered', 'Entregado'),
         ('cancelled', 'Cancelado'),
     ]
+    # Estados a los que puede pasar una orden desde cada estado
+    ALLOWED_TRANSITIONS = {
+        'pending': ('processing', 'cancelled'),
+        'processing': ('shipped', 'cancelled'),
+        'shipped': ('delivered',),
+        'delivered': (),
+        'cancelled': (),
+    }
     customer_name = models.CharField(max_length=255)
     customer_email = models.EmailField(validators=[EmailValidator()])
     customer_phone = models.CharField(max_length=20, validators=[RegexValidator(r'^\+?56\d{9}$')])
@@ -141,10 +181,12 @@ class Order(models.Model):
 
 
 class SaleItem(models.Model):
-    sale = models.ForeignKey('Sale', on_delete=models.CASCADE, related_name='items')
+    # Sin FK en la base: api_sale está particionada y su clave primaria es (id, created_at); ver api.partitions
+    sale = models.ForeignKey('Sale', on_delete=models.CASCADE, related_name='items', db_constraint=False)
     product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    created_at = models.DateTimeField(editable=False, help_text="Fecha de la venta (clave de partición)")
 
     class Meta:
         verbose_name_plural = "Detalles de Venta"
@@ -152,6 +194,11 @@ class SaleItem(models.Model):
     def __str__(self):
         return f"{self.product.name} x{self.quantity}"
 
+    def save(self, *args, **kwargs):
+        if self.created_at is None:
+            self.created_at = self.sale.created_at
+        super().save(*args, **kwargs)
+
     @property
     def subtotal(self):
         return self.quantity * self.price
@@ -170,7 +217,7 @@ class Sale(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS)
     notes = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, help_text="Clave de partición de api_sale (ver api.partitions)")
 
     class Meta:
         ordering = ['-created_at']
@@ -185,30 +232,39 @@ class Inventory(models.Model):
     stock = models.IntegerField(default=0, validators=[validate_stock_quantity])
     reorder_point = models.IntegerField(default=10, validators=[validate_stock_quantity], help_text="Cantidad mínima para disparar reorden")
     last_updated = models.DateTimeField(auto_now=True, null=True, blank=True)
+    version = models.PositiveIntegerField(default=1, help_text="Se incrementa en cada escritura (concurrencia optimista / If-Match)")
+    reserved = models.PositiveIntegerField(default=0, help_text="Unidades apartadas por carritos (suma de StockReservation)")
+    change_txid = models.BigIntegerField(default=0, editable=False, help_text="Transacción de la última escritura (trigger; ver api.changes)")
 
     class Meta:
         ordering = ['product__name']
         unique_together = ('branch', 'product')
         verbose_name_plural = "Inventarios"
+        indexes = [
+            models.Index(fields=['branch', 'stock'], name='inventory_branch_stock_idx'),
+            models.Index(fields=['change_txid', 'id'], name='inventory_change_idx'),
+            models.Index(fields=['branch', 'change_txid'], name='inventory_branch_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.branch.name}: {self.stock} unidades"
 
+    @property
+    def available(self):
+        return max(self.stock - self.reserved, 0)
+
     @property
     def needs_reorder(self):
         return self.stock <= self.reorder_point
 
     @property
     def stock_status(self):
-        if self.stock == 0:
-            return "Agotado"
-        if self.stock <= self.reorder_point:
-            return "Stock Bajo"
-        return "OK"
+        return stock_status(self.stock, self.reorder_point)
 
 
 class Product(models.Model):
-    sku = models.CharField(max_length=50, unique=True, help_text="Código de producto único")
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name='products', help_text="Empresa dueña del producto")
+    sku = models.CharField(max_length=50, help_text="Código de producto, único dentro de la empresa")
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     category = models.CharField(max_length=100)
@@ -218,9 +274,20 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
+    change_txid = models.BigIntegerField(default=0, editable=False, help_text="Transacción de la última escritura (trigger; ver api.changes)")
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'sku'], name='product_company_sku_uniq'),
+        ]
+        # Toda consulta de catálogo va acotada a una empresa: los índices empiezan por company
+        indexes = [
+            models.Index(profit_margin_expression(), name='product_margin_idx'),
+            models.Index(fields=['company', 'name'], name='product_company_name_idx'),
+            models.Index(fields=['company', 'category'], name='product_company_category_idx'),
+            models.Index(fields=['company', 'change_txid', 'id'], name='product_company_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.sku})"
@@ -232,7 +299,29 @@ class Product(models.Model):
         return 0
 
 
+class PurchaseReceipt(models.Model):
+    supplier = models.ForeignKey('Supplier', on_delete=models.PROTECT, related_name="receipts")
+    branch = models.ForeignKey('Branch', on_delete=models.PROTECT, related_name="receipts")
+    reference = models.CharField(max_length=50, blank=True, help_text="N° de factura o guía del proveedor")
+    date = models.DateField(default=timezone.localdate)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name="receipts")
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+
+    class Meta:
+        ordering = ["-date", "-created_at"]
+        verbose_name_plural = "Recepciones de Compra"
+
+    def __str__(self):
+        return f"Recepción {self.id} - {self.supplier.name} ({self.date})"
+
+    @property
+    def total(self):
+        return sum(line.quantity * line.cost for line in self.lines.all())
+
+
 class Purchase(models.Model):
+    receipt = models.ForeignKey('PurchaseReceipt', on_delete=models.CASCADE, null=True, blank=True, related_name="lines")
     supplier = models.ForeignKey('Supplier', on_delete=models.PROTECT, related_name="purchases")
     branch = models.ForeignKey('Branch', on_delete=models.PROTECT, related_name="purchases")
     product = models.ForeignKey("Product", on_delete=models.PROTECT, related_name="purchases")
@@ -327,3 +416,261 @@ class Company(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.rut})"
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'En ejecución'),
+        ('done', 'Terminado'),
+        ('failed', 'Fallido'),
+    ]
+    kind = models.CharField(max_length=50, help_text="Tipo de trabajo registrado en api.jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    artifact = models.FileField(upload_to='jobs/', null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Avance en porcentaje (0-100)")
+    progress_message = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    company = models.ForeignKey('Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_by = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Trabajos"
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='job_queued_idx', condition=models.Q(status='queued')),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.kind} ({self.status})"
+
+    def report_progress(self, progress, message=''):
+        """Actualiza el avance sin tocar el resto de la fila (lo llaman los handlers)."""
+        self.progress = max(0, min(int(progress), 100))
+        self.progress_message = message[:255]
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, progress_message=self.progress_message)
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255, help_text="Valor del header Idempotency-Key")
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 del método, ruta y cuerpo de la solicitud")
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} -> {self.status_code}"
+
+
+class StockReservation(models.Model):
+    """Unidades de un inventario apartadas por el carrito de un usuario hasta `expires_at`."""
+    user = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='stock_reservations')
+    inventory = models.ForeignKey('Inventory', on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'inventory')
+
+    def __str__(self):
+        return f"{self.user_id} reserva {self.quantity} de inventario {self.inventory_id}"
+
+
+class AuditEvent(models.Model):
+    """Cambio de stock, precio o venta registrado por `api.audit` (escritura diferida por lotes)."""
+    company = models.ForeignKey('Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_events')
+    user = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_events')
+    action = models.CharField(max_length=50, help_text="Ej: sale.create, inventory.update, product.update")
+    entity = models.CharField(max_length=30, help_text="Ej: sale, inventory, product, purchase")
+    entity_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, help_text="Momento del cambio, no de la escritura del lote")
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['company', 'entity', '-created_at'], name='audit_company_entity_idx'),
+            models.Index(fields=['entity', 'entity_id', '-created_at'], name='audit_entity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.entity}#{self.entity_id}"
+
+
+class ChangeTombstone(models.Model):
+    """Registro de un producto o inventario eliminado, para el feed de cambios (lo inserta un trigger)."""
+    entity = models.CharField(max_length=20)
+    entity_id = models.BigIntegerField()
+    branch_id = models.BigIntegerField(null=True, blank=True, help_text="Sucursal del inventario eliminado")
+    company_id = models.BigIntegerField(null=True, blank=True, help_text="Empresa del producto eliminado")
+    change_txid = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_txid', 'id'], name='tombstone_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity}#{self.entity_id} eliminado"
+
+
+class CatalogSnapshot(models.Model):
+    """Catálogo y stock de una sucursal en un único JSON comprimido para el arranque de un POS (ver api.catalog)."""
+    branch = models.OneToOneField('Branch', on_delete=models.CASCADE, related_name='catalog_snapshot')
+    version = models.BigIntegerField(help_text="Mayor change_txid incluido")
+    floor = models.BigIntegerField(help_text="xmin del snapshot al generarlo; cursor inicial para /api/changes/")
+    etag = models.CharField(max_length=64)
+    file = models.FileField(upload_to='catalog/')
+    size = models.PositiveIntegerField(default=0, help_text="Bytes comprimidos")
+    products = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Última regeneración")
+
+    def __str__(self):
+        return f"Catálogo sucursal {self.branch_id} v{self.version}"
+
+
+class ArchiveBatch(models.Model):
+    """Lote de ventas u órdenes antiguas movido a un archivo JSONL comprimido (ver api.archive)."""
+    KIND_CHOICES = [
+        ('sale', 'Ventas'),
+        ('order', 'Órdenes'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    date_from = models.DateTimeField()
+    date_to = models.DateTimeField()
+    rows = models.PositiveIntegerField()
+    file = models.FileField(upload_to='archive/')
+    size = models.PositiveIntegerField(default=0, help_text="Bytes comprimidos")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['kind', 'first_id']
+        indexes = [
+            models.Index(fields=['kind', 'first_id', 'last_id'], name='archive_batch_ids_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archivo de {self.get_kind_display().lower()} #{self.first_id}-{self.last_id}"
+
+
+class SalesRollup(models.Model):
+    """Totales diarios de las ventas archivadas, por sucursal y medio de pago."""
+    day = models.DateField()
+    branch = models.ForeignKey('Branch', on_delete=models.CASCADE, related_name='sales_rollups')
+    payment_method = models.CharField(max_length=20)
+    sales = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'day', 'payment_method'], name='sales_rollup_uniq'),
+        ]
+
+
+class ProductSalesRollup(models.Model):
+    """Unidades e ingresos diarios por producto de las ventas archivadas."""
+    day = models.DateField()
+    branch = models.ForeignKey('Branch', on_delete=models.CASCADE, related_name='product_rollups')
+    # Sin FK en la base: el histórico se conserva aunque el producto se elimine
+    product = models.ForeignKey('Product', on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'day', 'product'], name='product_rollup_uniq', nulls_distinct=False),
+        ]
+
+
+class OrderRollup(models.Model):
+    """Cantidad y total diarios de las órdenes archivadas, por estado."""
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='order_rollup_uniq'),
+        ]
+
+
+class RequestProfile(models.Model):
+    """Perfil de CPU y SQL de una solicitud, pedido por un super_admin o tomado de una solicitud lenta (ver api.profiling)."""
+    KIND_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Muestreo de pila'),
+    ]
+    TRIGGER_CHOICES = [
+        ('manual', 'Pedido con ?_profile='),
+        ('slow', 'Solicitud lenta muestreada'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    request_id = models.CharField(max_length=64, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    query_string = models.TextField(blank=True)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    queries = models.JSONField(default=list, blank=True, help_text="SQL ejecutado: sentencia, milisegundos y línea del proyecto que la originó")
+    file = models.FileField(upload_to='profiles/', help_text="pstats (cprofile) o pilas colapsadas para flamegraph (sample)")
+    size = models.PositiveIntegerField(default=0)
+    user = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    company = models.ForeignKey('Company', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"Perfil {self.kind} de {self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class QueryStat(models.Model):
+    """Tiempo de base de datos acumulado por forma de consulta (huella SQL) y endpoint (ver api.querystats)."""
+    fingerprint = models.CharField(max_length=16)
+    endpoint = models.CharField(max_length=200, help_text="Nombre de la URL de Django, o '-' fuera de una solicitud")
+    sql = models.TextField(help_text="SQL normalizado: literales y parámetros como ?")
+    calls = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    slow_ms = models.FloatField(default=0, help_text="Duración de la ejecución lenta cuya pila se guardó")
+    slow_stack = models.TextField(blank=True)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-total_ms']
+        constraints = [
+            models.UniqueConstraint(fields=['fingerprint', 'endpoint'], name='query_stat_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['-total_ms'], name='query_stat_total_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.fingerprint}: {self.calls} llamadas, {self.total_ms:.0f} ms"
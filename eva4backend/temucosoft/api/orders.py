@@ -0,0 +1,50 @@
+from django.db import connection
+
+from .models import Order
+
+
+def transition_orders(ids, status):
+    """Pasa las órdenes `ids` al estado `status` con un único `UPDATE`.
+
+    Solo se mueven las órdenes cuyo estado actual permite la transición según
+    `Order.ALLOWED_TRANSITIONS`; la validación va en el `WHERE`, así que una orden
+    modificada en paralelo no puede saltarse un estado.
+    Devuelve (ids movidos, lista de rechazos con el estado actual de cada orden).
+    """
+    ids = list(dict.fromkeys(ids))
+    sources = [source for source, targets in Order.ALLOWED_TRANSITIONS.items() if status in targets]
+    table = Order._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH requested (id, position) AS (
+                SELECT * FROM unnest(%s::bigint[]) WITH ORDINALITY
+            ),
+            moved AS (
+                UPDATE {table} AS o
+                SET status = %s, updated_at = NOW()
+                FROM requested
+                WHERE o.id = requested.id AND o.status = ANY(%s::varchar[])
+                RETURNING o.id
+            )
+            SELECT requested.id, moved.id IS NOT NULL, current.status
+            FROM requested
+            LEFT JOIN moved ON moved.id = requested.id
+            LEFT JOIN {table} AS current ON current.id = requested.id
+            ORDER BY requested.position
+            """,
+            [ids, status, sources],
+        )
+        rows = cursor.fetchall()
+
+    moved = [order_id for order_id, ok, _ in rows if ok]
+    rejected = [
+        {
+            "id": order_id,
+            "status": current,
+            "detail": "Orden no encontrada" if current is None else f"No se puede pasar de '{current}' a '{status}'",
+        }
+        for order_id, ok, current in rows
+        if not ok
+    ]
+    return moved, rejected
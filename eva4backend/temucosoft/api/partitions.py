@@ -0,0 +1,154 @@
+"""Particiones mensuales de `Sale` y `SaleItem` (PostgreSQL, RANGE por `created_at`).
+
+Desde la migración 0022 ambas tablas están particionadas por mes local
+(`TIME_ZONE`): `api_sale_p202610` guarda las ventas de octubre de 2026 y
+`SaleItem.created_at` copia la fecha de su venta, así una venta y sus líneas
+quedan siempre en el mismo mes. Las filas sin partición caen en `<tabla>_default`,
+que en operación normal está vacía.
+
+`manage.py sale_partitions` crea por adelantado los meses que vienen y separa
+(DETACH) los antiguos al esquema `archive`, o los elimina. Las consultas que
+filtran `created_at` por rango (ver `reports.filter_sales`) solo leen las
+particiones de ese rango.
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Sale, SaleItem
+
+TABLES = (Sale._meta.db_table, SaleItem._meta.db_table)
+ARCHIVE_SCHEMA = 'archive'
+
+
+def add_months(year, month, n):
+    index = year * 12 + month - 1 + n
+    return index // 12, index % 12 + 1
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=ZoneInfo(settings.TIME_ZONE))
+
+
+def current_month():
+    today = timezone.localdate()
+    return today.year, today.month
+
+
+def partition_name(table, year, month):
+    return f"{table}_p{year:04d}{month:02d}"
+
+
+def partitions(table):
+    """{(año, mes): nombre} de las particiones mensuales adjuntas a `table`."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits AS i JOIN pg_class AS c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f"{table}_p"
+    months = {}
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            months[(int(suffix[:4]), int(suffix[4:]))] = name
+    return months
+
+
+def create_partition(table, year, month):
+    """Crea y adjunta la partición del mes, moviendo antes las filas de ese mes que hubieran caído en default.
+
+    Se usa CREATE + ATTACH en vez de `PARTITION OF`: sobre la tabla padre ATTACH
+    toma SHARE UPDATE EXCLUSIVE, que no bloquea lecturas ni escrituras. En cambio
+    toma ACCESS EXCLUSIVE sobre la partición default, que recorre para verificar
+    que el DELETE anterior no le dejó filas del rango, y lo mantiene hasta el
+    commit: mientras tanto esperan las consultas que la leen (sin poda por fecha)
+    y las escrituras que caerían en ella. Es breve si el mes se crea antes de que empiece,
+    como hace `manage.py sale_partitions`, porque default no tiene filas que mover.
+    """
+    name = partition_name(table, year, month)
+    start, end = month_start(year, month), month_start(*add_months(year, month, 1))
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {quote(table + '_default')} WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {quote(name)} SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)", [start, end])
+    return name, moved
+
+
+def default_months(table):
+    """Meses (año, mes) con filas en la partición default de `table`."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT EXTRACT(YEAR FROM created_at AT TIME ZONE %s)::int, EXTRACT(MONTH FROM created_at AT TIME ZONE %s)::int "
+            f"FROM {connection.ops.quote_name(table + '_default')}",
+            [settings.TIME_ZONE, settings.TIME_ZONE],
+        )
+        return set(cursor.fetchall())
+
+
+def ensure_partitions(ahead=None):
+    """Crea las particiones que falten y devuelve [(nombre, filas movidas)].
+
+    Cubre el mes actual, los `ahead` siguientes y cualquier mes con filas en default
+    (p. ej. ventas cargadas con fecha antigua), que así vuelve a quedar vacía.
+    """
+    ahead = settings.SALE_PARTITIONS_AHEAD if ahead is None else ahead
+    year, month = current_month()
+    created = []
+    for table in TABLES:
+        existing = partitions(table)
+        targets = {add_months(year, month, n) for n in range(ahead + 1)} | default_months(table)
+        for target in sorted(targets):
+            if target not in existing:
+                created.append(create_partition(table, *target))
+    return created
+
+
+def detach_partitions(older_than, drop=False):
+    """Separa las particiones de meses anteriores a `older_than` meses atrás.
+
+    Sin `drop` quedan como tablas comunes en el esquema `archive` (consultables, fuera
+    de los planes de `Sale`); con `drop` se eliminan. Devuelve los nombres afectados.
+    """
+    cutoff = add_months(*current_month(), -older_than)
+    quote = connection.ops.quote_name
+    done = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not drop:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote(ARCHIVE_SCHEMA)}")
+        for table in TABLES:
+            for month, name in sorted(partitions(table).items()):
+                if month >= cutoff:
+                    continue
+                cursor.execute(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}")
+                if drop:
+                    cursor.execute(f"DROP TABLE {quote(name)}")
+                else:
+                    cursor.execute(f"ALTER TABLE {quote(name)} SET SCHEMA {quote(ARCHIVE_SCHEMA)}")
+                done.append(name)
+    return done
+
+
+def default_rows():
+    """{tabla: filas en su partición default}; distinto de 0 indica meses sin partición."""
+    counts = {}
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table + '_default')}")
+            counts[table] = cursor.fetchone()[0]
+    return counts
@@ -122,3 +122,12 @@ class OrdersPermission(BasePermission):
 			return bool(user and user.is_authenticated and role in self.read_roles)
 		return bool(user and user.is_authenticated and role in self.write_roles)
 
+
+
+class AuditPermission(BasePermission):
+	"""Auditoría (solo lectura): super_admin, admin_cliente, gerente."""
+	allowed_roles = ('super_admin', 'admin_cliente', 'gerente')
+
+	def has_permission(self, request, view):
+		user = getattr(request, 'user', None)
+		return bool(user and user.is_authenticated and getattr(user, 'role', None) in self.allowed_roles)
@@ -0,0 +1,232 @@
+"""Perfilado de solicitudes bajo demanda (CPU y SQL).
+
+Un super_admin agrega `?_profile=1` (cProfile) o `?_profile=sample` (muestreo de
+pila) a cualquier URL y `ProfilingMiddleware` perfila esa solicitud: además del
+perfil de CPU registra cada sentencia SQL con su duración y la línea del proyecto
+que la originó. El resultado queda en `RequestProfile` (archivo en
+`media/profiles/`) y la respuesta trae `X-Profile-ID`; se consulta y descarga en
+`/api/profiles/`. Los `.prof` se abren con snakeviz o pstats; los `.txt` son pilas
+colapsadas que aceptan flamegraph.pl y speedscope.
+
+Para los casos que no se pueden reproducir, `PROFILE_SLOW_SAMPLE_RATE` perfila con
+muestreo una fracción de todas las solicitudes y guarda solo las que tardan
+`PROFILE_SLOW_MS` o más. Con la tasa en 0 (por defecto) y sin `_profile=` en la URL,
+el middleware solo revisa la query string.
+"""
+import cProfile
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .logs import request_user
+from .models import RequestProfile
+from .permissions import IsSuperAdminTemucoSoft
+
+logger = logging.getLogger(__name__)
+
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+PROJECT_DIR = os.path.join(str(settings.BASE_DIR), '')
+# Frames que envuelven toda la solicitud (middleware, manage.py): no sirven como origen de una consulta
+SKIP_FILES = {
+    __file__,
+    os.path.join(os.path.dirname(__file__), 'logs.py'),
+    os.path.join(os.path.dirname(__file__), 'querystats.py'),
+    os.path.join(PROJECT_DIR, 'manage.py'),
+}
+
+
+def project_frames(frame):
+    """`archivo:línea función` de los frames del proyecto (fuera de librerías), del más reciente hacia afuera."""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and 'site-packages' not in filename and filename not in SKIP_FILES:
+            yield f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+
+
+def call_site():
+    return next(project_frames(sys._getframe(2)), None)
+
+
+class SqlRecorder:
+    """`execute_wrapper` que mide cada sentencia; guarda el detalle de las primeras `limit`."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.total_ms += ms
+            if len(self.queries) < self.limit:
+                self.queries.append({"sql": sql, "ms": round(ms, 3), "many": many, "site": call_site()})
+
+
+class StackSampler:
+    """Toma la pila del hilo que lo crea cada `interval` segundos desde un hilo aparte."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Si ya se pidió detener, la pila es la de disable() esperando este hilo
+            if stack and not self._stop.is_set():
+                self.counts[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def _super_admin(request):
+    user = request.user
+    if not user.is_authenticated:
+        # El JWT normalmente lo resuelve DRF dentro de la vista; aquí se necesita antes
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            result = None
+        user = result[0] if result else None
+    return IsSuperAdminTemucoSoft().has_permission(SimpleNamespace(user=user), None)
+
+
+def _content(kind, profiler):
+    if kind == 'cprofile':
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats), 'prof'
+    return profiler.collapsed().encode('utf-8'), 'txt'
+
+
+def save_profile(request, response, kind, trigger, duration_ms, profiler, recorder):
+    user = request_user(request)
+    content, extension = _content(kind, profiler)
+    profile = RequestProfile(
+        kind=kind,
+        trigger=trigger,
+        request_id=getattr(request, 'request_id', ''),
+        method=request.method,
+        path=request.path[:255],
+        query_string=request.META.get('QUERY_STRING', ''),
+        status=response.status_code,
+        duration_ms=round(duration_ms, 1),
+        sql_count=recorder.count,
+        sql_ms=round(recorder.total_ms, 1),
+        queries=recorder.queries,
+        size=len(content),
+        user=user,
+        company_id=getattr(user, 'company_id', None),
+    )
+    profile.file.save(f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}.{extension}", ContentFile(content), save=False)
+    try:
+        profile.save()
+    except Exception:
+        profile.file.delete(save=False)
+        raise
+    for old in RequestProfile.objects.all()[settings.PROFILE_KEEP:]:
+        old.file.delete(save=False)
+        old.delete()
+    return profile
+
+
+def profile_summary(profile, limit=30):
+    """Funciones con más tiempo: acumulado para cprofile, muestras propias (hoja de la pila) para sample."""
+    with profile.file.open('rb') as f:
+        data = f.read()
+    if profile.kind == 'cprofile':
+        rows = sorted(marshal.loads(data).items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {
+                "function": f"{name} ({os.path.relpath(filename, PROJECT_DIR) if filename.startswith(PROJECT_DIR) else filename}:{line})",
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in rows
+        ]
+    leaves = Counter()
+    for line in data.decode('utf-8').splitlines():
+        stack, _, count = line.rpartition(" ")
+        leaves[stack.rsplit(";", 1)[-1]] += int(count)
+    return [{"function": function, "samples": samples} for function, samples in leaves.most_common(limit)]
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        kind, trigger = self.requested(request), 'manual'
+        if kind is None:
+            rate = settings.PROFILE_SLOW_SAMPLE_RATE
+            if not rate or random.random() >= rate:
+                return self.get_response(request)
+            kind, trigger = 'sample', 'slow'
+        return self.profile(request, kind, trigger)
+
+    def requested(self, request):
+        if '_profile=' not in request.META.get('QUERY_STRING', ''):
+            return None
+        kind = MODES.get(request.GET.get('_profile'))
+        if kind is None or not _super_admin(request):
+            return None
+        return kind
+
+    def profile(self, request, kind, trigger):
+        recorder = SqlRecorder(settings.PROFILE_MAX_QUERIES)
+        profiler = cProfile.Profile() if kind == 'cprofile' else StackSampler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+        if trigger == 'slow' and duration_ms < settings.PROFILE_SLOW_MS:
+            return response
+        try:
+            profile = save_profile(request, response, kind, trigger, duration_ms, profiler, recorder)
+        except Exception:
+            logger.exception("No se pudo guardar el perfil de %s %s", request.method, request.path)
+        else:
+            response['X-Profile-ID'] = str(profile.pk)
+        return response
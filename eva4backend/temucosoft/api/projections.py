@@ -0,0 +1,124 @@
+"""Serialización de solo lectura con `values_list()` para los listados.
+
+Hidratar instancias de modelo y pasarlas por `ModelSerializer` es lo que más CPU
+consume en una página grande. `compile_projection()` genera, una vez por
+serializer, conjunto de campos (`?fields=` / `?omit=`) y anotaciones, una función
+que arma cada fila de la respuesta directo desde la tupla de `values_list()`:
+
+- enteros, textos, booleanos y claves foráneas (`PrimaryKeyRelatedField`) se
+  copian tal cual, porque su `to_representation` no cambia el valor;
+- decimales, fechas y anotaciones pasan por el mismo campo DRF, así el JSON es
+  idéntico al del serializer;
+- un campo que sale de una propiedad del modelo se calcula con esa propiedad si el
+  serializer declara en `Meta.projection_sources` las columnas que lee.
+
+Cualquier otro campo (métodos, serializers anidados, fuentes con punto, M2M) hace
+que `compile_projection()` devuelva None y la vista use el serializer normal. Lo
+mismo un serializer que redefine `to_representation`, porque la proyección no lo
+llama; salvo que declare `Meta.projection_skips_to_representation = True` porque
+su redefinición no cambia filas como las del listado (p. ej. solo completa una
+anotación que el queryset ya trae).
+`manage.py bench_projections` compara ambos caminos.
+"""
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+
+# Campos DRF cuyo to_representation devuelve el mismo valor que entrega la base
+# para las columnas del tipo indicado
+PASSTHROUGH = (
+    (serializers.IntegerField, models.IntegerField),
+    (serializers.CharField, (models.CharField, models.TextField)),
+    (serializers.BooleanField, models.BooleanField),
+)
+
+_compiled = {}
+
+
+class ValuesProjection:
+    def __init__(self, columns, project):
+        self.columns = columns
+        self.project = project
+
+    def values(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def rows(self, tuples):
+        project = self.project
+        return [project(row) for row in tuples]
+
+
+def _passthrough(field, model_field):
+    return any(type(field) is drf and isinstance(model_field, column) for drf, column in PASSTHROUGH)
+
+
+def _property_converter(field, prop, names):
+    def convert(*values):
+        value = prop.fget(SimpleNamespace(**dict(zip(names, values))))
+        return None if value is None else field.to_representation(value)
+    return convert
+
+
+def _build(serializer, annotations):
+    overridden = type(serializer).to_representation is not serializers.ModelSerializer.to_representation
+    if overridden and not getattr(serializer.Meta, 'projection_skips_to_representation', False):
+        return None
+    model = serializer.Meta.model
+    sources = getattr(serializer.Meta, 'projection_sources', {})
+    columns = []
+    namespace = {}
+    items = []
+
+    def column(name):
+        if name not in columns:
+            columns.append(name)
+        return f"row[{columns.index(name)}]"
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        source = field.source
+        if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)) or '.' in source or source == '*':
+            return None
+        converter = f"_c{len(namespace)}"
+        if source in annotations:
+            namespace[converter] = field.to_representation
+            value = column(source)
+            items.append(f"{name!r}: None if {value} is None else {converter}({value})")
+            continue
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            prop = getattr(model, source, None)
+            if not isinstance(prop, property) or source not in sources:
+                return None
+            namespace[converter] = _property_converter(field, prop, sources[source])
+            items.append(f"{name!r}: {converter}({', '.join(column(dep) for dep in sources[source])})")
+            continue
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+        value = column(source)
+        if model_field.is_relation:
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                return None
+            items.append(f"{name!r}: {value}")
+        elif _passthrough(field, model_field):
+            items.append(f"{name!r}: {value}")
+        else:
+            namespace[converter] = field.to_representation
+            items.append(f"{name!r}: None if {value} is None else {converter}({value})")
+
+    code = "def project(row):\n    return {" + ", ".join(items) + "}\n"
+    exec(compile(code, f"<projection {type(serializer).__name__}>", "exec"), namespace)
+    return ValuesProjection(columns, namespace["project"])
+
+
+def compile_projection(serializer, queryset):
+    """ValuesProjection para listar `queryset` con los campos de `serializer`, o None si no se puede."""
+    annotations = frozenset(queryset.query.annotations)
+    key = (type(serializer), tuple(serializer.fields), annotations)
+    if key not in _compiled:
+        _compiled[key] = _build(serializer, annotations)
+    return _compiled[key]
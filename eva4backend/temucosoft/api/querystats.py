@@ -0,0 +1,297 @@
+"""Tiempo de base de datos agregado por huella SQL y endpoint.
+
+Cada conexión a la base lleva el `execute_wrapper` `record`, que se instala al
+crearla (ver `ApiConfig.ready`). Por cada sentencia se calcula su huella: el SQL
+con literales y parámetros como `?` y las listas como `(?...)`, así
+`WHERE id IN (%s, %s)` y `WHERE id IN (%s)` cuentan como la misma consulta. Por
+cada (huella, nombre de URL) se acumulan en memoria del proceso las llamadas, el
+tiempo total y el máximo. Las ejecuciones de `QUERY_STATS_SLOW_MS` o más guardan
+además la pila del proyecto de la más lenta.
+
+Solo registran los procesos que atienden solicitudes: wsgi.py y asgi.py envuelven
+la aplicación con `serving()`, que lo activa en la primera solicitud del proceso.
+El maestro de gunicorn importa la aplicación (preload_app) pero no atiende
+solicitudes, y `migrate` y los demás comandos no pasan por ahí: en ellos no se
+acumula nada ni arranca el hilo de volcado.
+
+Un hilo por proceso vuelca lo acumulado a `QueryStat` cada
+`QUERY_STATS_FLUSH_INTERVAL` segundos. Las filas se suman con ON CONFLICT, así se
+juntan los números de todos los workers, y la tabla conserva solo las
+`QUERY_STATS_MAX_ROWS` filas con más tiempo. En memoria hay a lo sumo
+`QUERY_STATS_MAX_ENTRIES` claves por intervalo: al llenarse se descartan las de
+menor tiempo y se cuentan en `stats()`. `/api/query-stats/` y
+`manage.py query_stats` muestran el top.
+"""
+import atexit
+import hashlib
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .logs import current_request
+from .models import QueryStat
+from .profiling import project_frames
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_state = {"pid": None, "entries": {}, "thread": None, "enabled": False}
+_stats = {"recorded": 0, "evicted_keys": 0, "evicted_calls": 0, "flushed_keys": 0, "flushes": 0}
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+VALUE_ROWS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+WHITESPACE = re.compile(r"\s+")
+# SQL más largo que esto (inserts masivos) se normaliza sin pasar por la caché
+CACHEABLE_SQL = 4096
+STACK_DEPTH = 15
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'calls': '-calls',
+    'max': '-max_ms',
+    'avg': '-avg_ms',
+}
+
+
+class Entry:
+    __slots__ = ('sql', 'calls', 'total_ms', 'max_ms', 'slow_ms', 'slow_stack')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow_ms = 0.0
+        self.slow_stack = ''
+
+
+def normalize(sql):
+    sql = STRING_LITERAL.sub('?', sql).replace('%s', '?')
+    sql = NUMBER.sub('?', sql)
+    sql = VALUE_LIST.sub('(?...)', sql)
+    sql = VALUE_ROWS.sub('(?...), ...', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+@lru_cache(maxsize=2048)
+def _cached_fingerprint(sql):
+    return _fingerprint(sql)
+
+
+def _fingerprint(sql):
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+
+def fingerprint(sql):
+    """(huella de 16 caracteres, SQL normalizado)."""
+    if len(sql) > CACHEABLE_SQL:
+        return _fingerprint(sql)
+    return _cached_fingerprint(sql)
+
+
+def _endpoint():
+    request = current_request()
+    if request is None:
+        return '-'
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '(sin ruta)'
+    return match.view_name or match.route
+
+
+def _entries():
+    """Acumulado del proceso actual; tras un fork (gunicorn) empieza vacío con su propio hilo de volcado."""
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        with _lock:
+            if _state["pid"] != pid:
+                thread = threading.Thread(target=_flusher, name="query-stats", daemon=True)
+                _state.update(pid=pid, entries={}, thread=thread)
+                thread.start()
+    return _state["entries"]
+
+
+def _evict(entries):
+    # Se libera el 10% de claves con menos tiempo; las consultas caras nunca se pierden por esto
+    victims = sorted(entries, key=lambda key: entries[key].total_ms)[:max(1, len(entries) // 10)]
+    for key in victims:
+        _stats["evicted_calls"] += entries.pop(key).calls
+    _stats["evicted_keys"] += len(victims)
+
+
+def _add(sql, ms, frame):
+    key_fingerprint, normalized = fingerprint(sql)
+    key = (key_fingerprint, _endpoint())
+    stack = None
+    if ms >= settings.QUERY_STATS_SLOW_MS:
+        stack = "\n".join(islice(project_frames(frame), STACK_DEPTH))
+    entries = _entries()
+    with _lock:
+        _stats["recorded"] += 1
+        entry = entries.get(key)
+        if entry is None:
+            if len(entries) >= settings.QUERY_STATS_MAX_ENTRIES:
+                _evict(entries)
+            entry = entries[key] = Entry(normalized)
+        entry.calls += 1
+        entry.total_ms += ms
+        if ms > entry.max_ms:
+            entry.max_ms = ms
+        if stack is not None and ms > entry.slow_ms:
+            entry.slow_ms, entry.slow_stack = ms, stack
+
+
+def record(execute, sql, params, many, context):
+    if not _state["enabled"] or getattr(_local, 'paused', False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _add(sql, (time.perf_counter() - start) * 1000, sys._getframe(1))
+
+
+def install(sender, connection, **kwargs):
+    """Receptor de `connection_created`: agrega `record` a la conexión nueva."""
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
+
+
+def enable():
+    """Empieza a registrar en este proceso (si `QUERY_STATS_ENABLED`)."""
+    _state["enabled"] = settings.QUERY_STATS_ENABLED
+
+
+def serving(application):
+    """Envuelve la aplicación WSGI o ASGI del proyecto para que registre el proceso que atiende solicitudes."""
+    if inspect.iscoroutinefunction(application) or inspect.iscoroutinefunction(getattr(application, '__call__', None)):
+        async def asgi(scope, receive, send):
+            if not _state["enabled"]:
+                enable()
+            return await application(scope, receive, send)
+        return asgi
+
+    def wsgi(environ, start_response):
+        if not _state["enabled"]:
+            enable()
+        return application(environ, start_response)
+    return wsgi
+
+
+def _write(entries):
+    table = QueryStat._meta.db_table
+    now = timezone.now()
+    rows = [
+        (key_fingerprint, endpoint, entry.sql, entry.calls, entry.total_ms, entry.max_ms, entry.slow_ms, entry.slow_stack, now, now)
+        for (key_fingerprint, endpoint), entry in sorted(entries.items())
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Un volcado a la vez entre todos los procesos: evita interbloqueos entre upserts
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('query_stats'))")
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (fingerprint, endpoint, sql, calls, total_ms, max_ms, slow_ms, slow_stack, first_seen, last_seen)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (fingerprint, endpoint) DO UPDATE
+            SET calls = {table}.calls + EXCLUDED.calls,
+                total_ms = {table}.total_ms + EXCLUDED.total_ms,
+                max_ms = GREATEST({table}.max_ms, EXCLUDED.max_ms),
+                slow_stack = CASE WHEN EXCLUDED.slow_ms > {table}.slow_ms THEN EXCLUDED.slow_stack ELSE {table}.slow_stack END,
+                slow_ms = GREATEST({table}.slow_ms, EXCLUDED.slow_ms),
+                last_seen = EXCLUDED.last_seen
+            """,
+            rows,
+        )
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} ORDER BY total_ms DESC OFFSET %s)",
+            [settings.QUERY_STATS_MAX_ROWS],
+        )
+
+
+def flush():
+    """Vuelca a `QueryStat` lo acumulado por este proceso; devuelve cuántas claves escribió."""
+    if _state["pid"] != os.getpid():
+        return 0
+    with _lock:
+        entries, _state["entries"] = _state["entries"], {}
+    if not entries:
+        return 0
+    paused = getattr(_local, 'paused', False)
+    _local.paused = True  # las consultas del propio volcado no se registran
+    try:
+        _write(entries)
+    finally:
+        _local.paused = paused
+    with _lock:
+        _stats["flushed_keys"] += len(entries)
+        _stats["flushes"] += 1
+    return len(entries)
+
+
+def _flusher():
+    while True:
+        time.sleep(settings.QUERY_STATS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception("No se pudieron volcar las estadísticas de consultas")
+            # La conexión puede haber quedado inutilizable; el próximo volcado abre otra
+            connection.close()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.warning("No se pudieron volcar las estadísticas de consultas al salir", exc_info=True)
+
+
+atexit.register(_flush_at_exit)
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+        data["enabled"] = _state["enabled"]
+        data["pending_keys"] = len(_state["entries"]) if _state["pid"] == os.getpid() else 0
+    return data
+
+
+def top(limit=50, order='total', endpoint=None):
+    """Filas de `QueryStat` con más tiempo (u orden `calls`, `max`, `avg`), opcionalmente de un endpoint."""
+    queryset = QueryStat.objects.annotate(avg_ms=F('total_ms') / F('calls'))
+    if endpoint:
+        queryset = queryset.filter(endpoint=endpoint)
+    return list(
+        queryset.order_by(ORDERINGS[order]).values(
+            'fingerprint', 'endpoint', 'sql', 'calls', 'total_ms', 'avg_ms', 'max_ms',
+            'slow_ms', 'slow_stack', 'first_seen', 'last_seen',
+        )[:limit]
+    )
+
+
+def reset():
+    """Borra lo acumulado en la tabla y en este proceso."""
+    with _lock:
+        _state["entries"] = {}
+    paused = getattr(_local, 'paused', False)
+    _local.paused = True
+    try:
+        QueryStat.objects.all().delete()
+    finally:
+        _local.paused = paused
@@ -0,0 +1,65 @@
+"""Renderer y parser JSON basados en orjson.
+
+Los montos (`price`, `cost`, `total`) llegan como `Decimal` desde los
+serializers y las agregaciones; se emiten como string para no perder
+precisión, igual que `DecimalField` con `COERCE_DECIMAL_TO_STRING`.
+Si orjson no está instalado se usa el encoder estándar con la misma semántica.
+"""
+import decimal
+
+from django.conf import settings
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+
+class DecimalJSONEncoder(encoders.JSONEncoder):
+    """Encoder de DRF que serializa `Decimal` como string exacto en lugar de float."""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_fallback_encoder = DecimalJSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    encoder_class = DecimalJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        # orjson solo sabe indentar a 2 espacios; otros valores (p. ej. la API navegable) usan json
+        if orjson is None or indent not in (None, 2):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_fallback_encoder.default, option=option)
+        # Igual que JSONRenderer: U+2028/U+2029 escapados para que sea un subconjunto de JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,221 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncDay
+from django.utils import timezone
+
+from .models import CustomUser, Inventory, Order, Product, Sale, SaleItem, Subscription, stock_status
+
+SANTIAGO = ZoneInfo("America/Santiago")
+
+
+def day_start(day):
+    """Inicio del día local `day` (fecha o 'AAAA-MM-DD') como datetime con zona."""
+    if isinstance(day, str):
+        day = datetime.strptime(day, "%Y-%m-%d").date()
+    return datetime.combine(day, time.min, tzinfo=SANTIAGO)
+
+
+def filter_sales(qs, branch_id=None, date_from=None, date_to=None):
+    """Filtra un queryset de `Sale` por sucursal y rango de fechas (fechas locales).
+
+    Compara `created_at` contra un rango en vez de `created_at__date`, así PostgreSQL
+    descarta las particiones mensuales fuera del rango (ver api.partitions).
+    """
+    if branch_id:
+        qs = qs.filter(branch_id=branch_id)
+    if date_from:
+        qs = qs.filter(created_at__gte=day_start(date_from))
+    if date_to:
+        qs = qs.filter(created_at__lt=day_start(date_to) + timedelta(days=1))
+    return qs
+
+
+def sales_report(sales, limit=100):
+    """Total y filas del reporte de ventas; `limit=None` exporta todas las filas."""
+    total = sales.aggregate(total=Sum('total'))['total'] or 0
+    qs = sales.select_related('branch').order_by('-created_at')
+    if limit is not None:
+        qs = qs[:limit]
+    rows = [
+        {
+            "branch": s.branch.name,
+            "total": s.total,
+            "payment_method": s.payment_method,
+            "created_at": s.created_at,
+        }
+        for s in qs
+    ]
+    return {"total": total, "rows": rows}
+
+
+def archived_sales_report(sales, products, top=10):
+    """Resumen de ventas archivadas desde `SalesRollup` y `ProductSalesRollup` ya acotados."""
+    totals = sales.aggregate(sales=Sum('sales'), total=Sum('total'))
+    return {
+        "sales": totals["sales"] or 0,
+        "total": totals["total"] or 0,
+        "daily": list(sales.values('day').annotate(sales=Sum('sales'), total=Sum('total')).order_by('day')),
+        "branches": list(
+            sales.values('branch_id', 'branch__name').annotate(sales=Sum('sales'), total=Sum('total')).order_by('-total')
+        ),
+        "payment_methods": list(
+            sales.values('payment_method').annotate(sales=Sum('sales'), total=Sum('total')).order_by('-total')
+        ),
+        "top_products": list(
+            products.values('product_id', 'product__sku', 'product__name')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue')).order_by('-revenue')[:top]
+        ),
+    }
+
+
+def stock_report(inventory):
+    """Filas del reporte de stock a partir de un queryset de `Inventory` ya acotado."""
+    # values_list() evita hidratar Inventory, Branch y Product por cada fila
+    rows = inventory.values_list('branch__name', 'product__name', 'product__sku', 'stock', 'reorder_point')
+    return [
+        {
+            "branch": branch,
+            "product": product,
+            "sku": sku,
+            "stock": stock,
+            "reorder_point": reorder_point,
+            "status": stock_status(stock, reorder_point),
+        }
+        for branch, product, sku, stock, reorder_point in rows
+    ]
+
+
+def sales_analytics(sales, top=10):
+    """Calcula los KPIs del tablero con agregaciones en la base de datos.
+
+    `sales` es un queryset de `Sale` ya acotado a la empresa y filtrado (ver `filter_sales`).
+    """
+    revenue = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    # Las líneas llevan la fecha de su venta: acotarlas al mismo rango evita leer todas sus particiones
+    items = SaleItem.objects.filter(sale__in=sales.values('id'), product__isnull=False)
+    period = sales.aggregate(first=Min('created_at'), last=Max('created_at'))
+    if period['first'] is not None:
+        items = items.filter(created_at__range=(period['first'], period['last']))
+    items = (
+        items
+        .values('product_id', 'product__sku', 'product__name')
+        .annotate(units=Sum('quantity'), revenue=Sum(revenue))
+    )
+
+    def product_rows(ordering):
+        return [
+            {
+                "product": row['product_id'],
+                "sku": row['product__sku'],
+                "name": row['product__name'],
+                "quantity": row['units'],
+                "revenue": row['revenue'],
+            }
+            for row in items.order_by(ordering, 'product_id')[:top]
+        ]
+
+    heatmap = (
+        sales.annotate(
+            weekday=ExtractIsoWeekDay('created_at', tzinfo=SANTIAGO),
+            hour=ExtractHour('created_at', tzinfo=SANTIAGO),
+        )
+        .values('weekday', 'hour')
+        .annotate(sales=Count('id'), total=Sum('total'))
+        .order_by('weekday', 'hour')
+    )
+    daily = (
+        sales.annotate(day=TruncDay('created_at', tzinfo=SANTIAGO))
+        .values('day')
+        .annotate(sales=Count('id'), total=Sum('total'))
+        .order_by('day')
+    )
+    branches = (
+        sales.values('branch_id', 'branch__name')
+        .annotate(sales=Count('id'), total=Sum('total'))
+        .order_by('-total')
+    )
+
+    return {
+        "top_by_revenue": product_rows('-revenue'),
+        "top_by_quantity": product_rows('-units'),
+        "heatmap": list(heatmap),
+        "daily": [
+            {"day": row['day'].date(), "sales": row['sales'], "total": row['total']}
+            for row in daily
+        ],
+        "branches": [
+            {"branch": row['branch_id'], "name": row['branch__name'], "sales": row['sales'], "total": row['total']}
+            for row in branches
+        ],
+    }
+
+
+def user_profile(user):
+    return {
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'rut': user.rut,
+        'company': user.company.name if user.company else None,
+        'is_active': user.is_active,
+        'created_at': user.created_at
+    }
+
+
+def dashboard_summary(user, recent=5):
+    """Datos del tablero inicial en una cantidad fija de consultas agregadas."""
+    role = getattr(user, "role", None)
+    company_id = getattr(user, "company_id", None)
+    sales = Sale.objects.all()
+    inventory = Inventory.objects.all()
+    users = CustomUser.objects.all()
+    products = Product.objects.all()
+    if role != "super_admin":
+        sales = sales.filter(branch__company_id=company_id)
+        products = products.filter(company_id=company_id)
+        inventory = inventory.filter(branch__company_id=company_id)
+        users = users.filter(company_id=company_id)
+
+    today = timezone.localdate()
+    sales_totals = sales.aggregate(
+        sales_count=Count('id'),
+        sales_total=Sum('total'),
+        today_count=Count('id', filter=Q(created_at__gte=day_start(today))),
+        today_total=Sum('total', filter=Q(created_at__gte=day_start(today))),
+    )
+    counts = {
+        "products": products.count(),
+        "orders": Order.objects.count(),
+        "sales": sales_totals["sales_count"],
+        "low_stock": inventory.filter(stock__lte=F('reorder_point')).count(),
+    }
+    if role in ("super_admin", "admin_cliente"):
+        counts["users"] = users.count()
+
+    subscription = None
+    if company_id:
+        sub = Subscription.objects.filter(company_id=company_id).first()
+        if sub:
+            subscription = {
+                "plan": sub.plan_name,
+                "active": sub.active and sub.end_date >= today,
+                "end_date": sub.end_date,
+                "days_left": (sub.end_date - today).days,
+            }
+
+    return {
+        "profile": user_profile(user),
+        "counts": counts,
+        "sales": {
+            "total": sales_totals["sales_total"] or 0,
+            "today_count": sales_totals["today_count"],
+            "today_total": sales_totals["today_total"] or 0,
+        },
+        "recent_sales": list(
+            sales.order_by('-created_at')
+            .values('id', 'total', 'payment_method', 'created_at', branch_name=F('branch__name'))[:recent]
+        ),
+        "subscription": subscription,
+    }
@@ -0,0 +1,186 @@
+"""Reservas de stock con vencimiento para los carritos.
+
+Agregar al carrito aparta unidades en `Inventory.reserved`, un contador mantenido
+junto a cada `StockReservation`, de modo que el stock disponible es
+`stock - reserved` sin sumar reservas en cada lectura. Las ventas del POS
+(`stock.decrement_stock`) solo descuentan lo disponible. Al hacer checkout las
+reservas se convierten en descuentos de stock y al vaciar el carrito
+(DELETE /api/cart/) se liberan; las vencidas se liberan en bloque con
+`release_expired_reservations` (manage.py release_reservations), y también al
+reservar o vender un producto que no alcanza.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Inventory, StockReservation
+from .stock import InsufficientStock
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def _candidates(product_id):
+    """Inventarios del producto ordenados por stock disponible, de mayor a menor."""
+    qs = Inventory.objects.filter(product_id=product_id)
+    if settings.ECOMMERCE_BRANCH_ID:
+        qs = qs.filter(branch_id=settings.ECOMMERCE_BRANCH_ID)
+    return list(qs.annotate(free=F('stock') - F('reserved')).order_by('-free', 'id').values_list('id', 'free'))
+
+
+def _take(inventory_id, quantity):
+    """Suma `quantity` a `reserved` solo si queda stock disponible; un único UPDATE condicional."""
+    return bool(
+        Inventory.objects.filter(pk=inventory_id, stock__gte=F('reserved') + quantity)
+        .update(reserved=F('reserved') + quantity, version=F('version') + 1)
+    )
+
+
+def reserve(user, product_id, quantity):
+    """Aparta `quantity` unidades del producto para el carrito de `user`.
+
+    Prefiere los inventarios donde el usuario ya tiene reservas y renueva el
+    vencimiento de todas sus reservas. Lanza `InsufficientStock` si ningún
+    inventario tiene esa cantidad disponible.
+    """
+    with transaction.atomic():
+        own = dict(
+            StockReservation.objects.select_for_update()
+            .filter(user=user, inventory__product_id=product_id)
+            .values_list('inventory_id', 'id')
+        )
+        candidates = _candidates(product_id)
+        order = list(own) + [inventory_id for inventory_id, _ in candidates if inventory_id not in own]
+
+        inventory_id = next((i for i in order if _take(i, quantity)), None)
+        # Reservas vencidas de otros usuarios que el barrido todavía no liberó pueden estar ocupando el stock
+        if inventory_id is None and release_expired_reservations(product_id=product_id, exclude_user_id=user.pk):
+            inventory_id = next((i for i in order if _take(i, quantity)), None)
+        if inventory_id is None:
+            raise InsufficientStock(product_id, max([free for _, free in candidates] + [0]))
+
+        expires_at = _expires_at()
+        if inventory_id in own:
+            StockReservation.objects.filter(pk=own[inventory_id]).update(quantity=F('quantity') + quantity)
+        else:
+            StockReservation.objects.create(user=user, inventory_id=inventory_id, quantity=quantity, expires_at=expires_at)
+        StockReservation.objects.filter(user=user).update(expires_at=expires_at)
+
+
+def checkout(user, items):
+    """Convierte las reservas de `user` en descuentos de stock para `items` ({product_id: cantidad}).
+
+    Lo que falte por reservar (p. ej. porque la reserva venció) se reserva primero;
+    lo reservado de más se libera. Debe llamarse dentro de una transacción y lanza
+    `InsufficientStock` si algún producto ya no alcanza.
+    """
+    reserved = {}
+    for product_id, quantity in StockReservation.objects.select_for_update().filter(user=user).values_list('inventory__product_id', 'quantity'):
+        reserved[product_id] = reserved.get(product_id, 0) + quantity
+    for product_id, quantity in items.items():
+        missing = quantity - reserved.get(product_id, 0)
+        if missing > 0:
+            reserve(user, product_id, missing)
+    _settle(user, items)
+
+
+def release(user):
+    """Libera todas las reservas de `user` (carrito vaciado o abandonado)."""
+    with transaction.atomic():
+        _settle(user, {})
+
+
+def _settle(user, consume):
+    """Borra las reservas de `user`, descontando de `stock` hasta `consume[product_id]` unidades."""
+    remaining = dict(consume)
+    rows = {}
+    reservations = (
+        StockReservation.objects.select_for_update()
+        .filter(user=user)
+        .order_by('id')
+        .values_list('id', 'inventory_id', 'inventory__product_id', 'quantity')
+    )
+    for _, inventory_id, product_id, quantity in reservations:
+        used = min(quantity, remaining.get(product_id, 0))
+        remaining[product_id] = remaining.get(product_id, 0) - used
+        row = rows.setdefault(inventory_id, [product_id, 0, 0])
+        row[1] += used
+        row[2] += quantity
+    if not rows:
+        return
+
+    table = Inventory._meta.db_table
+    values = ", ".join(["(%s::bigint, %s::integer, %s::integer)"] * len(rows))
+    params = [value for inventory_id, (_, used, held) in rows.items() for value in (inventory_id, used, held)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS inv
+            SET stock = inv.stock - lines.used,
+                reserved = GREATEST(inv.reserved - lines.held, 0),
+                version = inv.version + 1,
+                last_updated = NOW()
+            FROM (VALUES {values}) AS lines (id, used, held)
+            WHERE inv.id = lines.id AND inv.stock >= lines.used
+            RETURNING inv.id
+            """,
+            params,
+        )
+        settled = {row[0] for row in cursor.fetchall()}
+    # Un conteo físico pudo bajar el stock por debajo de lo reservado
+    short = [inventory_id for inventory_id in rows if inventory_id not in settled]
+    if short:
+        raise InsufficientStock(rows[short[0]][0], 0)
+    StockReservation.objects.filter(user=user).delete()
+
+
+def release_expired_reservations(product_id=None, exclude_user_id=None, batch_size=1000):
+    """Libera hasta `batch_size` reservas vencidas con una sola sentencia y devuelve cuántas liberó.
+
+    Borra las reservas y descuenta sus cantidades de `Inventory.reserved`
+    agrupadas por inventario. Las reservas bloqueadas por un checkout en curso se saltan.
+    """
+    reservations = StockReservation._meta.db_table
+    inventory = Inventory._meta.db_table
+    conditions = ["r.expires_at <= NOW()"]
+    params = []
+    if product_id is not None:
+        conditions.append("i.product_id = %s")
+        params.append(product_id)
+    if exclude_user_id is not None:
+        conditions.append("r.user_id <> %s")
+        params.append(exclude_user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH expired AS (
+                DELETE FROM {reservations}
+                WHERE id IN (
+                    SELECT r.id
+                    FROM {reservations} AS r
+                    JOIN {inventory} AS i ON i.id = r.inventory_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY r.expires_at
+                    LIMIT %s
+                    FOR UPDATE OF r SKIP LOCKED
+                )
+                RETURNING inventory_id, quantity
+            ),
+            totals AS (
+                SELECT inventory_id, SUM(quantity) AS quantity FROM expired GROUP BY inventory_id
+            ),
+            released AS (
+                UPDATE {inventory} AS inv
+                SET reserved = GREATEST(inv.reserved - totals.quantity, 0), version = inv.version + 1
+                FROM totals
+                WHERE inv.id = totals.inventory_id
+            )
+            SELECT COUNT(*) FROM expired
+            """,
+            params + [batch_size],
+        )
+        return cursor.fetchone()[0]
@@ -1,26 +1,127 @@
 from rest_framework import serializers
-from .models import Product, Inventory, Supplier, CustomUser, Branch, Company, Sale, SaleItem, Order, OrderItem, Subscription, Cart, CartItem, Purchase
+from .models import Product, Inventory, Supplier, CustomUser, Branch, Company, Sale, SaleItem, Order, OrderItem, Subscription, Cart, CartItem, Purchase, PurchaseReceipt, Job, AuditEvent, RequestProfile
+from . import audit
+from .profiling import profile_summary
+from .stock import InsufficientStock, decrement_stock, increment_stock
 from django.utils import timezone
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-class ProductSerializer(serializers.ModelSerializer):
+
+def sparse_fieldset(request):
+    """Lee `?fields=a,b` y `?omit=c` de un GET; devuelve (campos pedidos o None, campos omitidos)."""
+    if request is None or request.method != 'GET':
+        return None, set()
+    params = request.query_params
+    fields = {f.strip() for f in params.get('fields', '').split(',') if f.strip()}
+    omit = {f.strip() for f in params.get('omit', '').split(',') if f.strip()}
+    return fields or None, omit
+
+
+def foreign_products(product_ids, branch):
+    """Ids de `product_ids` que no son de la empresa de `branch` (una sucursal sin empresa no restringe)."""
+    if branch.company_id is None:
+        return []
+    own = set(Product.objects.filter(id__in=product_ids, company_id=branch.company_id).values_list('id', flat=True))
+    return sorted(set(product_ids) - own)
+
+
+class SparseFieldsetMixin:
+    """Recorta los campos del serializer según `?fields=` / `?omit=`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, omit = sparse_fieldset(self.context.get('request'))
+        if fields is None and not omit:
+            return
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or name in omit:
+                self.fields.pop(name)
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    margin = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    company = serializers.PrimaryKeyRelatedField(queryset=Company.objects.all(), required=False)
+
     class Meta:
         model = Product
         fields = '__all__'
+        # (company, sku) se valida en validate(): company puede venir del usuario y no del cuerpo
+        validators = []
+        # to_representation solo completa margin cuando falta la anotación, y el listado la trae (ver api.projections)
+        projection_skips_to_representation = True
+
+    def validate(self, attrs):
+        user = getattr(self.context.get('request'), 'user', None)
+        if getattr(user, 'role', None) != 'super_admin':
+            # El personal de una empresa solo crea y edita productos propios
+            attrs['company'] = getattr(user, 'company', None)
+        company = attrs.get('company', getattr(self.instance, 'company', None))
+        if company is None:
+            raise serializers.ValidationError({"company": "Debe indicar la empresa dueña del producto."})
+        sku = attrs.get('sku', getattr(self.instance, 'sku', None))
+        duplicates = Product.objects.filter(company=company, sku=sku)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError({"sku": "Ya existe un producto con este SKU en la empresa."})
+        return attrs
+
+    def to_representation(self, instance):
+        # Las instancias recién creadas/actualizadas no traen la anotación SQL
+        if not hasattr(instance, 'margin'):
+            instance.margin = instance.profit_margin
+        return super().to_representation(instance)
+
+class InventorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    valuation = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    available = serializers.IntegerField(read_only=True)
 
-class InventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Inventory
         fields = '__all__'
+        read_only_fields = ['version', 'reserved']
+        # Columnas que lee la propiedad Inventory.available (ver api.projections)
+        projection_sources = {'available': ('stock', 'reserved')}
+        # to_representation solo completa valuation cuando falta la anotación, y el listado la trae
+        projection_skips_to_representation = True
+
+    def to_representation(self, instance):
+        if not hasattr(instance, 'valuation'):
+            instance.valuation = instance.stock * instance.product.cost
+        return super().to_representation(instance)
+
+class InventoryCountLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    stock = serializers.IntegerField(min_value=0)
+
+
+class InventoryAdjustSerializer(serializers.Serializer):
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all())
+    items = InventoryCountLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, value):
+        ids = [line['product'] for line in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("La planilla tiene productos repetidos.")
+        found = set(Product.objects.filter(id__in=ids).values_list('id', flat=True))
+        missing = [pid for pid in ids if pid not in found]
+        if missing:
+            raise serializers.ValidationError(f"Productos no encontrados: {missing[:20]}")
+        return value
+
+    def validate(self, attrs):
+        foreign = foreign_products([line['product'] for line in attrs['items']], attrs['branch'])
+        if foreign:
+            raise serializers.ValidationError({"items": f"Productos de otra empresa: {foreign[:20]}"})
+        return attrs
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Supplier
         fields = '__all__'
 
-class BranchSerializer(serializers.ModelSerializer):
+class BranchSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = '__all__'
@@ -80,7 +181,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     company_name = CompanySerializer(source='company', read_only=True)
 
     def validate_rut(self, value):
@@ -132,7 +233,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
         model = SaleItem
         fields = ['product', 'quantity', 'price']
 
-class SaleSerializer(serializers.ModelSerializer):
+class SaleSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     items = SaleItemSerializer(many=True)
 
@@ -141,6 +242,13 @@ class SaleSerializer(serializers.ModelSerializer):
         fields = ['branch', 'user', 'items', 'total', 'payment_method', 'created_at']
         extra_kwargs = {'user': {'read_only': True}}
 
+    def validate(self, attrs):
+        foreign = foreign_products([item['product'].id for item in attrs.get('items', [])], attrs['branch'])
+        if foreign:
+            raise serializers.ValidationError({"items": f"Productos de otra empresa: {foreign[:20]}"})
+        return attrs
+
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         request = self.context.get('request')
@@ -152,13 +260,16 @@ class SaleSerializer(serializers.ModelSerializer):
         branch = validated_data['branch']
         for item_data in items_data:
             product = item_data['product']
-            quantity = item_data['quantity']
-            inventory = Inventory.objects.filter(branch=branch, product=product).first()
-            if not inventory or inventory.stock < quantity:
+            try:
+                decrement_stock(branch.id, product.id, item_data['quantity'])
+            except InsufficientStock:
                 raise serializers.ValidationError({"stock": f"Stock insuficiente para {product.name}"})
-            inventory.stock -= quantity
-            inventory.save()
             SaleItem.objects.create(sale=sale, **item_data)
+        audit.record(
+            'sale.create', 'sale', sale.id, user=user, company_id=branch.company_id,
+            branch=branch.id, total=sale.total, payment_method=sale.payment_method,
+            items=[{"product": item['product'].id, "quantity": item['quantity']} for item in items_data],
+        )
         return sale
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -166,7 +277,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['product', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
 
     class Meta:
@@ -174,6 +285,11 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['customer_name', 'customer_email', 'items', 'total', 'status', 'created_at']
 
 
+class OrderTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_sku = serializers.CharField(source='product.sku', read_only=True)
@@ -195,7 +311,7 @@ class CartSerializer(serializers.ModelSerializer):
         return obj.total
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     company_name = serializers.CharField(source='company.name', read_only=True)
 
     class Meta:
@@ -210,7 +326,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class PurchaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Purchase
         fields = '__all__'
@@ -220,14 +336,131 @@ class PurchaseSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("La fecha de compra no puede ser futura.")
         return value
 
+    def validate(self, attrs):
+        product = attrs.get('product', getattr(self.instance, 'product', None))
+        branch = attrs.get('branch', getattr(self.instance, 'branch', None))
+        if product is not None and branch is not None and foreign_products([product.id], branch):
+            raise serializers.ValidationError({"product": "El producto es de otra empresa."})
+        return attrs
+
     def create(self, validated_data):
         with transaction.atomic():
             purchase = super().create(validated_data)
-            inv, _ = Inventory.objects.get_or_create(
-                branch=purchase.branch,
-                product=purchase.product,
-                defaults={"stock": 0, "reorder_point": 10},
+            increment_stock(purchase.branch_id, [(purchase.product_id, purchase.quantity)])
+            audit.record(
+                'purchase.create', 'purchase', purchase.id,
+                user=getattr(self.context.get('request'), 'user', None), company_id=purchase.branch.company_id,
+                branch=purchase.branch_id, product=purchase.product_id, quantity=purchase.quantity, cost=purchase.cost,
             )
-            inv.stock += purchase.quantity
-            inv.save()
         return purchase
+
+
+class PurchaseReceiptLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(source='product_id', min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+    cost = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+
+class PurchaseReceiptSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    lines = PurchaseReceiptLineSerializer(many=True, allow_empty=False)
+    created_by = serializers.PrimaryKeyRelatedField(read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = PurchaseReceipt
+        fields = ['id', 'supplier', 'branch', 'reference', 'date', 'notes', 'lines', 'total', 'created_by', 'created_at']
+
+    def validate_date(self, value):
+        if value > timezone.now().date():
+            raise serializers.ValidationError("La fecha de compra no puede ser futura.")
+        return value
+
+    def validate_lines(self, value):
+        ids = {line['product_id'] for line in value}
+        found = set(Product.objects.filter(id__in=ids).values_list('id', flat=True))
+        missing = sorted(ids - found)
+        if missing:
+            raise serializers.ValidationError(f"Productos no encontrados: {missing[:20]}")
+        return value
+
+    def validate(self, attrs):
+        foreign = foreign_products([line['product_id'] for line in attrs['lines']], attrs['branch'])
+        if foreign:
+            raise serializers.ValidationError({"lines": f"Productos de otra empresa: {foreign[:20]}"})
+        return attrs
+
+    def create(self, validated_data):
+        lines = validated_data.pop('lines')
+        with transaction.atomic():
+            receipt = PurchaseReceipt.objects.create(**validated_data)
+            Purchase.objects.bulk_create([
+                Purchase(
+                    receipt=receipt,
+                    supplier=receipt.supplier,
+                    branch=receipt.branch,
+                    product_id=line['product_id'],
+                    quantity=line['quantity'],
+                    cost=line['cost'],
+                    date=receipt.date,
+                )
+                for line in lines
+            ])
+            increment_stock(receipt.branch_id, [(line['product_id'], line['quantity']) for line in lines])
+            audit.record(
+                'purchase.receipt', 'purchase_receipt', receipt.id,
+                user=getattr(self.context.get('request'), 'user', None), company_id=receipt.branch.company_id,
+                branch=receipt.branch_id, supplier=receipt.supplier_id, reference=receipt.reference,
+                lines=[{"product": line['product_id'], "quantity": line['quantity'], "cost": line['cost']} for line in lines],
+            )
+        return receipt
+
+
+class JobSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'progress_message', 'attempts', 'max_attempts',
+            'result', 'error', 'download_url', 'created_at', 'started_at', 'finished_at',
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != 'done' or not obj.artifact:
+            return None
+        request = self.context.get('request')
+        url = f"/api/jobs/{obj.id}/download/"
+        return request.build_absolute_uri(url) if request else url
+
+
+class AuditEventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = ['id', 'company', 'user', 'action', 'entity', 'entity_id', 'data', 'created_at']
+
+
+class RequestProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RequestProfile
+        fields = [
+            'id', 'kind', 'trigger', 'request_id', 'method', 'path', 'query_string', 'status', 'duration_ms',
+            'sql_count', 'sql_ms', 'size', 'user', 'company', 'download_url', 'created_at',
+        ]
+
+    def get_download_url(self, obj):
+        request = self.context.get('request')
+        url = f"/api/profiles/{obj.id}/download/"
+        return request.build_absolute_uri(url) if request else url
+
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    """Incluye el SQL registrado y las funciones más costosas (se lee el archivo del perfil)."""
+    top = serializers.SerializerMethodField()
+
+    class Meta(RequestProfileSerializer.Meta):
+        fields = RequestProfileSerializer.Meta.fields + ['queries', 'top']
+
+    def get_top(self, obj):
+        return profile_summary(obj)
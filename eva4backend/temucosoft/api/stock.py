@@ -0,0 +1,221 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Inventory
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, available):
+        super().__init__(f"Stock insuficiente para el producto {product_id} (disponible: {available})")
+        self.product_id = product_id
+        self.available = available
+
+
+class StockConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "El inventario cambió mientras se actualizaba; reintenta la operación."
+    default_code = 'stock_conflict'
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "La versión del inventario no coincide con If-Match."
+    default_code = 'precondition_failed'
+
+
+def parse_if_match(request):
+    """Versión pedida en `If-Match` (`"3"`, `W/"3"` o `3`); None si no viene o es `*`."""
+    value = request.headers.get('If-Match', '').strip()
+    if not value or value == '*':
+        return None
+    value = value.removeprefix('W/').strip('"')
+    if not value.isdigit():
+        raise PreconditionFailed("If-Match debe ser la versión del inventario, p. ej. \"3\".")
+    return int(value)
+
+
+def inventory_etag(inventory):
+    return f'"{inventory.version}"'
+
+
+def conditional_update(inventory_id, expected_version, **values):
+    """`UPDATE ... WHERE id = %s AND version = %s`; devuelve True si la fila seguía en esa versión."""
+    return bool(
+        Inventory.objects.filter(pk=inventory_id, version=expected_version)
+        .update(version=F('version') + 1, last_updated=timezone.now(), **values)
+    )
+
+
+def _inventory_row(branch_id, product_id):
+    return (
+        Inventory.objects.filter(branch_id=branch_id, product_id=product_id)
+        .values('id', 'stock', 'reserved', 'version')
+        .first()
+    )
+
+
+def _release_expired(product_id):
+    """Reservas vencidas que el barrido todavía no liberó pueden estar ocupando el stock."""
+    from .reservations import release_expired_reservations
+
+    return release_expired_reservations(product_id=product_id)
+
+
+def decrement_stock(branch_id, product_id, quantity, expected_version=None, retries=None):
+    """Descuenta stock disponible (sin lo reservado por carritos) con concurrencia optimista.
+
+    Lee la fila y la escribe con `WHERE version = n`; si otra transacción ganó la
+    carrera vuelve a leer y reintenta hasta `INVENTORY_UPDATE_RETRIES` veces.
+    Devuelve la nueva versión de la fila.
+    Con `expected_version` (de `If-Match`) no se reintenta: otra versión es 412.
+    Si no alcanza, libera una vez las reservas vencidas del producto y vuelve a leer.
+    """
+    retries = settings.INVENTORY_UPDATE_RETRIES if retries is None else retries
+    released = False
+    for attempt in range(retries + 1):
+        row = _inventory_row(branch_id, product_id)
+        available = row['stock'] - row['reserved'] if row else 0
+        if available < quantity and not released and row and row['reserved']:
+            released = True
+            if _release_expired(product_id):
+                row = _inventory_row(branch_id, product_id)
+                available = row['stock'] - row['reserved']
+        if available < quantity:
+            raise InsufficientStock(product_id, max(available, 0))
+        if expected_version is not None and row['version'] != expected_version:
+            raise PreconditionFailed()
+        if conditional_update(row['id'], row['version'], stock=F('stock') - quantity):
+            return row['version'] + 1
+        if expected_version is not None:
+            raise PreconditionFailed()
+        # Espera corta y aleatoria para que los escritores en conflicto no choquen de nuevo al unísono
+        time.sleep(random.uniform(0, 0.002) * (attempt + 1))
+    raise StockConflict()
+
+
+def decrement_stock_locked(branch_id, product_id, quantity):
+    """Variante pesimista de `decrement_stock` con `SELECT ... FOR UPDATE`; requiere una transacción."""
+    inventory = (
+        Inventory.objects.select_for_update()
+        .filter(branch_id=branch_id, product_id=product_id)
+        .only('id', 'stock', 'reserved', 'version')
+        .first()
+    )
+    if inventory is not None and inventory.available < quantity and inventory.reserved and _release_expired(product_id):
+        inventory.refresh_from_db(fields=['reserved'])
+    if inventory is None or inventory.available < quantity:
+        raise InsufficientStock(product_id, inventory.available if inventory else 0)
+    Inventory.objects.filter(pk=inventory.pk).update(
+        stock=F('stock') - quantity, version=F('version') + 1, last_updated=timezone.now()
+    )
+    return inventory.version + 1
+
+
+def _values_clause(rows):
+    """Arma un `VALUES (%s, %s), ...` tipado para una lista de pares (product_id, cantidad)."""
+    values = ", ".join(["(%s::bigint, %s::integer)"] * len(rows))
+    params = [value for row in rows for value in row]
+    return values, params
+
+
+def apply_count_sheet(branch_id, counts):
+    """Aplica una planilla de conteo físico a una sucursal.
+
+    `counts` es una lista de pares (product_id, stock_contado) sin productos repetidos.
+    Actualiza las filas existentes con un único `UPDATE ... FROM (VALUES ...)` y crea
+    las faltantes con un upsert. Debe llamarse dentro de una transacción.
+    Devuelve una lista de dicts con el stock anterior, el nuevo y la diferencia.
+    """
+    if not counts:
+        return []
+
+    table = Inventory._meta.db_table
+    values, params = _values_clause(counts)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH sheet (product_id, stock) AS (VALUES {values}),
+            previous AS (
+                SELECT inv.id, inv.stock
+                FROM {table} AS inv
+                JOIN sheet ON sheet.product_id = inv.product_id
+                WHERE inv.branch_id = %s
+                FOR UPDATE OF inv
+            )
+            UPDATE {table} AS inv
+            SET stock = sheet.stock, version = inv.version + 1, last_updated = NOW()
+            FROM previous, sheet
+            WHERE inv.id = previous.id AND sheet.product_id = inv.product_id
+            RETURNING inv.product_id, previous.stock, inv.stock
+            """,
+            params + [branch_id],
+        )
+        updated = cursor.fetchall()
+
+        seen = {row[0] for row in updated}
+        missing = [row for row in counts if row[0] not in seen]
+        created = []
+        if missing:
+            values, params = _values_clause(missing)
+            reorder_point = Inventory._meta.get_field('reorder_point').default
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (branch_id, product_id, stock, reorder_point, version, reserved, last_updated)
+                SELECT %s, sheet.product_id, sheet.stock, %s, 1, 0, NOW()
+                FROM (VALUES {values}) AS sheet (product_id, stock)
+                ON CONFLICT (branch_id, product_id)
+                DO UPDATE SET stock = EXCLUDED.stock, version = {table}.version + 1,
+                              last_updated = EXCLUDED.last_updated
+                RETURNING product_id, 0, stock
+                """,
+                [branch_id, reorder_point] + params,
+            )
+            created = cursor.fetchall()
+
+    return [
+        {
+            "product": product_id,
+            "previous": previous,
+            "stock": stock,
+            "delta": stock - previous,
+            "created": is_new,
+        }
+        for rows, is_new in ((updated, False), (created, True))
+        for product_id, previous, stock in rows
+    ]
+
+
+def increment_stock(branch_id, increments):
+    """Suma cantidades al stock de una sucursal con un único upsert.
+
+    `increments` es una lista de pares (product_id, cantidad); los productos repetidos
+    se acumulan antes de escribir. Las filas de inventario faltantes se crean.
+    """
+    totals = {}
+    for product_id, quantity in increments:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    if not totals:
+        return
+
+    table = Inventory._meta.db_table
+    values, params = _values_clause(list(totals.items()))
+    reorder_point = Inventory._meta.get_field('reorder_point').default
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (branch_id, product_id, stock, reorder_point, version, reserved, last_updated)
+            SELECT %s, lines.product_id, lines.quantity, %s, 1, 0, NOW()
+            FROM (VALUES {values}) AS lines (product_id, quantity)
+            ON CONFLICT (branch_id, product_id)
+            DO UPDATE SET stock = {table}.stock + EXCLUDED.stock, version = {table}.version + 1,
+                          last_updated = EXCLUDED.last_updated
+            """,
+            [branch_id, reorder_point] + params,
+        )
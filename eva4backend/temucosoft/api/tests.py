@@ -1,3 +1,360 @@
-from django.test import TestCase
+import multiprocessing
+import threading
+import traceback
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import carts, events, reservations
+from .changes import change_feed
+from .models import Branch, Cart, CartItem, ChangeTombstone, Company, CustomUser, Inventory, Job, Order, Product, StockReservation
+from .stock import InsufficientStock, StockConflict, conditional_update, decrement_stock, decrement_stock_locked
+
+
+def _run(target):
+    try:
+        target()
+    except BaseException:
+        traceback.print_exc()
+        raise SystemExit(1)
+    finally:
+        connections.close_all()
+    raise SystemExit(0)
+
+
+def in_other_worker(target):
+    """Corre `target` en un proceso hijo, como otro worker de gunicorn, y devuelve su código de salida."""
+    # Igual que gunicorn.conf.py: ninguna conexión abierta se hereda en el fork
+    connections.close_all()
+    process = multiprocessing.get_context('fork').Process(target=_run, args=(target,))
+    process.start()
+    process.join()
+    return process.exitcode
+
+
+class CartAcrossWorkersTests(TransactionTestCase):
+    def setUp(self):
+        if carts.shared_cache():
+            carts._redis().delete(carts._dirty_key())
+        company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        branch = Branch.objects.create(company=company, name="Centro", phone="+56912345678")
+        self.product = Product.objects.create(company=company, sku="CAFE-1", name="Café", category="Bebidas",
+                                              price=Decimal('2500'), cost=Decimal('1200'))
+        self.other = Product.objects.create(company=company, sku="TE-1", name="Té", category="Bebidas",
+                                            price=Decimal('1500'), cost=Decimal('700'))
+        self.inventory = Inventory.objects.create(branch=branch, product=self.product, stock=10)
+        Inventory.objects.create(branch=branch, product=self.other, stock=10)
+        self.user = CustomUser.objects.create_user(username="cliente", password="clave-segura", rut="12.345.678-5",
+                                                   company=company)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, product, quantity, client=None):
+        response = (client or self.client).post('/api/cart/add/', {"product": product.pk, "quantity": quantity},
+                                                format='json')
+        assert response.status_code == 201, response.content
+
+    def other_client(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.get(pk=self.user.pk))
+        return client
+
+    def items(self):
+        return [(item["product"], item["quantity"]) for item in self.client.get('/api/cart/').json()["items"]]
+
+    def test_adds_in_other_worker_are_summed(self):
+        self.add(self.product, 1)
+        self.assertEqual(in_other_worker(lambda: self.add(self.product, 2, self.other_client())), 0)
+        self.assertEqual(self.items(), [(self.product.pk, 3)])
+
+    def test_checkout_in_other_worker_sees_added_items(self):
+        self.add(self.product, 3)
+
+        def checkout():
+            response = self.other_client().post('/api/cart/checkout/', format='json')
+            assert response.status_code == 201, response.content
+
+        self.assertEqual(in_other_worker(checkout), 0)
+        order = Order.objects.get()
+        self.assertEqual([(item.product_id, item.quantity) for item in order.items.all()], [(self.product.pk, 3)])
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.reserved), (7, 0))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.items(), [])
+
+
+@skipUnless(carts.shared_cache(), "CACHES['carts'] no es Redis")
+class CartWriteBehindTests(CartAcrossWorkersTests):
+    def test_items_stay_in_cache_until_flushed(self):
+        self.add(self.product, 1)
+        self.add(self.product, 2)
+        self.assertFalse(CartItem.objects.exists())
+
+        def flush():
+            assert carts.flush_dirty_carts() == 1
+
+        self.assertEqual(in_other_worker(flush), 0)
+        self.assertEqual(list(CartItem.objects.values_list('product_id', 'quantity')), [(self.product.pk, 3)])
+        self.assertEqual(carts.flush_dirty_carts(), 0)
+
+    def test_checkout_keeps_items_added_meanwhile(self):
+        self.add(self.product, 2)
+        checked_out = carts.load_cart(self.user)
+        self.add(self.product, 1)
+        self.add(self.other, 1)
+        carts.clear_cart(self.user, checked_out=checked_out)
+        self.assertEqual(sorted(self.items()), [(self.product.pk, 1), (self.other.pk, 1)])
+
+    def test_cleared_cart_is_not_resurrected(self):
+        self.add(self.product, 2)
+        old_cart = carts.load_cart(self.user)["cart"]
+        self.assertEqual(in_other_worker(lambda: carts.clear_cart(CustomUser.objects.get(pk=self.user.pk))), 0)
+        self.add(self.other, 1)
+        self.assertEqual(carts.flush_dirty_carts(), 1)
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertNotEqual(cart.pk, old_cart)
+        self.assertEqual(list(cart.items.values_list('product_id', 'quantity')), [(self.other.pk, 1)])
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        self.branch = Branch.objects.create(company=company, name="Centro", phone="+56912345678")
+        self.product = Product.objects.create(company=company, sku="CAFE-1", name="Café", category="Bebidas",
+                                              price=Decimal('2500'), cost=Decimal('1200'))
+        self.inventory = Inventory.objects.create(branch=self.branch, product=self.product, stock=10)
+        user = CustomUser.objects.create_user(username="gerente", password="clave-segura", rut="12.345.678-5",
+                                              company=company, role="gerente")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.url = f'/api/inventory/{self.inventory.pk}/'
+
+    def in_thread(self, target):
+        """Corre `target` en otro hilo, con su propia conexión, como una solicitud concurrente."""
+        def run():
+            try:
+                target()
+            finally:
+                connections.close_all()
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+    def test_stale_if_match_is_412(self):
+        version = self.client.get(self.url)['ETag']
+        self.in_thread(lambda: conditional_update(self.inventory.pk, 1, stock=8))
+        response = self.client.patch(self.url, {"stock": 5}, format='json', HTTP_IF_MATCH=version)
+        self.assertEqual(response.status_code, 412)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.version), (8, 2))
+
+    def test_version_bumped_during_update_is_409(self):
+        def bump_then_update(*args, **kwargs):
+            # Otra solicitud escribe entre la lectura de la vista y su UPDATE condicional
+            self.in_thread(lambda: conditional_update(self.inventory.pk, 1, stock=8))
+            return conditional_update(*args, **kwargs)
+
+        with mock.patch('api.views.conditional_update', bump_then_update):
+            response = self.client.patch(self.url, {"stock": 5}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.version), (8, 2))
+
+    def test_concurrent_decrements_never_go_below_zero(self):
+        workers = 8
+        barrier = threading.Barrier(workers)
+        sold, refused = [], []
+
+        def buy():
+            barrier.wait()
+            try:
+                decrement_stock(self.branch.pk, self.product.pk, 3)
+                sold.append(3)
+            except (InsufficientStock, StockConflict):
+                refused.append(3)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.inventory.refresh_from_db()
+        self.assertEqual(len(sold) + len(refused), workers)
+        self.assertLessEqual(len(sold), 3)
+        self.assertEqual(self.inventory.stock, 10 - sum(sold))
+        self.assertGreaterEqual(self.inventory.stock, 0)
+        self.assertEqual(self.inventory.version, 1 + len(sold))
+
+
+class ExpiredReservationTests(TransactionTestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        self.branch = Branch.objects.create(company=company, name="Centro", phone="+56912345678")
+        self.product = Product.objects.create(company=company, sku="CAFE-1", name="Café", category="Bebidas",
+                                              price=Decimal('2500'), cost=Decimal('1200'))
+        self.inventory = Inventory.objects.create(branch=self.branch, product=self.product, stock=5)
+        self.user = CustomUser.objects.create_user(username="cliente", password="clave-segura", rut="12.345.678-5",
+                                                   company=company)
+        reservations.reserve(self.user, self.product.pk, 4)
+
+    def expire(self):
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_decrement_releases_expired_reservations(self):
+        self.expire()
+        decrement_stock(self.branch.pk, self.product.pk, 3)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.reserved), (2, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_decrement_locked_releases_expired_reservations(self):
+        self.expire()
+        with transaction.atomic():
+            decrement_stock_locked(self.branch.pk, self.product.pk, 3)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.reserved), (2, 0))
+
+    def test_active_reservations_still_block(self):
+        with self.assertRaises(InsufficientStock):
+            decrement_stock(self.branch.pk, self.product.pk, 3)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_clearing_the_cart_releases_reservations(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.delete('/api/cart/').status_code, 204)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.reserved), (5, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class ChangeFeedTests(TransactionTestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        self.other = Company.objects.create(name="Otra", rut="77.654.321-2", phone="+56987654321")
+        self.branch = Branch.objects.create(company=self.company, name="Centro", phone="+56912345678")
+        self.other_branch = Branch.objects.create(company=self.other, name="Norte", phone="+56987654321")
+
+    def product(self, company, branch, sku):
+        product = Product.objects.create(company=company, sku=sku, name=sku, category="Bebidas",
+                                         price=Decimal('1000'), cost=Decimal('500'))
+        Inventory.objects.create(branch=branch, product=product, stock=5)
+        return product
+
+    def test_row_committed_after_the_snapshot_floor_comes_in_the_next_poll(self):
+        product = self.product(self.company, self.branch, "CAFE-1")
+        written, release = threading.Event(), threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    Product.objects.filter(pk=product.pk).update(name="Café de grano")
+                    written.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        written.wait(5)
+        first = change_feed('0', company_id=self.company.pk)
+        release.set()
+        thread.join()
+
+        self.assertEqual([row["name"] for row in first["products"]], ["CAFE-1"])
+        second = change_feed(first["cursor"], company_id=self.company.pk)
+        self.assertEqual([row["name"] for row in second["products"]], ["Café de grano"])
+
+    def test_paging_neither_skips_nor_repeats_rows(self):
+        for n in range(7):
+            self.product(self.company, self.branch, f"CAFE-{n}")
+        Product.objects.filter(sku="CAFE-3").delete()
+        everything = change_feed('0', company_id=self.company.pk, limit=1000)
+        self.assertFalse(everything["has_more"])
+
+        seen = {"products": [], "inventory": [], "deleted": []}
+        cursor, pages = '0', 0
+        while True:
+            page = change_feed(cursor, company_id=self.company.pk, limit=3)
+            pages += 1
+            seen["products"] += [row["id"] for row in page["products"]]
+            seen["inventory"] += [row["id"] for row in page["inventory"]]
+            seen["deleted"] += [("product", pk) for pk in page["deleted"]["product"]]
+            seen["deleted"] += [("inventory", pk) for pk in page["deleted"]["inventory"]]
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+
+        self.assertGreater(pages, 1)
+        for key, rows in seen.items():
+            self.assertEqual(len(rows), len(set(rows)), key)
+        self.assertEqual(sorted(seen["products"]), sorted(row["id"] for row in everything["products"]))
+        self.assertEqual(sorted(seen["inventory"]), sorted(row["id"] for row in everything["inventory"]))
+        self.assertEqual(len(seen["deleted"]), 2)
+        self.assertEqual(cursor, everything["cursor"])
+
+    def test_tenant_only_receives_its_own_changes(self):
+        own = [self.product(self.company, self.branch, f"CAFE-{n}") for n in range(2)]
+        foreign = [self.product(self.other, self.other_branch, f"TE-{n}") for n in range(2)]
+        own_deleted, foreign_deleted = own.pop().pk, foreign.pop().pk
+        Product.objects.filter(pk__in=[own_deleted, foreign_deleted]).delete()
+        Inventory.objects.filter(product=foreign[0]).delete()
+
+        feed = change_feed('0', company_id=self.company.pk)
+        self.assertEqual([row["id"] for row in feed["products"]], [own[0].pk])
+        self.assertEqual({row["branch_id"] for row in feed["inventory"]}, {self.branch.pk})
+        self.assertEqual(feed["deleted"]["product"], [own_deleted])
+        own_inventory = set(ChangeTombstone.objects.filter(entity='inventory', branch_id=self.branch.pk)
+                            .values_list('entity_id', flat=True))
+        self.assertEqual(set(feed["deleted"]["inventory"]), own_inventory)
+
+
+class StreamTicketTests(TransactionTestCase):
+    def setUp(self):
+        caches['tickets'].clear()
+        company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        self.user = CustomUser.objects.create_user(username="vendedor", password="clave-segura", rut="12.345.678-5",
+                                                   company=company)
+
+    def ticket(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/stream/ticket/')
+        self.assertEqual(response.status_code, 201)
+        return response.json()["ticket"]
+
+    def test_ticket_is_single_use(self):
+        ticket = self.ticket()
+        self.assertEqual(events._redeem(ticket), self.user)
+        self.assertIsNone(events._redeem(ticket))
+
+    def test_tampered_or_expired_ticket_is_rejected(self):
+        ticket = self.ticket()
+        self.assertIsNone(events._redeem(ticket.replace(f"{self.user.pk}:", f"{self.user.pk + 1}:", 1)))
+        with self.settings(EVENT_STREAM_TICKET_TTL=-1):
+            self.assertIsNone(events._redeem(ticket))
+
+
+class SalesReportParamsTests(TransactionTestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Tienda", rut="76.123.456-7", phone="+56912345678")
+        user = CustomUser.objects.create_user(username="vendedor", password="clave-segura", rut="12.345.678-5",
+                                              company=company, role="vendedor")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_invalid_params_are_rejected_before_enqueueing(self):
+        for query in ("date_from=foo", "date_to=2026-02-30", "branch=uno"):
+            for suffix in ("", "&async=1"):
+                response = self.client.get(f'/api/reports/sales/?{query}{suffix}')
+                self.assertEqual(response.status_code, 400, query + suffix)
+        self.assertFalse(Job.objects.exists())
@@ -1,11 +1,26 @@
-from rest_framework import viewsets
+import gzip
+import os
+
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.serializers import BaseSerializer
 from rest_framework.exceptions import ValidationError
-from django.db.models import Sum
-from .models import Product, Inventory, Supplier, Branch, CustomUser, Sale, Order, Company, Subscription, Cart, CartItem, Purchase
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Sum
+from django.utils.dateparse import parse_date
+from .models import profit_margin_expression, inventory_valuation_expression
+from .models import Product, Inventory, Supplier, Branch, CustomUser, Sale, Order, OrderItem, Company, Subscription, Purchase, PurchaseReceipt, Job, AuditEvent, RequestProfile
+from .models import ProductSalesRollup, SalesRollup
 from .serializers import (
     ProductSerializer,
     InventorySerializer,
@@ -14,12 +29,19 @@ from .serializers import (
     CustomUserSerializer,
     SaleSerializer,
     OrderSerializer,
+    OrderTransitionSerializer,
     CompanySerializer,
     UserRegistrationSerializer,
     SubscriptionSerializer,
-    CartSerializer,
     OrderItemSerializer,
     PurchaseSerializer,
+    InventoryAdjustSerializer,
+    PurchaseReceiptSerializer,
+    JobSerializer,
+    AuditEventSerializer,
+    RequestProfileDetailSerializer,
+    RequestProfileSerializer,
+    sparse_fieldset,
 )
 from rest_framework.permissions import BasePermission
 from rest_framework_simplejwt.authentication import JWTAuthentication
@@ -34,7 +56,19 @@ from .permissions import (
     SalesPermission,
     OrdersPermission,
     PurchasePermission,
+    AuditPermission,
 )
+from .filters import AuditEventFilter, InventoryFilter, ProductFilter
+from .archive import find_archived
+from .catalog import catalog_company_id, get_snapshot
+from .changes import change_feed
+from .orders import transition_orders
+from .projections import compile_projection
+from .stock import InsufficientStock, PreconditionFailed, StockConflict, apply_count_sheet, conditional_update, inventory_etag, parse_if_match
+from .reports import archived_sales_report, dashboard_summary, filter_sales, sales_analytics, sales_report, stock_report, user_profile
+from .jobs import enqueue
+from .idempotency import idempotent
+from . import audit, carts, events, logs, querystats, reservations
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -43,6 +77,135 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+def _select_related_paths(tree, prefix=''):
+    for name, children in tree.items():
+        yield prefix + name
+        yield from _select_related_paths(children, f"{prefix}{name}__")
+
+
+class SparseQuerysetMixin:
+    """Aplica `?fields=` / `?omit=` también al queryset con `.only()`.
+
+    Solo se recortan columnas cuando cada campo pedido sale de una columna propia
+    del modelo, una relación o una anotación; si alguno depende de una propiedad
+    se deja el queryset completo para no provocar consultas extra por fila.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields, omit = sparse_fieldset(self.request)
+        if fields is None and not omit:
+            return queryset
+
+        model = queryset.model
+        serializer = self.get_serializer()
+        columns = {model._meta.pk.name}
+        traversed = set()
+        for field in serializer.fields.values():
+            head = field.source.split('.')[0]
+            if head in queryset.query.annotations:
+                continue
+            try:
+                model_field = model._meta.get_field(head)
+            except FieldDoesNotExist:
+                return queryset
+            if model_field.concrete:
+                columns.add(model_field.name)
+            elif not model_field.is_relation:
+                return queryset
+            # Un PrimaryKeyRelatedField solo necesita la columna `<fk>_id`, no el JOIN
+            if '.' in field.source or isinstance(field, BaseSerializer):
+                traversed.add(head)
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            keep = [path for path in _select_related_paths(select_related) if path.split('__')[0] in traversed]
+            queryset = queryset.select_related(None)
+            if keep:
+                queryset = queryset.select_related(*keep)
+        return queryset.only(*columns)
+
+
+class ValuesListMixin:
+    """Responde los GET de listado con `values_list()` en vez de instancias (ver api.projections).
+
+    Si el serializer tiene algún campo no proyectable, o `LIST_VALUES_PROJECTION`
+    está apagado, lista con el serializer como siempre.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        projection = None
+        if settings.LIST_VALUES_PROJECTION:
+            projection = compile_projection(self.get_serializer(), queryset)
+        if projection is not None:
+            queryset = projection.values(queryset)
+
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        data = projection.rows(rows) if projection is not None else self.get_serializer(rows, many=True).data
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+
+def wants_async(request):
+    return request.query_params.get('async') in ('1', 'true')
+
+
+def enqueue_response(request, kind, params):
+    """Encola el trabajo `kind` con el alcance de empresa del usuario y responde 202."""
+    user = request.user
+    job = enqueue(kind, {
+        "params": params,
+        "company_id": getattr(user, "company_id", None),
+        "all_companies": getattr(user, "role", None) == "super_admin",
+    }, user=user)
+    return Response({
+        "job": job.id,
+        "status": job.status,
+        "url": reverse('job-detail', args=[job.id], request=request),
+    }, status=202)
+
+
+class LogStatsView(APIView):
+    """Contadores del logging asíncrono de este proceso: encolados, descartados por cola llena y fuera de muestra."""
+    permission_classes = [IsAuthenticated, IsSuperAdminTemucoSoft]
+
+    def get(self, request):
+        return Response(logs.stats())
+
+
+class QueryStatsView(APIView):
+    """Top de consultas por tiempo de base de datos, agrupadas por huella SQL y endpoint (ver api.querystats).
+
+    `?top=` (máx. 500), `?order=total|calls|max|avg`, `?endpoint=<nombre de URL>`.
+    DELETE borra lo acumulado.
+    """
+    permission_classes = [IsAuthenticated, IsSuperAdminTemucoSoft]
+
+    def get(self, request):
+        order = request.GET.get('order', 'total')
+        if order not in querystats.ORDERINGS:
+            return Response({"detail": f"Orden inválido; use uno de {sorted(querystats.ORDERINGS)}"}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('top', 50)), 1), 500)
+        except ValueError:
+            return Response({"detail": "top debe ser un entero"}, status=400)
+        # Lo de este proceso se vuelca antes de leer; los demás workers lo hacen en su intervalo
+        querystats.flush()
+        return Response({
+            "stats": querystats.stats(),
+            "results": querystats.top(limit, order, request.GET.get('endpoint') or None),
+        })
+
+    def delete(self, request):
+        querystats.reset()
+        return Response(status=204)
+
+
 class BillingPlansView(APIView):
     permission_classes = [IsAuthenticated, IsSuperAdminTemucoSoft]
 
@@ -181,86 +344,253 @@ class SalesReportView(APIView):
     permission_classes = [SalesPermission]
 
     def get(self, request):
-        qs = Sale.objects.select_related('branch')
         user = request.user
+        params = {
+            "branch_id": request.GET.get('branch') or None,
+            "date_from": request.GET.get('date_from') or None,
+            "date_to": request.GET.get('date_to') or None,
+        }
+        # Antes de encolar: un parámetro inválido es un 400 aquí y no un trabajo fallido después
+        for value in (params["date_from"], params["date_to"]):
+            try:
+                valid = value is None or parse_date(value) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                return Response({"detail": "Fecha inválida, use el formato AAAA-MM-DD"}, status=400)
+        if params["branch_id"] and not params["branch_id"].isdigit():
+            return Response({"detail": "Sucursal inválida"}, status=400)
+        if wants_async(request):
+            return enqueue_response(request, 'report.sales', params)
+        qs = Sale.objects.all()
         if getattr(user, "role", None) != "super_admin":
             qs = qs.filter(branch__company_id=getattr(user, "company_id", None))
-        branch = request.GET.get('branch')
-        date_from = request.GET.get('date_from')
-        date_to = request.GET.get('date_to')
+        return Response(sales_report(filter_sales(qs, **params)))
+
+
+class ArchivedSalesReportView(APIView):
+    """Totales de las ventas ya archivadas (rollups diarios; ver api.archive)."""
+    permission_classes = [SalesPermission]
+
+    def get(self, request):
+        user = request.user
+        branch = request.GET.get('branch') or None
+        date_from = request.GET.get('date_from') or None
+        date_to = request.GET.get('date_to') or None
+        for value in (date_from, date_to):
+            try:
+                valid = value is None or parse_date(value) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                return Response({"detail": "Fecha inválida, use el formato AAAA-MM-DD"}, status=400)
+        if branch and not branch.isdigit():
+            return Response({"detail": "Sucursal inválida"}, status=400)
+
+        sales, products = SalesRollup.objects.all(), ProductSalesRollup.objects.all()
+        filters = {}
+        if getattr(user, "role", None) != "super_admin":
+            filters["branch__company_id"] = getattr(user, "company_id", None)
         if branch:
-            qs = qs.filter(branch_id=branch)
+            filters["branch_id"] = branch
         if date_from:
-            qs = qs.filter(created_at__date__gte=date_from)
+            filters["day__gte"] = date_from
         if date_to:
-            qs = qs.filter(created_at__date__lte=date_to)
-        total = qs.aggregate(total=Sum('total'))['total'] or 0
-        rows = [
-            {
-                "branch": s.branch.name,
-                "total": s.total,
-                "payment_method": s.payment_method,
-                "created_at": s.created_at,
-            }
-            for s in qs.order_by('-created_at')[:100]
-        ]
-        return Response({"total": total, "rows": rows})
+            filters["day__lte"] = date_to
+        return Response(archived_sales_report(sales.filter(**filters), products.filter(**filters)))
+
+
+class ArchivedRecordView(APIView):
+    """Lectura puntual (lenta) de una venta u orden archivada: descomprime su lote."""
+    permission_classes = [SalesPermission]
+    kinds = {'sales': 'sale', 'orders': 'order'}
+
+    def get(self, request, kind, pk):
+        if kind not in self.kinds:
+            return Response({"detail": "Tipo de registro inválido"}, status=404)
+        record = find_archived(self.kinds[kind], pk)
+        user = request.user
+        if (
+            record is not None and kind == 'sales' and getattr(user, "role", None) != "super_admin"
+            and record.get("company_id") != getattr(user, "company_id", None)
+        ):
+            record = None
+        if record is None:
+            return Response({"detail": "Registro archivado no encontrado"}, status=404)
+        return Response(record)
+
+
+class ChangeFeedView(APIView):
+    """Productos, precios e inventario modificados desde `?since=<cursor>` (ver api.changes)."""
+    permission_classes = [InventoryPermission]
+
+    def get(self, request):
+        user = request.user
+        branch = request.GET.get('branch') or None
+        if branch and not branch.isdigit():
+            return Response({"detail": "Sucursal inválida"}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', settings.CHANGE_FEED_PAGE_SIZE)), 1), 5000)
+        except ValueError:
+            return Response({"detail": "El parámetro limit debe ser un entero"}, status=400)
+        company_id = None if getattr(user, "role", None) == "super_admin" else getattr(user, "company_id", None)
+        try:
+            data = change_feed(request.GET.get('since'), company_id=company_id, branch_id=branch and int(branch), limit=limit)
+        except ValueError:
+            return Response({"detail": "Cursor inválido; use el valor de `cursor` de la respuesta anterior o 0"}, status=400)
+        return Response(data)
+
+
+class StreamTicketView(APIView):
+    """Ticket de un solo uso para abrir /api/stream/ sin poner el JWT en la URL (ver api.events)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if getattr(request.user, "role", None) not in events.STREAM_ROLES:
+            return Response({"detail": "No tienes permiso para este canal"}, status=403)
+        return Response({"ticket": events.issue_ticket(request.user), "expires_in": settings.EVENT_STREAM_TICKET_TTL}, status=201)
+
+
+class CatalogSnapshotView(APIView):
+    """Catálogo completo de `?branch=` en un JSON gzip con ETag fuerte; luego se sigue con /api/changes/."""
+    permission_classes = [InventoryPermission]
+
+    def get(self, request):
+        user = request.user
+        branch_id = request.GET.get('branch') or ''
+        if not branch_id.isdigit():
+            return Response({"detail": "Debe indicar una sucursal válida en ?branch="}, status=400)
+        branches = Branch.objects.all()
+        if getattr(user, "role", None) != "super_admin":
+            branches = branches.filter(company_id=getattr(user, "company_id", None))
+        branch = branches.filter(id=int(branch_id)).first()
+        if branch is None:
+            return Response({"detail": "Sucursal no encontrada"}, status=404)
+
+        snapshot = get_snapshot(branch)
+        etag = f'"{snapshot.etag}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'X-Catalog-Version': str(snapshot.version)}
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=304, headers=headers)
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = FileResponse(snapshot.file.open('rb'), content_type='application/json', headers=headers)
+            response['Content-Encoding'] = 'gzip'
+            del response['Content-Disposition']
+        else:
+            with snapshot.file.open('rb') as f:
+                response = HttpResponse(gzip.decompress(f.read()), content_type='application/json', headers=headers)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
+class SalesAnalyticsView(APIView):
+    permission_classes = [SalesPermission]
+
+    def get(self, request):
+        user = request.user
+        is_super = getattr(user, "role", None) == "super_admin"
+        branch = request.GET.get('branch') or None
+        date_from = request.GET.get('date_from') or None
+        date_to = request.GET.get('date_to') or None
+        for value in (date_from, date_to):
+            try:
+                valid = value is None or parse_date(value) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                return Response({"detail": "Fecha inválida, use el formato AAAA-MM-DD"}, status=400)
+        if branch and not branch.isdigit():
+            return Response({"detail": "Sucursal inválida"}, status=400)
+        try:
+            top = min(max(int(request.GET.get('top', 10)), 1), 50)
+        except ValueError:
+            return Response({"detail": "El parámetro top debe ser un entero"}, status=400)
+
+        if wants_async(request):
+            return enqueue_response(request, 'report.analytics', {
+                "branch_id": branch, "date_from": date_from, "date_to": date_to, "top": top,
+            })
+
+        tenant = "all" if is_super else getattr(user, "company_id", None)
+        cache_key = f"analytics:{tenant}:{branch}:{date_from}:{date_to}:{top}"
+        data = cache.get(cache_key)
+        if data is None:
+            qs = Sale.objects.all()
+            if not is_super:
+                qs = qs.filter(branch__company_id=getattr(user, "company_id", None))
+            qs = filter_sales(qs, branch_id=branch, date_from=date_from, date_to=date_to)
+            data = sales_analytics(qs, top=top)
+            cache.set(cache_key, data, settings.ANALYTICS_CACHE_TIMEOUT)
+        return Response(data)
 
 
 class StockReportView(APIView):
     permission_classes = [InventoryPermission]
 
     def get(self, request):
-        qs = Inventory.objects.select_related('branch', 'product')
+        if wants_async(request):
+            return enqueue_response(request, 'report.stock', {})
+        qs = Inventory.objects.all()
         user = request.user
         if getattr(user, "role", None) != "super_admin":
             qs = qs.filter(branch__company_id=getattr(user, "company_id", None))
-        data = [
-            {
-                "branch": inv.branch.name,
-                "product": inv.product.name,
-                "sku": inv.product.sku,
-                "stock": inv.stock,
-                "reorder_point": inv.reorder_point,
-                "status": inv.stock_status,
-            }
-            for inv in qs
-        ]
-        return Response(data)
+        return Response(stock_report(qs))
 
 
 class CartCheckoutView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         user = request.user
-        cart = Cart.objects.filter(user=user).first()
-        if not cart or cart.items.count() == 0:
-            return Response({"detail": "Carrito vacío"}, status=400)
-        total = sum(item.subtotal for item in cart.items.all())
+        try:
+            with transaction.atomic():
+                # Sin Redis, un agregado en otro worker espera a que termine el checkout
+                state = carts.load_cart(user, lock=True)
+                if not state["items"]:
+                    return Response({"detail": "Carrito vacío"}, status=400)
+                existing = set(Product.objects.filter(id__in=[int(pid) for pid in state["items"]]).values_list('id', flat=True))
+                reservations.checkout(user, {
+                    int(pid): item["quantity"] for pid, item in state["items"].items() if int(pid) in existing
+                })
+                order = self.create_order(user, state, existing)
+        except InsufficientStock as exc:
+            return Response({"detail": "Stock insuficiente", "product": exc.product_id}, status=409)
+        return Response(OrderSerializer(order).data, status=201)
+
+    def create_order(self, user, state, existing):
         order = Order.objects.create(
             customer_name=user.username,
             customer_email=user.email,
             customer_phone="+56900000000",
-            total=total,
+            total=carts.cart_total(state),
             status="pending",
             shipping_address="",
             notes="Checkout desde carrito",
         )
-        from .models import OrderItem as OI
-        for item in cart.items.all():
-            OI.objects.create(order=order, product=item.product, quantity=item.quantity, price=item.price)
-        cart.items.all().delete()
-        cart.delete()
-        return Response(OrderSerializer(order).data, status=201)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=int(pid) if int(pid) in existing else None,
+                      quantity=item["quantity"], price=item["price"])
+            for pid, item in state["items"].items()
+        ])
+        carts.clear_cart(user, checked_out=state)
+        audit.record('order.create', 'order', order.id, user=user, total=order.total,
+                     items=[{"product": int(pid), "quantity": item["quantity"]} for pid, item in state["items"].items()])
+        return order
 
 
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        return Response(CartSerializer(cart).data)
+        return Response(carts.cart_representation(carts.load_cart(request.user)))
+
+    def delete(self, request):
+        """Vacía el carrito y devuelve al inventario el stock que tenía reservado."""
+        with transaction.atomic():
+            carts.clear_cart(request.user)
+            reservations.release(request.user)
+        return Response(status=204)
 
 
 class CartAddView(APIView):
@@ -275,21 +605,22 @@ class CartAddView(APIView):
             quantity = 1
         if quantity < 1:
             return Response({"detail": "Cantidad inválida"}, status=400)
+        products = Product.objects.only('id', 'name', 'sku', 'price')
+        company_id = catalog_company_id(request)
+        if company_id is not None:
+            products = products.filter(company_id=company_id)
         try:
-            product = Product.objects.get(id=product_id)
+            product = products.get(id=product_id)
         except Product.DoesNotExist:
             return Response({"detail": "Producto no encontrado"}, status=404)
-        cart, _ = Cart.objects.get_or_create(user=user)
-        item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={"quantity": quantity, "price": product.price},
-        )
-        if not created:
-            item.quantity += quantity
-            item.price = product.price
-            item.save()
-        return Response(CartSerializer(cart).data, status=201)
+        try:
+            # Si falla el carrito, la reserva se revierte con él
+            with transaction.atomic():
+                reservations.reserve(user, product.id, quantity)
+                state = carts.add_item(user, product, quantity)
+        except InsufficientStock as exc:
+            return Response({"detail": f"Stock insuficiente para {product.name}", "available": exc.available}, status=409)
+        return Response(carts.cart_representation(state), status=201)
 
 
 class SubscriptionMyCompanyView(APIView):
@@ -311,32 +642,107 @@ class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        data = {
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'rut': user.rut,
-            'company': user.company.name if user.company else None,
-            'is_active': user.is_active,
-            'created_at': user.created_at
-        }
+        return Response(user_profile(request.user))
+
+
+class DashboardSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        cache_key = f"dashboard:{request.user.pk}"
+        data = cache.get(cache_key)
+        if data is None:
+            data = dashboard_summary(request.user)
+            cache.set(cache_key, data, settings.DASHBOARD_CACHE_TIMEOUT)
         return Response(data)
 
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+class JobViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if getattr(user, "role", None) == "super_admin":
+            return self.queryset
+        return self.queryset.filter(created_by=user)
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'done' or not job.artifact:
+            return Response({"detail": "El trabajo aún no tiene resultado", "status": job.status}, status=409)
+        return FileResponse(job.artifact.open('rb'), as_attachment=True, filename=os.path.basename(job.artifact.name))
+
+
+class AuditEventViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = AuditEvent.objects.all()
+    serializer_class = AuditEventSerializer
+    permission_classes = [AuditPermission]
+    pagination_class = StandardResultsSetPagination
+    filterset_class = AuditEventFilter
+    ordering_fields = ['created_at']
+
+    def get_queryset(self):
+        user = self.request.user
+        if getattr(user, "role", None) == "super_admin":
+            return self.queryset
+        return self.queryset.filter(company_id=getattr(user, "company_id", None))
+
+    @action(detail=False, permission_classes=[IsSuperAdminTemucoSoft])
+    def stats(self, request):
+        return Response(audit.stats())
+
+
+class RequestProfileViewSet(SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """Perfiles guardados por api.profiling; el detalle trae el SQL y las funciones más costosas."""
+    queryset = RequestProfile.objects.all()
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsSuperAdminTemucoSoft]
+    pagination_class = StandardResultsSetPagination
+    filterset_fields = ['kind', 'trigger', 'company', 'status']
+    ordering_fields = ['created_at', 'duration_ms', 'sql_ms', 'sql_count']
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RequestProfileDetailSerializer
+        return self.serializer_class
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        profile = self.get_object()
+        return FileResponse(profile.file.open('rb'), as_attachment=True, filename=os.path.basename(profile.file.name))
+
+
+class SubscriptionViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Subscription.objects.select_related("company")
     serializer_class = SubscriptionSerializer
     permission_classes = [IsSuperAdminTemucoSoft]
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [OrdersPermission]
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def transition(self, request):
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        status = serializer.validated_data['status']
+        moved, rejected = transition_orders(serializer.validated_data['ids'], status)
+        if moved:
+            audit.record('order.transition', 'order', user=request.user, status=status, orders=moved)
+        return Response({"status": status, "moved": moved, "rejected": rejected})
 
-class SaleViewSet(viewsets.ModelViewSet):
+
+class SaleViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.select_related("branch", "user")
     serializer_class = SaleSerializer
     permission_classes = [SalesPermission]
@@ -352,8 +758,12 @@ class SaleViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
 
-class CustomUserViewSet(viewsets.ModelViewSet):
+class CustomUserViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = [UserManagementPermission]
@@ -371,7 +781,7 @@ class IsSuperAdminOrAdminCliente(BasePermission):
         return request.user and (request.user.role == 'super_admin' or request.user.role == 'admin_cliente')
 
 
-class BranchViewSet(viewsets.ModelViewSet):
+class BranchViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
     permission_classes = [BranchPermission]
@@ -398,14 +808,14 @@ class BranchViewSet(viewsets.ModelViewSet):
             serializer.save(company=getattr(user, "company", None))
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [SupplierPermission]
     pagination_class = StandardResultsSetPagination
 
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.select_related("branch", "supplier", "product")
     serializer_class = PurchaseSerializer
     permission_classes = [PurchasePermission]
@@ -425,21 +835,138 @@ class PurchaseViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class InventoryViewSet(viewsets.ModelViewSet):
+class PurchaseReceiptViewSet(SparseQuerysetMixin,
+                             mixins.CreateModelMixin,
+                             mixins.ListModelMixin,
+                             mixins.RetrieveModelMixin,
+                             viewsets.GenericViewSet):
+    queryset = PurchaseReceipt.objects.select_related("branch", "supplier").prefetch_related("lines")
+    serializer_class = PurchaseReceiptSerializer
+    permission_classes = [PurchasePermission]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if getattr(user, "role", None) == "super_admin":
+            return self.queryset
+        return self.queryset.filter(branch__company_id=getattr(user, "company_id", None))
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        branch = serializer.validated_data.get("branch")
+        if getattr(user, "role", None) != "super_admin" and branch and branch.company_id != getattr(user, "company_id", None):
+            raise ValidationError({"branch": "No puedes registrar compras en otra empresa."})
+        serializer.save(created_by=user)
+
+
+class InventoryViewSet(ValuesListMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Inventory.objects.select_related("branch", "product")
     serializer_class = InventorySerializer
     permission_classes = [InventoryPermission]
     pagination_class = StandardResultsSetPagination
+    filterset_class = InventoryFilter
+    ordering_fields = ['stock', 'reorder_point', 'last_updated', 'valuation', 'product__name']
 
     def get_queryset(self):
         user = self.request.user
+        qs = self.queryset.annotate(valuation=inventory_valuation_expression())
         if getattr(user, "role", None) == "super_admin":
-            return self.queryset
-        return self.queryset.filter(branch__company_id=getattr(user, "company_id", None))
+            return qs
+        return qs.filter(branch__company_id=getattr(user, "company_id", None))
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, headers={'ETag': inventory_etag(instance)})
 
-class ProductViewSet(viewsets.ModelViewSet):
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = f'"{response.data["version"]}"'
+        return response
+
+    def perform_update(self, serializer):
+        # PUT/PATCH con `If-Match: "<version>"` solo escribe si nadie cambió la fila desde esa lectura
+        instance = serializer.instance
+        expected = parse_if_match(self.request)
+        diff = audit.changes(instance, serializer.validated_data)
+        if not conditional_update(instance.pk, instance.version if expected is None else expected, **serializer.validated_data):
+            raise PreconditionFailed() if expected is not None else StockConflict()
+        instance.refresh_from_db()
+        if diff:
+            audit.record('inventory.update', 'inventory', instance.pk, user=self.request.user,
+                         company_id=instance.branch.company_id, changes=diff, version=instance.version)
+        instance.__dict__.pop('valuation', None)
+
+    @action(detail=False)
+    def valuation(self, request):
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .values('branch_id', 'branch__name')
+            .annotate(items=Count('id'), units=Sum('stock'), valuation=Sum(inventory_valuation_expression()))
+            .order_by('branch__name')
+        )
+        return Response([
+            {
+                "branch": row['branch_id'],
+                "name": row['branch__name'],
+                "items": row['items'],
+                "units": row['units'],
+                "valuation": row['valuation'],
+            }
+            for row in rows
+        ])
+
+    @action(detail=False, methods=['post'])
+    def adjust(self, request):
+        serializer = InventoryAdjustSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        branch = serializer.validated_data['branch']
+        user = request.user
+        if getattr(user, "role", None) != "super_admin" and branch.company_id != getattr(user, "company_id", None):
+            raise ValidationError({"branch": "No puedes ajustar inventario de otra empresa."})
+        counts = [(line['product'], line['stock']) for line in serializer.validated_data['items']]
+        if wants_async(request):
+            return enqueue_response(request, 'inventory.adjust', {"branch": branch.id, "counts": counts})
+        with transaction.atomic():
+            deltas = apply_count_sheet(branch.id, counts)
+            audit.record('inventory.adjust', 'branch', branch.id, user=user, company_id=branch.company_id,
+                         deltas=[d for d in deltas if d["delta"]])
+        return Response({
+            "branch": branch.id,
+            "updated": sum(1 for d in deltas if not d["created"]),
+            "created": sum(1 for d in deltas if d["created"]),
+            "deltas": deltas,
+        })
+
+
+class ProductViewSet(ValuesListMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [ProductPermission]
     pagination_class = StandardResultsSetPagination
+    filterset_class = ProductFilter
+    ordering_fields = ['name', 'sku', 'price', 'cost', 'margin', 'created_at']
+
+    def get_queryset(self):
+        qs = self.queryset
+        company_id = catalog_company_id(self.request)
+        if company_id is not None:
+            qs = qs.filter(company_id=company_id)
+        return qs.annotate(margin=profit_margin_expression())
+
+    def perform_create(self, serializer):
+        product = serializer.save()
+        audit.record('product.create', 'product', product.pk, user=self.request.user, company_id=product.company_id,
+                     sku=product.sku, price=product.price, cost=product.cost)
+
+    def perform_update(self, serializer):
+        diff = audit.changes(serializer.instance, serializer.validated_data)
+        product = serializer.save()
+        if diff:
+            audit.record('product.update', 'product', product.pk, user=self.request.user,
+                         company_id=product.company_id, sku=product.sku, changes=diff)
+
+    def perform_destroy(self, instance):
+        audit.record('product.delete', 'product', instance.pk, user=self.request.user,
+                     company_id=instance.company_id, sku=instance.sku)
+        instance.delete()
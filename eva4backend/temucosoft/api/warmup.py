@@ -0,0 +1,135 @@
+"""Precalentamiento del proceso antes de aceptar tráfico.
+
+Con `gunicorn -c gunicorn.conf.py` la aplicación se carga una vez en el proceso
+maestro (`preload_app`) y `warm_up()` corre en `when_ready`, antes del fork: los
+workers heredan ya compilados los patrones de URL, la metadata de modelos que usan
+los serializers, las clases de DRF/permisos importadas y la caché local. Cada
+worker abre luego su propia conexión a la base en `post_worker_init`
+(`open_connections()`); las del maestro se cierran antes del fork.
+
+Cada paso se mide y se registra en el logger `api.warmup`, junto con `APP_RELEASE`,
+para seguir el tiempo de arranque entre versiones. `manage.py warmup` ejecuta lo mismo
+y muestra la tabla.
+"""
+import inspect
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def _walk_patterns(patterns, views):
+    count = 0
+    for pattern in patterns:
+        pattern.pattern.regex  # compila la expresión regular (perezosa en Django)
+        if isinstance(pattern, URLResolver):
+            count += _walk_patterns(pattern.url_patterns, views)
+        else:
+            count += 1
+            view = getattr(pattern.callback, 'cls', None) or getattr(pattern.callback, 'view_class', None)
+            if view is not None:
+                views.add(view)
+    return count
+
+
+def warm_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict  # llena las tablas de reverse() de todos los include()
+    views = set()
+    count = _walk_patterns(resolver.url_patterns, views)
+    return f"{count} rutas, {len(views)} vistas", views
+
+
+def warm_serializers():
+    from rest_framework.serializers import BaseSerializer
+
+    from . import serializers
+
+    built = failed = 0
+    for cls in vars(serializers).values():
+        if not (inspect.isclass(cls) and issubclass(cls, BaseSerializer) and cls.__module__ == serializers.__name__):
+            continue
+        try:
+            cls(context={}).fields
+            built += 1
+        except Exception:
+            logger.warning("No se pudieron construir los campos de %s", cls.__name__, exc_info=True)
+            failed += 1
+    return f"{built} serializers" + (f", {failed} con error" if failed else "")
+
+
+def warm_permissions(views):
+    from rest_framework.settings import api_settings
+
+    for name in api_settings.defaults:
+        getattr(api_settings, name)  # importa renderers, parsers y autenticadores configurados
+    ContentType.objects.get_for_models(*apps.get_models())
+    classes = set()
+    for view in views:
+        if not hasattr(view, 'get_permissions'):
+            continue
+        instance = view()
+        instance.get_authenticators()
+        classes.update(type(permission) for permission in instance.get_permissions())
+    return f"{len(classes)} clases de permiso, {ContentType.objects.count()} content types"
+
+
+def warm_catalog():
+    from .catalog import get_snapshot
+    from .models import Branch
+
+    branches = list(Branch.objects.all())
+    for branch in branches:
+        get_snapshot(branch)
+    return f"{len(branches)} snapshots de catálogo al día"
+
+
+def open_connections():
+    for conn in connections.all():
+        conn.ensure_connection()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    return f"{len(connections.all())} conexiones"
+
+
+def warm_up(catalog=None):
+    """Ejecuta todos los pasos y devuelve [(paso, milisegundos, detalle)]; un paso que falla no detiene el resto."""
+    catalog = settings.WARMUP_CATALOG if catalog is None else catalog
+    views = set()
+
+    def urls():
+        detail, found = warm_urls()
+        views.update(found)
+        return detail
+
+    steps = [
+        ("db", open_connections),
+        ("urls", urls),
+        ("serializers", warm_serializers),
+        ("permisos", lambda: warm_permissions(views)),
+    ]
+    if catalog:
+        steps.append(("catalogo", warm_catalog))
+
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            detail = step()
+        except Exception as exc:
+            logger.exception("Falló el paso %s del precalentamiento", name)
+            detail = f"error: {exc}"
+        timings.append((name, (time.perf_counter() - start) * 1000, detail))
+
+    total = sum(ms for _, ms, _ in timings)
+    logger.info(
+        "Precalentamiento release=%s total=%.1fms %s",
+        settings.APP_RELEASE, total, " ".join(f"{name}={ms:.1f}ms" for name, ms, _ in timings),
+    )
+    return timings
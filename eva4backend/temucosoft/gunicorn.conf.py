@@ -0,0 +1,32 @@
+"""Configuración de gunicorn con precalentamiento antes del fork (ver api.warmup).
+
+    gunicorn temucosoft.wsgi
+    gunicorn -k uvicorn.workers.UvicornWorker temucosoft.asgi:application   # con /api/stream/
+
+gunicorn lee este archivo automáticamente cuando se ejecuta desde este directorio.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# La aplicación se importa una vez en el maestro y los workers la heredan ya caliente
+preload_app = True
+
+
+def when_ready(server):
+    from django.db import connections
+
+    from api.warmup import warm_up
+
+    for name, ms, detail in warm_up():
+        server.log.info("warm-up %-12s %8.1f ms  %s", name, ms, detail)
+    # Un socket de base de datos no puede compartirse entre procesos
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    from api.warmup import open_connections
+
+    open_connections()
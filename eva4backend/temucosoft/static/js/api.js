@@ -59,7 +59,7 @@ class APIClient {
     }
 
     // Realizar peticiones autenticadas
-    async request(endpoint, method = "GET", body = null) {
+    async request(endpoint, method = "GET", body = null, extraHeaders = {}) {
         if (!this.token) {
             this.logout();
             throw new Error("Token ausente");
@@ -68,6 +68,7 @@ class APIClient {
         const headers = {
             "Content-Type": "application/json",
             Authorization: `Bearer ${this.token}`,
+            ...extraHeaders,
         };
 
         const options = {
@@ -136,6 +137,10 @@ class APIClient {
         return this.request("/profile/");
     }
 
+    getDashboardSummary() {
+        return this.request("/dashboard/summary/");
+    }
+
     getOrders() {
         return this.request("/orders/");
     }
@@ -148,8 +153,57 @@ class APIClient {
         return this.request("/sales/");
     }
 
-    createSale(saleData) {
-        return this.request("/sales/", "POST", saleData);
+    // La misma Idempotency-Key se reenvía si la petición se reintenta: el backend no duplica la venta
+    createSale(saleData, idempotencyKey = crypto.randomUUID()) {
+        return this.request("/sales/", "POST", saleData, { "Idempotency-Key": idempotencyKey });
+    }
+
+    getAnalytics(params = {}) {
+        const query = new URLSearchParams(params).toString();
+        return this.request(`/reports/analytics/${query ? `?${query}` : ""}`);
+    }
+
+    // Catálogo completo de la sucursal (arranque en frío); continuar con getChanges(snapshot.cursor)
+    getCatalogSnapshot(branch) {
+        return this.request(`/catalog/snapshot/?branch=${branch}`);
+    }
+
+    // Feed incremental para el POS: repetir con `cursor` mientras `has_more` y guardar el último cursor
+    getChanges(since = "0", params = {}) {
+        const query = new URLSearchParams({ ...params, since }).toString();
+        return this.request(`/changes/?${query}`);
+    }
+
+    // Eventos en vivo (SSE): handlers = { inventory(evt), sale(evt), resync(evt) }. Devuelve una función para cerrar.
+    openStream(handlers = {}, params = {}) {
+        let source = null;
+        let closed = false;
+        const connect = async () => {
+            // El JWT no va en la URL: se canjea por un ticket de un solo uso que vence en segundos
+            let ticket;
+            try {
+                ({ ticket } = await this.request("/stream/ticket/", "POST"));
+            } catch (_) {
+                // sin sesión: la página sigue funcionando con recargas manuales
+                return;
+            }
+            if (closed) return;
+            const query = new URLSearchParams({ ...params, ticket }).toString();
+            source = new EventSource(`${API_BASE_URL}/stream/?${query}`);
+            Object.entries(handlers).forEach(([type, handler]) => {
+                source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+            });
+            source.onerror = () => {
+                // Al reconectar solo, el navegador repite el ticket ya usado y recibe 401: pedir otro
+                if (closed || source.readyState !== EventSource.CLOSED) return;
+                setTimeout(connect, 1000);
+            };
+        };
+        connect();
+        return () => {
+            closed = true;
+            if (source) source.close();
+        };
     }
 
     getSuppliers() {
@@ -173,8 +227,12 @@ class APIClient {
         return this.request("/cart/", "GET");
     }
 
-    checkoutCart() {
-        return this.request("/cart/checkout/", "POST", {});
+    clearCart() {
+        return this.request("/cart/", "DELETE");
+    }
+
+    checkoutCart(idempotencyKey = crypto.randomUUID()) {
+        return this.request("/cart/checkout/", "POST", {}, { "Idempotency-Key": idempotencyKey });
     }
 
     isAuthenticated() {
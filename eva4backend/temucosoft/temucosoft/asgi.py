@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'temucosoft.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# /api/stream/ (eventos en vivo por SSE) se atiende antes de llegar a Django; ver api.events
+from api.events import with_event_stream  # noqa: E402
+# Las estadísticas de consultas se activan en el proceso que atiende solicitudes, no en el maestro; ver api.querystats
+from api.querystats import serving  # noqa: E402
+
+application = serving(with_event_stream(django_application))
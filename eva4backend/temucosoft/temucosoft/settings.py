@@ -44,12 +44,14 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'api.logs.RequestLogMiddleware',  # primero: la latencia registrada incluye todo el resto
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS debe ir antes de CommonMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',  # ?_profile=1 para super_admin; necesita request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -154,8 +156,12 @@ REST_FRAMEWORK = {
 
     # Other
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -201,6 +207,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -211,19 +218,114 @@ CORS_ALLOW_HEADERS = [
 AUTH_USER_MODEL = 'api.CustomUser'
 
 
+# Cache: por defecto en memoria local; en producción conviene un backend compartido
+# entre workers (p. ej. django.core.cache.backends.db.DatabaseCache o Redis).
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='temucosoft'),
+    },
+    # Carritos (api.carts): solo con Redis (django.core.cache.backends.redis.RedisCache, requiere
+    # el paquete redis) viven en cache con persistencia diferida; con cualquier otro backend se
+    # escriben directamente en Cart/CartItem
+    'carts': {
+        'BACKEND': config('CART_CACHE_BACKEND', default='django.core.cache.backends.dummy.DummyCache'),
+        'LOCATION': config('CART_CACHE_LOCATION', default=''),
+    },
+    # Tickets usados de /api/stream/ (api.events): también compartida, el ticket se pide en un worker y se canjea en otro
+    'tickets': {
+        'BACKEND': config('TICKET_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('TICKET_CACHE_LOCATION', default='api_ticket_cache'),
+    },
+}
+
+# Segundos que se reutiliza el resultado de /api/reports/analytics/ por (empresa, rango)
+ANALYTICS_CACHE_TIMEOUT = config('ANALYTICS_CACHE_TIMEOUT', default=300, cast=int)
+# Segundos que se reutiliza /api/dashboard/summary/ por usuario
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=30, cast=int)
+
+# Carritos en Redis (api.carts): vida del carrito y cada cuánto se persiste en Cart/CartItem
+CART_CACHE_TIMEOUT = config('CART_CACHE_TIMEOUT', default=7 * 24 * 3600, cast=int)
+CART_FLUSH_INTERVAL = config('CART_FLUSH_INTERVAL', default=300, cast=int)
+# Segundos que un carrito retiene el stock reservado (api.reservations / manage.py release_reservations)
+STOCK_RESERVATION_TTL = config('STOCK_RESERVATION_TTL', default=15 * 60, cast=int)
+# Sucursal que despacha el e-commerce; 0 reserva en la sucursal con más stock disponible
+ECOMMERCE_BRANCH_ID = config('ECOMMERCE_BRANCH_ID', default=0, cast=int)
+# Empresa cuyo catálogo ven los visitantes y clientes sin empresa (se puede cambiar con ?company=); 0 muestra todas
+ECOMMERCE_COMPANY_ID = config('ECOMMERCE_COMPANY_ID', default=0, cast=int)
+
+# Meses futuros con partición de ventas ya creada (manage.py sale_partitions; ver api.partitions)
+SALE_PARTITIONS_AHEAD = config('SALE_PARTITIONS_AHEAD', default=3, cast=int)
+
+# Filas por página de /api/changes/ (feed incremental para los POS)
+CHANGE_FEED_PAGE_SIZE = config('CHANGE_FEED_PAGE_SIZE', default=1000, cast=int)
+
+# Canal SSE /api/stream/ (api.events, solo con servidor ASGI)
+EVENT_STREAM_HEARTBEAT = config('EVENT_STREAM_HEARTBEAT', default=15, cast=int)  # segundos entre pings
+EVENT_STREAM_QUEUE_SIZE = config('EVENT_STREAM_QUEUE_SIZE', default=100, cast=int)  # eventos pendientes por cliente
+EVENT_STREAM_RECONNECT = config('EVENT_STREAM_RECONNECT', default=2, cast=int)  # segundos antes de reabrir LISTEN
+EVENT_STREAM_TICKET_TTL = config('EVENT_STREAM_TICKET_TTL', default=10, cast=int)  # segundos de validez de un ticket de /api/stream/ticket/
+
+# Precalentamiento previo al fork de gunicorn (api.warmup / gunicorn.conf.py)
+APP_RELEASE = config('APP_RELEASE', default='dev')  # etiqueta de versión en el log de tiempos de arranque
+WARMUP_CATALOG = config('WARMUP_CATALOG', default=True, cast=bool)  # regenerar snapshots de catálogo al arrancar
+
+# Listados de productos e inventario con values_list() en vez de ModelSerializer (api.projections)
+LIST_VALUES_PROJECTION = config('LIST_VALUES_PROJECTION', default=True, cast=bool)
+
+# Segundos que se guarda la respuesta de un POST con Idempotency-Key (api.idempotency)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 3600, cast=int)
+
+# Reintentos de una escritura optimista de Inventory (UPDATE ... WHERE version = n) antes de responder 409
+INVENTORY_UPDATE_RETRIES = config('INVENTORY_UPDATE_RETRIES', default=5, cast=int)
+
+
+# Cola de trabajos en segundo plano (api.jobs / manage.py run_workers)
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=30, cast=int)  # segundos, con backoff exponencial
+JOB_STALE_AFTER = config('JOB_STALE_AFTER', default=3600, cast=int)  # segundos en `running` antes de reencolar
+JOB_DB_ERROR_MAX_DELAY = config('JOB_DB_ERROR_MAX_DELAY', default=30, cast=int)  # espera máxima de un worker tras un error de base de datos
+
+# Auditoría por lotes (api.audit): un hilo por proceso escribe cada AUDIT_FLUSH_INTERVAL ms o AUDIT_BATCH_SIZE eventos
+AUDIT_ASYNC = config('AUDIT_ASYNC', default=True, cast=bool)
+AUDIT_QUEUE_SIZE = config('AUDIT_QUEUE_SIZE', default=10000, cast=int)
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=200, cast=int)
+# Con la cola llena: 'sync' escribe en la solicitud, 'block' espera AUDIT_BLOCK_TIMEOUT ms, 'drop' descarta
+AUDIT_OVERFLOW = config('AUDIT_OVERFLOW', default='sync')
+AUDIT_BLOCK_TIMEOUT = config('AUDIT_BLOCK_TIMEOUT', default=50, cast=int)
+
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Logging sin bloqueo (api.logs): los hilos de las solicitudes solo encolan; un hilo
+# por proceso escribe JSON en stderr y, desde ERROR, también en logs/django.log
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)  # registros en espera; el resto se descarta y se cuenta
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=1.0, cast=float)  # fracción de solicitudes con DEBUG/INFO
+LOG_SLOW_REQUEST_MS = config('LOG_SLOW_REQUEST_MS', default=1000, cast=int)  # desde aquí la solicitud se registra como WARNING
+
+# Perfilado de solicitudes (api.profiling): ?_profile=1|sample para super_admin
+PROFILE_SLOW_SAMPLE_RATE = config('PROFILE_SLOW_SAMPLE_RATE', default=0.0, cast=float)  # fracción de solicitudes muestreadas en busca de lentas
+PROFILE_SLOW_MS = config('PROFILE_SLOW_MS', default=2000, cast=int)  # una solicitud muestreada se guarda solo si tarda esto o más
+PROFILE_SAMPLE_INTERVAL_MS = config('PROFILE_SAMPLE_INTERVAL_MS', default=5, cast=int)
+PROFILE_MAX_QUERIES = config('PROFILE_MAX_QUERIES', default=500, cast=int)  # sentencias SQL con detalle por perfil
+PROFILE_KEEP = config('PROFILE_KEEP', default=200, cast=int)  # perfiles guardados; los más antiguos se eliminan
+
+# Tiempo de base de datos por huella SQL y endpoint (api.querystats)
+QUERY_STATS_ENABLED = config('QUERY_STATS_ENABLED', default=True, cast=bool)  # solo en procesos que atienden solicitudes (wsgi.py/asgi.py)
+QUERY_STATS_SLOW_MS = config('QUERY_STATS_SLOW_MS', default=100, cast=int)  # desde aquí se guarda la pila de la consulta
+QUERY_STATS_FLUSH_INTERVAL = config('QUERY_STATS_FLUSH_INTERVAL', default=60, cast=int)  # segundos entre volcados a QueryStat
+QUERY_STATS_MAX_ENTRIES = config('QUERY_STATS_MAX_ENTRIES', default=2000, cast=int)  # claves en memoria por proceso
+QUERY_STATS_MAX_ROWS = config('QUERY_STATS_MAX_ROWS', default=5000, cast=int)  # filas que conserva la tabla
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-        'simple': {
-            'format': '{levelname} {message}',
-            'style': '{',
+        'json': {
+            '()': 'api.logs.JSONFormatter',
         },
     },
     'filters': {
@@ -233,29 +335,29 @@ LOGGING = {
         'require_debug_true': {
             '()': 'django.utils.log.RequireDebugTrue',
         },
+        'sampling': {
+            '()': 'api.logs.SamplingFilter',
+        },
+        'request_context': {
+            '()': 'api.logs.RequestContextFilter',
+        },
     },
     'handlers': {
-        'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple'
-        },
-        'file': {
-            'level': 'ERROR',
-            'class': 'logging.FileHandler',
+        'async': {
+            'class': 'api.logs.AsyncHandler',
+            'formatter': 'json',
+            'filters': ['sampling', 'request_context'],
             'filename': os.path.join(BASE_DIR, 'logs', 'django.log'),
-            'formatter': 'verbose',
+            'file_level': 'ERROR',
         },
     },
     'root': {
-        'handlers': ['console'],
-        'level': 'DEBUG',
+        'handlers': ['async'],
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
-            'propagate': False,
         },
     },
 }
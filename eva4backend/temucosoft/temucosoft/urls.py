@@ -4,6 +4,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.views.generic import TemplateView
 from api.views import (
     UserProfileView,
+    DashboardSummaryView,
     ProductViewSet,
     InventoryViewSet,
     SupplierViewSet,
@@ -17,11 +18,23 @@ from api.views import (
     SubscriptionViewSet,
     StockReportView,
     SalesReportView,
+    SalesAnalyticsView,
+    ChangeFeedView,
+    StreamTicketView,
+    ArchivedSalesReportView,
+    ArchivedRecordView,
+    CatalogSnapshotView,
     SubscriptionMyCompanyView,
     CartAddView,
     CartView,
     CartCheckoutView,
     PurchaseViewSet,
+    PurchaseReceiptViewSet,
+    JobViewSet,
+    AuditEventViewSet,
+    LogStatsView,
+    QueryStatsView,
+    RequestProfileViewSet,
 )
 # Crear el router para las vistas de la API
 from rest_framework.routers import DefaultRouter
@@ -32,6 +45,10 @@ router.register(r'sales', SaleViewSet)
 router.register(r'orders', OrderViewSet) 
 router.register(r'subscriptions', SubscriptionViewSet)  
 router.register(r'purchases', PurchaseViewSet)  
+router.register(r'purchase-receipts', PurchaseReceiptViewSet)
+router.register(r'jobs', JobViewSet)
+router.register(r'profiles', RequestProfileViewSet)
+router.register(r'audit', AuditEventViewSet)
 router.register(r'products', ProductViewSet)
 router.register(r'inventory', InventoryViewSet)
 router.register(r'suppliers', SupplierViewSet)
@@ -57,6 +74,9 @@ urlpatterns = [
     path('api/admin/billing/', BillingPlansView.as_view(), name='admin-billing'),
     path('api/reports/stock/', StockReportView.as_view(), name='report-stock'),
     path('api/reports/sales/', SalesReportView.as_view(), name='report-sales'),
+    path('api/reports/analytics/', SalesAnalyticsView.as_view(), name='report-analytics'),
+    path('api/reports/archived/', ArchivedSalesReportView.as_view(), name='report-archived'),
+    path('api/archive/<str:kind>/<int:pk>/', ArchivedRecordView.as_view(), name='archive-record'),
     path('api/subscriptions/me/', SubscriptionMyCompanyView.as_view(), name='subscription-me'),
     path('', TemplateView.as_view(template_name='inicio.html'), name='index'),  
     path('login/', TemplateView.as_view(template_name='acceso.html'), name='login'),  
@@ -65,6 +85,12 @@ urlpatterns = [
     path('checkout/', TemplateView.as_view(template_name='caja.html'), name='checkout'), 
     path('product_detail/', TemplateView.as_view(template_name='detalle_producto.html'), name='product_detail'),
     path('api/profile/', UserProfileView.as_view(), name='user-profile'),
+    path('api/dashboard/summary/', DashboardSummaryView.as_view(), name='dashboard-summary'),
+    path('api/changes/', ChangeFeedView.as_view(), name='change-feed'),
+    path('api/stream/ticket/', StreamTicketView.as_view(), name='stream-ticket'),
+    path('api/catalog/snapshot/', CatalogSnapshotView.as_view(), name='catalog-snapshot'),
+    path('api/logs/stats/', LogStatsView.as_view(), name='log-stats'),
+    path('api/query-stats/', QueryStatsView.as_view(), name='query-stats'),
     path('api/admin/companies/', CompanyManagementView.as_view(), name='admin-companies'),
 
 ]
@@ -13,4 +13,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'temucosoft.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# Las estadísticas de consultas se activan en el proceso que atiende solicitudes, no en el maestro; ver api.querystats
+from api.querystats import serving  # noqa: E402
+
+application = serving(django_application)